@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 智能体激活包
+
+按照智能体文件中的 IDE-FILE-RESOLUTION 规则（{root}/{type}/{name}.md）解析全部依赖，
+把角色定义和依赖内容打包为一次响应。每个智能体的包在首次请求时构建并缓存：
+依赖文件的 (修改时间, 大小) 未变化时直接复用，变化后重新读取；
+依赖写成 ALL 时（bmad-master）包含 {root}/{type} 下的全部文件；
+包的版本是全部内容的哈希，可作为 if_version 使用。
+"""
+
+import base64
+import gzip
+import json
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from catalog_integrity import DEPENDENCY_WILDCARD, as_list
+from utils import content_version, file_signature
+
+# 没有扩展名的依赖依次尝试的后缀
+RESOLVE_SUFFIXES = (".md", ".yaml", ".yml")
+
+
+def resolve_dependency(root: Path, dependency_type: str, name: str) -> Optional[Path]:
+    """按 {root}/{type}/{name} 解析依赖文件，找不到时返回 None"""
+    if Path(name).name != name or Path(dependency_type).name != dependency_type:
+        # 依赖名不允许包含路径分隔符
+        return None
+    directory = root / dependency_type
+    candidate = directory / name
+    if candidate.suffix and candidate.is_file():
+        return candidate
+    for suffix in RESOLVE_SUFFIXES:
+        path = directory / f"{name}{suffix}"
+        if path.is_file():
+            return path
+    return None
+
+
+class AgentBundleCache:
+    """按智能体缓存的激活包"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+        # agent_id -> (指纹, 包, gzip 编码后的包)
+        self._bundles: Dict[str, Tuple[Any, Dict[str, Any], Optional[bytes]]] = {}
+
+    def _resolve(self, dependencies: Dict[str, List[str]]) -> Tuple[List[Tuple[str, str, Path]], List[str]]:
+        resolved, missing = [], []
+        for dependency_type, names in (dependencies or {}).items():
+            for name in as_list(names):
+                if str(name).strip() == DEPENDENCY_WILDCARD:
+                    directory = self.root / dependency_type
+                    if Path(dependency_type).name == dependency_type and directory.is_dir():
+                        resolved.extend((dependency_type, path.name, path)
+                                        for path in sorted(directory.iterdir()) if path.is_file())
+                    continue
+                path = resolve_dependency(self.root, dependency_type, str(name))
+                if path is None:
+                    missing.append(f"{dependency_type}/{name}")
+                else:
+                    resolved.append((dependency_type, str(name), path))
+        return resolved, missing
+
+    def get(self, agent_id: str, agent: Any, agent_version: str) -> Dict[str, Any]:
+        """
+        获取智能体的激活包
+
+        Args:
+            agent_id: 智能体ID
+            agent: AgentInfo（需要 dependencies 和 asdict 可序列化的字段）
+            agent_version: 智能体条目的内容版本
+
+        Returns:
+            包含角色、依赖内容、缺失依赖和 bundle_version 的字典
+        """
+        resolved, missing = self._resolve(agent.dependencies)
+        signatures = []
+        for _, _, path in resolved:
+            try:
+                signatures.append((str(path), file_signature(path)))
+            except OSError:
+                signatures.append((str(path), None))
+        fingerprint = (agent_version, tuple(signatures), tuple(missing))
+
+        cached = self._bundles.get(agent_id)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        with self._lock:
+            cached = self._bundles.get(agent_id)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+            bundle = self._build(agent_id, agent, resolved, missing)
+            self._bundles[agent_id] = (fingerprint, bundle, None)
+            return bundle
+
+    def _build(self, agent_id: str, agent: Any, resolved: List[Tuple[str, str, Path]],
+               missing: List[str]) -> Dict[str, Any]:
+        dependencies: Dict[str, Dict[str, str]] = {}
+        for dependency_type, name, path in resolved:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    dependencies.setdefault(dependency_type, {})[name] = f.read()
+            except (OSError, UnicodeDecodeError):
+                missing.append(f"{dependency_type}/{name}")
+
+        persona = asdict(agent)
+        size = sum(len(content.encode("utf-8")) for contents in dependencies.values() for content in contents.values())
+        return {
+            "agent_id": agent_id,
+            "persona": persona,
+            "dependencies": dependencies,
+            "missing": missing,
+            "resolved_count": sum(len(contents) for contents in dependencies.values()),
+            "content_bytes": size,
+            "bundle_version": content_version({"persona": persona, "dependencies": dependencies, "missing": missing})
+        }
+
+    def compressed(self, agent_id: str) -> Optional[bytes]:
+        """返回缓存包的 gzip 编码（首次调用时生成）"""
+        cached = self._bundles.get(agent_id)
+        if cached is None:
+            return None
+        fingerprint, bundle, encoded = cached
+        if encoded is None:
+            raw = json.dumps(bundle, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            encoded = gzip.compress(raw, compresslevel=6, mtime=0)
+            with self._lock:
+                if self._bundles.get(agent_id, (None,))[0] == fingerprint:
+                    self._bundles[agent_id] = (fingerprint, bundle, encoded)
+        return encoded
+
+    def clear(self):
+        with self._lock:
+            self._bundles.clear()
+
+
+def encode_bundle(data: bytes) -> str:
+    """gzip 数据转为可放入 JSON 的 base64 文本"""
+    return base64.b64encode(data).decode("ascii")
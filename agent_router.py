@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 智能体推荐
+
+把每个智能体的 whenToUse / role / focus 等字段编码为哈希 n-gram TF-IDF 向量，
+预先堆叠成一个 NumPy 矩阵；任务描述编码后只需一次矩阵-向量乘积即可得到所有智能体的余弦相似度。
+未安装 NumPy 时退化为纯 Python 的稀疏向量点积，结果相同。
+"""
+
+import importlib.util
+import math
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, List, Any, Optional, Tuple
+
+from search_index import tokenize
+
+# NumPy 只在首次构建矩阵时导入，避免拖慢服务启动
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+# 哈希特征空间维度
+FEATURE_DIM = 1 << 14
+
+# 各字段在智能体向量中的权重
+FIELD_WEIGHTS = {
+    "when_to_use": 2.0,
+    "focus": 1.5,
+    "role": 1.5,
+    "title": 1.0,
+    "description": 1.0,
+    "identity": 0.5,
+}
+
+
+def hashed_features(text: str, weight: float = 1.0, dim: int = FEATURE_DIM) -> Counter:
+    """
+    提取哈希 n-gram 特征
+
+    特征包括分词结果（英文单词、中文二元组）、相邻词组成的二元组，以及英文单词的
+    字符三元组（让 "PRD" 能匹配 "PRDs"、"story" 能匹配 "stories"），
+    用 crc32 映射到固定维度，跨进程稳定。
+    """
+    tokens = tokenize(text)
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        if token.isascii() and len(token) > 3:
+            padded = f"<{token}>"
+            grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    features = Counter()
+    for gram in grams:
+        features[zlib.crc32(gram.encode("utf-8")) % dim] += weight
+    return features
+
+
+def _tfidf(features: Counter, idf: Dict[int, float]) -> Dict[int, float]:
+    """亚线性词频 × IDF，并做 L2 归一化"""
+    vector = {
+        index: (1.0 + math.log(count)) * idf.get(index, 0.0)
+        for index, count in features.items()
+        if count > 0 and index in idf
+    }
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    if norm == 0:
+        return {}
+    return {index: value / norm for index, value in vector.items()}
+
+
+class AgentRouter:
+    """基于 TF-IDF 余弦相似度的智能体推荐器"""
+
+    def __init__(self, dim: int = FEATURE_DIM, use_numpy: bool = NUMPY_AVAILABLE):
+        self.dim = dim
+        self.use_numpy = use_numpy
+        self.version: Optional[str] = None
+        self.agent_ids: List[str] = []
+        self.idf: Dict[int, float] = {}
+        self._rows: List[Dict[int, float]] = []
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def ensure(self, version: str, agents: Dict[str, Any]):
+        """目录版本变化时重建向量矩阵"""
+        if self.version == version:
+            return
+        with self._lock:
+            if self.version != version:
+                self.build(agents)
+                self.version = version
+
+    def build(self, agents: Dict[str, Any]):
+        """根据智能体字段构建 TF-IDF 矩阵"""
+        agent_ids = sorted(agents)
+        documents = []
+        for agent_id in agent_ids:
+            agent = agents[agent_id]
+            features = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                features.update(hashed_features(getattr(agent, field, "") or "", weight, self.dim))
+            documents.append(features)
+
+        document_frequency = Counter()
+        for features in documents:
+            document_frequency.update(features.keys())
+        count = len(documents)
+        idf = {
+            index: math.log((1 + count) / (1 + frequency)) + 1.0
+            for index, frequency in document_frequency.items()
+        }
+        rows = [_tfidf(features, idf) for features in documents]
+
+        matrix = None
+        if self.use_numpy and rows:
+            import numpy as np
+
+            matrix = np.zeros((len(rows), self.dim), dtype=np.float32)
+            for row_index, row in enumerate(rows):
+                if row:
+                    matrix[row_index, list(row.keys())] = list(row.values())
+
+        self.agent_ids = agent_ids
+        self.idf = idf
+        self._rows = rows
+        self._matrix = matrix
+
+    def scores(self, task: str) -> List[Tuple[str, float]]:
+        """计算任务与每个智能体的余弦相似度"""
+        query = _tfidf(hashed_features(task, dim=self.dim), self.idf)
+        if not query or not self.agent_ids:
+            return [(agent_id, 0.0) for agent_id in self.agent_ids]
+
+        if self._matrix is not None:
+            import numpy as np
+
+            vector = np.zeros(self.dim, dtype=np.float32)
+            vector[list(query.keys())] = list(query.values())
+            similarities = (self._matrix @ vector).tolist()
+        else:
+            similarities = [
+                sum(value * row.get(index, 0.0) for index, value in query.items())
+                for row in self._rows
+            ]
+
+        return list(zip(self.agent_ids, similarities))
+
+    def recommend(self, task: str, top_k: int = 3) -> List[Tuple[str, float]]:
+        """返回得分最高的智能体（只包含得分大于 0 的）"""
+        ranked = sorted(self.scores(task), key=lambda item: item[1], reverse=True)
+        return [(agent_id, score) for agent_id, score in ranked[:top_k] if score > 0]
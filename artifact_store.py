@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 产物存储
+
+按内容寻址的产物存储：
+- 产物内容按行做内容定义分块（某行的 crc32 命中掩码时结束当前块），
+  修改一处只影响所在的块，同一文档的多个版本只需存储变化的块
+- 块以 SHA-256 命名，跨版本、跨运行去重；写入时按 zlib / lzma 压缩，压缩无收益时原样存储
+- 每次工作流程运行有独立的索引，记录每个产物名称的各个版本
+
+目录结构：chunks/<前两位>/<块哈希>、objects/<内容哈希>.json、runs/<运行ID>.json
+"""
+
+import hashlib
+import json
+import lzma
+import os
+import re
+import tempfile
+import threading
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from utils import file_lock
+
+# 块大小范围（字节）；平均每 32 行切分一次
+MIN_CHUNK_SIZE = 1024
+MAX_CHUNK_SIZE = 64 * 1024
+BOUNDARY_MASK = 0x1F
+
+# 块文件首字节标识压缩方式
+_CODEC_TAGS = {"none": b"n", "zlib": b"z", "lzma": b"x"}
+CODECS = tuple(_CODEC_TAGS)
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def chunk_content(data: bytes) -> List[bytes]:
+    """按行做内容定义分块"""
+    chunks: List[bytes] = []
+    current: List[bytes] = []
+    size = 0
+    for line in data.splitlines(keepends=True):
+        # 超长行（或二进制数据）按最大块大小切开
+        while len(line) > MAX_CHUNK_SIZE:
+            if current:
+                chunks.append(b"".join(current))
+                current, size = [], 0
+            chunks.append(line[:MAX_CHUNK_SIZE])
+            line = line[MAX_CHUNK_SIZE:]
+        if size + len(line) > MAX_CHUNK_SIZE and current:
+            chunks.append(b"".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+        if size >= MIN_CHUNK_SIZE and zlib.crc32(line) & BOUNDARY_MASK == 0:
+            chunks.append(b"".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(b"".join(current))
+    return chunks
+
+
+def _compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        packed = zlib.compress(raw, 6)
+    elif codec == "lzma":
+        packed = lzma.compress(raw, preset=6)
+    else:
+        packed = raw
+    if len(packed) >= len(raw):
+        codec, packed = "none", raw
+    return _CODEC_TAGS[codec] + packed
+
+
+def _decompress(stored: bytes) -> bytes:
+    tag, packed = stored[:1], stored[1:]
+    if tag == b"z":
+        return zlib.decompress(packed)
+    if tag == b"x":
+        return lzma.decompress(packed)
+    if tag == b"n":
+        return packed
+    raise ValueError(f"未知的块压缩标识: {tag!r}")
+
+
+def _atomic_write(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+class ArtifactStore:
+    """按内容寻址、块级去重的产物存储"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.root / "chunks" / digest[:2] / digest
+
+    def _object_path(self, digest: str) -> Path:
+        return self.root / "objects" / f"{digest}.json"
+
+    def _run_path(self, run_id: str) -> Path:
+        return self.root / "runs" / f"{_UNSAFE_NAME.sub('_', run_id)}.json"
+
+    def _load_run(self, run_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._run_path(run_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"run_id": run_id, "artifacts": {}}
+
+    def put(self, run_id: str, name: str, data: bytes, codec: str = "zlib",
+            step_index: Optional[int] = None) -> Dict[str, Any]:
+        """
+        保存产物的新版本
+
+        Args:
+            run_id: 工作流程运行ID
+            name: 产物名称（例如 prd.md）
+            data: 产物内容
+            codec: 块压缩方式（zlib / lzma / none）
+            step_index: 产出该版本的步骤序号
+
+        Returns:
+            内容哈希、版本号、块数以及本次实际新写入的块数和字节数
+        """
+        if codec not in _CODEC_TAGS:
+            raise ValueError(f"不支持的压缩方式 '{codec}'，可选: {', '.join(CODECS)}")
+
+        digest = hashlib.sha256(data).hexdigest()
+        chunks = chunk_content(data)
+        chunk_digests = []
+        new_chunks = 0
+        stored_bytes = 0
+
+        with self._lock, file_lock(self.root / ".lock"):
+            for chunk in chunks:
+                chunk_digest = hashlib.sha256(chunk).hexdigest()
+                chunk_digests.append(chunk_digest)
+                path = self._chunk_path(chunk_digest)
+                if path.exists():
+                    continue
+                stored = _compress(chunk, codec)
+                _atomic_write(path, stored)
+                new_chunks += 1
+                stored_bytes += len(stored)
+
+            object_path = self._object_path(digest)
+            if not object_path.exists():
+                manifest = {"size": len(data), "chunks": chunk_digests}
+                _atomic_write(object_path, json.dumps(manifest).encode("utf-8"))
+
+            run = self._load_run(run_id)
+            versions = run["artifacts"].setdefault(name, [])
+            unchanged = bool(versions) and versions[-1]["digest"] == digest
+            if not unchanged:
+                versions.append({
+                    "version": len(versions) + 1,
+                    "digest": digest,
+                    "size": len(data),
+                    "step_index": step_index,
+                    "created_at": datetime.now().isoformat()
+                })
+                _atomic_write(self._run_path(run_id), json.dumps(run, ensure_ascii=False).encode("utf-8"))
+
+        return {
+            "run_id": run_id,
+            "name": name,
+            "digest": digest,
+            "version": versions[-1]["version"],
+            "unchanged": unchanged,
+            "size": len(data),
+            "chunks": len(chunk_digests),
+            "new_chunks": new_chunks,
+            "stored_bytes": stored_bytes
+        }
+
+    def read(self, digest: str) -> bytes:
+        """按内容哈希读取产物，读取后校验哈希"""
+        with open(self._object_path(digest), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        parts = []
+        for chunk_digest in manifest["chunks"]:
+            with open(self._chunk_path(chunk_digest), "rb") as f:
+                parts.append(_decompress(f.read()))
+        data = b"".join(parts)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"产物 {digest} 内容校验失败")
+        return data
+
+    def resolve(self, run_id: str, name: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """查找运行中某个产物的指定版本（默认最新版本）"""
+        versions = self._load_run(run_id)["artifacts"].get(name) or []
+        if not versions:
+            return None
+        if version is None:
+            return versions[-1]
+        for entry in versions:
+            if entry["version"] == version:
+                return entry
+        return None
+
+    def list(self, run_id: str) -> Dict[str, List[Dict[str, Any]]]:
+        """列出运行中所有产物及其版本"""
+        return self._load_run(run_id)["artifacts"]
+
+    def has(self, digest: str) -> bool:
+        return self._object_path(digest).exists()
+
+    def disk_usage(self) -> Tuple[int, int]:
+        """块数量和块文件占用的字节数"""
+        count = size = 0
+        for path in (self.root / "chunks").glob("*/*"):
+            if path.name.startswith("."):
+                continue
+            count += 1
+            size += path.stat().st_size
+        return count, size
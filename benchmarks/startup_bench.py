@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 冷启动基准
+
+以 `python -X importtime` 在独立进程中导入服务模块，输出按累计耗时排序的导入明细，
+并检查启动预算：
+- 总导入耗时不超过 BMAD_STARTUP_BUDGET_MS（默认 2500 毫秒）
+- 项目自身模块（不含第三方依赖）的累计耗时不超过 BMAD_OWN_IMPORT_BUDGET_MS（默认 400 毫秒）
+- 内置 LLM 模式下不得导入 openai 等重量级 SDK
+
+用法:
+    python benchmarks/startup_bench.py [--module bmad_agent_mcp] [--runs 3] [--top 20]
+
+不满足预算时以非零状态码退出，可直接用于 CI。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Any, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 项目自身的顶层模块
+OWN_MODULES = {path.stem for path in PROJECT_ROOT.glob("*.py")}
+
+# 内置模式下禁止在导入阶段加载的模块
+FORBIDDEN_MODULES = ("openai", "httpx._client", "numpy")
+
+STARTUP_BUDGET_MS = float(os.getenv("BMAD_STARTUP_BUDGET_MS", "2500"))
+OWN_IMPORT_BUDGET_MS = float(os.getenv("BMAD_OWN_IMPORT_BUDGET_MS", "400"))
+
+
+def run_importtime(module: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """在子进程中导入模块并解析 -X importtime 输出"""
+    env = dict(os.environ, USE_BUILTIN_LLM="true", PYTHONIOENCODING="utf-8")
+    code = (
+        f"import sys, json; import {module}; "
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, encoding="utf-8"
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{completed.stderr}")
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000
+        })
+
+    loaded = json.loads(completed.stdout.strip().splitlines()[-1])
+    return entries, loaded
+
+
+def summarize(entries: List[Dict[str, Any]], module: str) -> Dict[str, Any]:
+    """计算总耗时和项目模块耗时"""
+    top_level = [entry for entry in entries if entry["module"] == module]
+    total_ms = top_level[-1]["cumulative_ms"] if top_level else sum(e["self_ms"] for e in entries)
+    own_ms = sum(entry["self_ms"] for entry in entries if entry["module"] in OWN_MODULES)
+    return {"total_ms": total_ms, "own_ms": own_ms}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="冷启动导入耗时基准")
+    parser.add_argument("--module", default="bmad_agent_mcp", help="要导入的模块")
+    parser.add_argument("--runs", type=int, default=3, help="重复次数（取中位数）")
+    parser.add_argument("--top", type=int, default=20, help="输出的导入明细条数")
+    args = parser.parse_args()
+
+    totals, owns = [], []
+    entries, loaded = [], []
+    for _ in range(max(1, args.runs)):
+        entries, loaded = run_importtime(args.module)
+        summary = summarize(entries, args.module)
+        totals.append(summary["total_ms"])
+        owns.append(summary["own_ms"])
+
+    total_ms = statistics.median(totals)
+    own_ms = statistics.median(owns)
+
+    print(f"🚀 冷启动基准: import {args.module} ({args.runs} 次，取中位数)")
+    print("-" * 72)
+    print(f"{'模块':<48}{'自身(ms)':>10}{'累计(ms)':>12}")
+    for entry in sorted(entries, key=lambda e: e["cumulative_ms"], reverse=True)[:args.top]:
+        print(f"{'  ' * entry['depth'] + entry['module']:<48}{entry['self_ms']:>10.1f}{entry['cumulative_ms']:>12.1f}")
+    print("-" * 72)
+    print("📦 项目模块自身耗时:")
+    for entry in sorted((e for e in entries if e["module"] in OWN_MODULES), key=lambda e: e["self_ms"], reverse=True):
+        print(f"   {entry['module']:<30}{entry['self_ms']:>8.1f} ms")
+    print("-" * 72)
+
+    failures = []
+    if total_ms > STARTUP_BUDGET_MS:
+        failures.append(f"总导入耗时 {total_ms:.1f} ms 超过预算 {STARTUP_BUDGET_MS:.0f} ms")
+    if own_ms > OWN_IMPORT_BUDGET_MS:
+        failures.append(f"项目模块耗时 {own_ms:.1f} ms 超过预算 {OWN_IMPORT_BUDGET_MS:.0f} ms")
+    for forbidden in FORBIDDEN_MODULES:
+        if forbidden in loaded:
+            failures.append(f"内置模式启动时不应导入 {forbidden}")
+
+    print(f"⏱️  总导入耗时: {total_ms:.1f} ms (预算 {STARTUP_BUDGET_MS:.0f} ms)")
+    print(f"⏱️  项目模块耗时: {own_ms:.1f} ms (预算 {OWN_IMPORT_BUDGET_MS:.0f} ms)")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+
+    print("✅ 启动预算检查通过")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
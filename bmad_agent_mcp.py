@@ -11,37 +11,128 @@ BMAD Agent FastMCP Service
 """
 
 import asyncio
+import base64
+import functools
+import inspect
+import itertools
 import json
+import logging
 import os
+import threading
+import time
 import yaml
+from collections import deque
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
-from dataclasses import dataclass, asdict
-from datetime import datetime
-import re
+from typing import Dict, List, Optional, Any, Tuple, Union
+from dataclasses import dataclass, asdict, field, replace
+from datetime import datetime, timedelta
 
 from fastmcp import FastMCP
-from utils import BMADUtils, format_scan_report
-from llm_client import initialize_llm_client, get_llm_client
+from utils import (
+    BMADUtils, CatalogScanner, format_scan_report, load_yaml, parse_agent_markdown, parse_task_markdown,
+    file_signature, text_hash, content_version, project_fields, invalid_fields, paginate, DATA_DIR
+)
+from llm_client import get_llm_client, is_builtin_mode
+from metrics import metrics, instrument
+from tracing import tracer, current_span
+from profiling import profiler
+from memory_stats import memory_tracker, structure_sizes
+from state_delta import StateJournal
+from state_retention import StateRetention, compact_context
+from workflow_eta import DurationHistory, plan_remaining
+from run_analytics import RunAnalytics, rows_from_state, DEFAULT_PERCENTILES
+from state_codec import FORMATS as STATE_FORMATS, STREAM_KEYS, SUFFIXES as STATE_SUFFIXES, format_for_path, read_state, split_state, write_state
+from search_index import SearchIndex
+from agent_router import AgentRouter
+from catalog_integrity import DEPENDENCY_WILDCARD, as_list, check_catalog, filter_issues, normalize_name, resource_name
+from agent_bundle import AgentBundleCache, encode_bundle
+from doc_sharder import shard_location, shard_markdown
+from doc_sections import SectionIndex
+from context_assembler import ContextAssembler
+from artifact_store import ArtifactStore, CODECS as ARTIFACT_CODECS
+from http_server import InflightTracker, ServerDraining, parse_transport_args, serve_http, serve_workers
+from shared_state import SharedStateStore
+from catalog_snapshot import Catalog, CatalogSnapshot
+from singleflight import SingleFlight, request_key
+
+logger = logging.getLogger(__name__)
 
 # 初始化 FastMCP 应用
 mcp = FastMCP("BMAD Agent Service")
 
+# 已注册的 MCP 工具名
+TOOL_NAMES: List[str] = []
+
+# 多 worker 模式下由 main() 设置：共享的会话状态和目录快照
+shared_state: Optional[SharedStateStore] = None
+catalog_snapshot: Optional[CatalogSnapshot] = None
+
+def _sync_catalog():
+    """其他 worker 重新加载目录后，从快照更新本进程的目录"""
+    if catalog_snapshot is not None and catalog_snapshot.changed():
+        bmad_core.apply_catalog(catalog_snapshot.load())
+
+def _worker_synced(func, writes_state: bool):
+    """
+    多 worker 模式下调用前同步目录和会话状态
+
+    修改会话状态（当前智能体、工作流程状态）的工具在共享状态的写事务中执行。
+    单进程模式下直接调用原函数。
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if shared_state is not None:
+                _sync_catalog()
+                shared_state.pull(bmad_core)
+            return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if shared_state is None:
+            return func(*args, **kwargs)
+        _sync_catalog()
+        if not writes_state:
+            shared_state.pull(bmad_core)
+            return func(*args, **kwargs)
+        with shared_state.transaction(bmad_core):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+def bmad_tool(writes_state: bool = False):
+    """注册 MCP 工具，并挂载调用指标采集、链路追踪、按需性能分析和多 worker 状态同步"""
+    def decorator(func):
+        TOOL_NAMES.append(func.__name__)
+        return mcp.tool()(instrument(tracer.traced(profiler.profiled(_worker_synced(func, writes_state)))))
+    return decorator
+
 # 全局配置
 # Build absolute path to .bmad-core to ensure it's found regardless of CWD
 SCRIPT_DIR = Path(__file__).resolve().parent
 BMAD_CORE_PATH = SCRIPT_DIR / ".bmad-core"
 CONFIG_FILE = BMAD_CORE_PATH / "core-config.yaml"
 
+# 项目根目录：core-config.yaml 中的文档路径（devLoadAlwaysFiles 等）相对它解析
+PROJECT_ROOT = Path(os.getenv("BMAD_PROJECT_ROOT", os.getcwd()))
+DEV_CONTEXT_TOKEN_BUDGET = int(os.getenv("BMAD_DEV_CONTEXT_TOKENS", "8000"))
+
+# 产物存储目录
+ARTIFACT_DIR = Path(os.getenv("BMAD_ARTIFACT_DIR", str(DATA_DIR / "artifacts")))
+
 # LLM 配置
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")  # DeepSeek API Key（外部 API 模式使用）
 USE_BUILTIN_LLM = os.getenv("USE_BUILTIN_LLM", "true").lower() == "true"  # 默认使用内置 LLM
+TEAM_CALL_TIMEOUT = float(os.getenv("BMAD_TEAM_CALL_TIMEOUT", "60"))  # call_team 中每个成员的超时（秒）
+
+# LLM 客户端在首次使用时由 get_llm_client() 按上述配置初始化
 
-# 初始化 LLM 客户端
-if USE_BUILTIN_LLM:
-    initialize_llm_client()  # 内置 LLM 模式，不需要 API Key
-else:
-    initialize_llm_client(DEEPSEEK_API_KEY)  # 外部 API 模式
+# 进行中的外部 LLM 调用（HTTP 模式关闭时等待它们完成）
+llm_calls = InflightTracker()
+# 相同的并发 LLM 请求只调用一次后端
+llm_flights = SingleFlight()
 
 @dataclass
 class AgentInfo:
@@ -70,35 +161,211 @@ class WorkflowInfo:
 
 @dataclass
 class TaskInfo:
-    """任务信息"""
+    """任务信息（正文在 execute_task 时才读取）"""
     name: str
     description: str
     agent: Optional[str]
     dependencies: List[str]
     outputs: List[str]
+    title: str = ""
+    agents: List[str] = field(default_factory=list)
+    inputs: List[str] = field(default_factory=list)
+    path: str = ""
+
+@dataclass
+class TeamInfo:
+    """智能体团队信息"""
+    id: str
+    name: str
+    description: str
+    use_case: str
+    members: List[Dict[str, Any]]
+    workflow_coverage: List[str]
+    details: Dict[str, Any]
+
+def _catalog_field(name: str) -> property:
+    """BMADCore 上读写当前 Catalog 某个字段的属性；赋值时整体替换 Catalog"""
+    def get(self):
+        return getattr(self.catalog, name)
+
+    def set(self, value):
+        self.catalog = replace(self.catalog, **{name: value})
+
+    return property(get, set)
 
 class BMADCore:
     """BMAD 核心管理器"""
-    
-    def __init__(self):
-        self.agents: Dict[str, AgentInfo] = {}
-        self.workflows: Dict[str, WorkflowInfo] = {}
-        self.tasks: Dict[str, TaskInfo] = {}
-        self.templates: Dict[str, str] = {}
+
+    config: Dict[str, Any] = _catalog_field("config")
+    agents: Dict[str, AgentInfo] = _catalog_field("agents")
+    workflows: Dict[str, WorkflowInfo] = _catalog_field("workflows")
+    tasks: Dict[str, TaskInfo] = _catalog_field("tasks")
+    templates: Dict[str, str] = _catalog_field("templates")
+    teams: Dict[str, TeamInfo] = _catalog_field("teams")
+    entry_versions: Dict[str, str] = _catalog_field("entry_versions")
+    catalog_version: str = _catalog_field("catalog_version")
+    parsed_files: Dict[str, Dict[str, Any]] = _catalog_field("parsed_files")
+    integrity: Dict[str, Any] = _catalog_field("integrity")
+    integrity_version: Optional[str] = _catalog_field("integrity_version")
+    agent_tasks: Dict[str, List[str]] = _catalog_field("agent_tasks")
+
+    def __init__(self, load: bool = True):
+        # 当前目录；加载完成后只整体替换，不修改
+        self.catalog = Catalog()
+        self._catalog_lock = threading.Lock()
         self.current_agent: Optional[str] = None
         self.current_workflow: Optional[str] = None
         self.workflow_state: Dict[str, Any] = {}
+        self.state_journal = StateJournal()
+        self.search_index = SearchIndex()
+        self.index_stats: Dict[str, int] = {}
+        # 任务名 -> (文件签名, 正文)
+        self._task_bodies: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        if load:
+            self.load_catalog()
+
+    def load_catalog(self):
+        """加载全部目录数据并计算内容版本"""
+        self.load_entries()
+        self.index_stats = self.search_index.sync(self.entry_versions, self.search_document)
+
+    def load_entries(self):
+        """解析目录文件、计算内容版本并检查完整性（不更新检索索引）"""
         self.load_core_config()
         self.discover_agents()
         self.discover_workflows()
         self.discover_tasks()
+        self.build_agent_task_index()
         self.discover_templates()
+        self.discover_teams()
+        self.compute_versions()
+        self.check_integrity()
+
+    def reload(self) -> Dict[str, Any]:
+        """
+        重新加载目录
+
+        新目录加载到独立的 BMADCore 中，全部成功后才替换 catalog 引用：
+        正在读取旧目录的调用不受影响，加载失败时旧目录保持不变。
+
+        Returns:
+            新旧版本和发生变化的条目
+        """
+        old_version = self.catalog_version
+        old_entries = self.entry_versions
+
+        staged = BMADCore(load=False)
+        staged.parsed_files = dict(self.parsed_files)
+        staged.integrity, staged.integrity_version = self.integrity, self.integrity_version
+        staged.load_entries()
+        # 内容未变的文件已复用解析结果，这里只需清理已删除的文件
+        for key in [key for key in staged.parsed_files if not Path(key).exists()]:
+            del staged.parsed_files[key]
+        self.apply_catalog(staged.catalog)
+
+        changed = sorted(
+            key for key in set(old_entries) | set(self.entry_versions)
+            if old_entries.get(key) != self.entry_versions.get(key)
+        )
+        return {
+            "previous_version": old_version,
+            "catalog_version": self.catalog_version,
+            "changed_entries": changed,
+            "search_index": self.index_stats,
+            "integrity": self.integrity.get("summary", {})
+        }
+
+    def apply_catalog(self, catalog: Catalog):
+        """替换当前目录（重新加载的结果或其他进程发布的快照）"""
+        with self._catalog_lock:
+            self.catalog = catalog
+        self.index_stats = self.search_index.sync(self.entry_versions, self.search_document)
+
+    def catalog_resources(self, catalog: Optional[Catalog] = None) -> Dict[str, List[str]]:
+        """智能体 dependencies 可引用的资源名称（按类型）"""
+        catalog = catalog or self.catalog
+        resources = {
+            "tasks": list(catalog.tasks),
+            "templates": list(catalog.templates),
+            "workflows": list(catalog.workflows)
+        }
+        dependency_types = {
+            dependency_type
+            for agent in catalog.agents.values()
+            for dependency_type in (agent.dependencies or {})
+        }
+        for dependency_type in dependency_types - set(resources):
+            directory = BMAD_CORE_PATH / dependency_type
+            resources[dependency_type] = [f.name for f in directory.iterdir() if f.is_file()] if directory.is_dir() else []
+        return resources
+
+    def check_integrity(self, force: bool = False) -> Dict[str, Any]:
+        """交叉引用完整性检查，目录版本未变化时复用上次结果"""
+        catalog = self.catalog
+        if force or catalog.integrity_version != catalog.catalog_version:
+            integrity = check_catalog(catalog.agents, catalog.workflows, self.catalog_resources(catalog), catalog.teams)
+            with self._catalog_lock:
+                # 检查期间目录已被替换时不覆盖新目录
+                if self.catalog is catalog:
+                    self.catalog = replace(catalog, integrity=integrity, integrity_version=catalog.catalog_version)
+            by_severity = integrity["summary"]["by_severity"]
+            if by_severity["error"]:
+                logger.warning(f"目录完整性检查发现 {by_severity['error']} 个错误、{by_severity['warning']} 个警告")
+            else:
+                logger.info(f"目录完整性检查通过（{by_severity['warning']} 个警告）")
+            return integrity
+        return catalog.integrity
+
+    def compute_versions(self):
+        """计算每个条目和整个目录的内容版本哈希"""
+        versions = {}
+        for agent_id, agent in self.agents.items():
+            versions[f"agent:{agent_id}"] = content_version(asdict(agent))
+        for workflow_id, workflow in self.workflows.items():
+            versions[f"workflow:{workflow_id}"] = content_version(asdict(workflow))
+        for task_name, task in self.tasks.items():
+            versions[f"task:{task_name}"] = content_version(asdict(task))
+        for template_name, content in self.templates.items():
+            versions[f"template:{template_name}"] = content_version(content)
+        for team_id, team in self.teams.items():
+            versions[f"team:{team_id}"] = content_version(asdict(team))
+
+        self.catalog = replace(self.catalog, entry_versions=versions,
+                               catalog_version=content_version(sorted(versions.items())))
+
+    def search_document(self, doc_id: str) -> Tuple[str, Dict[str, Any]]:
+        """返回检索索引中条目的文本和结果元数据"""
+        kind, name = doc_id.split(":", 1)
+        if kind == "agent":
+            agent = self.agents[name]
+            text = " ".join([agent.name, agent.title, agent.description, agent.when_to_use,
+                             agent.role, agent.style, agent.identity, agent.focus])
+            return text, {"title": f"{agent.name} ({agent.title})"}
+        if kind == "workflow":
+            workflow = self.workflows[name]
+            parts = [workflow.name, workflow.description, " ".join(workflow.project_types)]
+            for step in workflow.sequence:
+                if isinstance(step, dict):
+                    parts.extend(str(step[key]) for key in ("agent", "creates", "action", "notes") if step.get(key))
+            return " ".join(parts), {"title": workflow.name}
+        if kind == "task":
+            task = self.tasks[name]
+            text = " ".join([task.name, task.title, task.description] + task.inputs + task.outputs)
+            return text, {"title": task.title or task.name}
+        if kind == "team":
+            team = self.teams[name]
+            parts = [team.name, team.description, team.use_case]
+            for member in team.members:
+                parts.extend(str(member.get(key, "")) for key in ("role", "primary_focus", "when_to_use"))
+                parts.extend(str(item) for item in member.get("responsibilities") or [])
+            return " ".join(parts), {"title": team.name}
+        return self.templates[name], {"title": name}
     
     def load_core_config(self):
         """加载核心配置"""
         if CONFIG_FILE.exists():
             with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                self.config = yaml.safe_load(f)
+                self.config = load_yaml(f)
         else:
             self.config = {}
     
@@ -114,20 +381,40 @@ class BMADCore:
             if agent_info:
                 self.agents[agent_id] = agent_info
     
+    def read_parsed(self, file_path: Path, parser) -> Dict[str, Any]:
+        """
+        读取并解析文件，内容哈希未变化时复用上次的解析结果
+
+        解析异常记录在 error 中而不是抛出，以便 scan_bmad_core 共享同样的结果。
+        """
+        signature = file_signature(file_path)
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        digest = text_hash(content)
+
+        key = str(file_path)
+        record = self.parsed_files.get(key)
+        if record is None or record["hash"] != digest:
+            try:
+                config, error = parser(content), None
+            except Exception as e:
+                config, error = None, str(e)
+            record = {"hash": digest, "config": config, "error": error}
+        record["signature"] = signature
+        self.parsed_files[key] = record
+        return record
+
     def parse_agent_file(self, file_path: Path) -> Optional[AgentInfo]:
         """解析智能体文件"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
             # 提取 YAML 配置
-            yaml_match = re.search(r'```yaml\n(.*?)\n```', content, re.DOTALL)
-            if not yaml_match:
+            record = self.read_parsed(file_path, parse_agent_markdown)
+            if record["error"]:
+                raise ValueError(record["error"])
+            config = record["config"]
+            if config is None:
                 return None
             
-            yaml_content = yaml_match.group(1)
-            config = yaml.safe_load(yaml_content)
-            
             agent_config = config.get('agent', {})
             persona_config = config.get('persona', {})
             dependencies = config.get('dependencies', {})
@@ -163,8 +450,10 @@ class BMADCore:
     def parse_workflow_file(self, file_path: Path) -> Optional[WorkflowInfo]:
         """解析工作流程文件"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
+            record = self.read_parsed(file_path, load_yaml)
+            if record["error"]:
+                raise ValueError(record["error"])
+            config = record["config"]
             
             workflow_config = config.get('workflow', {})
             
@@ -188,14 +477,76 @@ class BMADCore:
         
         for task_file in tasks_dir.glob("*.md"):
             task_name = task_file.stem
-            # 简化的任务信息，实际应该解析 markdown 文件
+            try:
+                record = self.read_parsed(task_file, parse_task_markdown)
+            except OSError as e:
+                logger.warning(f"读取任务文件失败 {task_file}: {e}")
+                continue
+            if record["error"]:
+                logger.warning(f"解析任务文件失败 {task_file}: {record['error']}")
+            meta = record["config"] or {}
+
             self.tasks[task_name] = TaskInfo(
                 name=task_name,
-                description=f"Task: {task_name}",
+                description=meta.get("description") or f"Task: {task_name}",
                 agent=None,
-                dependencies=[],
-                outputs=[]
+                dependencies=list(meta.get("dependencies", [])),
+                outputs=list(meta.get("outputs", [])),
+                title=meta.get("title") or task_name,
+                agents=list(meta.get("agents", [])),
+                inputs=list(meta.get("inputs", [])),
+                path=str(task_file)
             )
+
+    def build_agent_task_index(self):
+        """根据智能体 dependencies.tasks 和任务自身声明的 agent 建立双向索引
+
+        dependencies.tasks 为 ALL 的智能体（bmad-master）可以使用全部任务，
+        但不因此成为任务的负责智能体
+        """
+        index: Dict[str, List[str]] = {agent_id: [] for agent_id in self.agents}
+
+        for agent_id, agent in self.agents.items():
+            for task_name in as_list((agent.dependencies or {}).get("tasks")):
+                if str(task_name).strip() == DEPENDENCY_WILDCARD:
+                    index[agent_id].extend(name for name in self.tasks if name not in index[agent_id])
+                    continue
+                task_name = resource_name(task_name)
+                task = self.tasks.get(task_name)
+                if task is None or task_name in index[agent_id]:
+                    continue
+                index[agent_id].append(task_name)
+                if agent_id not in task.agents:
+                    task.agents.append(agent_id)
+
+        for task_name, task in self.tasks.items():
+            for agent_id in task.agents:
+                if agent_id in index and task_name not in index[agent_id]:
+                    index[agent_id].append(task_name)
+            task.agent = task.agents[0] if task.agents else None
+
+        self.agent_tasks = index
+
+    def load_task_body(self, task_name: str) -> Optional[str]:
+        """读取任务正文（按文件签名缓存）"""
+        task = self.tasks.get(task_name)
+        if task is None or not task.path:
+            return None
+
+        task_file = Path(task.path)
+        try:
+            signature = file_signature(task_file)
+        except OSError:
+            return None
+
+        cached = self._task_bodies.get(task_name)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        with open(task_file, 'r', encoding='utf-8') as f:
+            body = f.read()
+        self._task_bodies[task_name] = (signature, body)
+        return body
     
     def discover_templates(self):
         """发现所有模板"""
@@ -208,19 +559,217 @@ class BMADCore:
             with open(template_file, 'r', encoding='utf-8') as f:
                 self.templates[template_name] = f.read()
 
+    def discover_teams(self):
+        """发现所有智能体团队"""
+        teams_dir = BMAD_CORE_PATH / "agent-teams"
+        if not teams_dir.exists():
+            return
+
+        for team_file in teams_dir.glob("*.yaml"):
+            team_info = self.parse_team_file(team_file)
+            if team_info:
+                self.teams[team_info.id] = team_info
+
+    def parse_team_file(self, file_path: Path) -> Optional[TeamInfo]:
+        """解析团队文件"""
+        try:
+            record = self.read_parsed(file_path, load_yaml)
+            if record["error"]:
+                raise ValueError(record["error"])
+            config = record["config"] or {}
+
+            team_config = config.get('team', {})
+            members = []
+            for member in config.get('agents', []):
+                # 成员既可以是带描述的字典，也可以只写智能体ID
+                members.append(dict(member) if isinstance(member, dict) else {"id": str(member)})
+
+            return TeamInfo(
+                id=team_config.get('id', file_path.stem),
+                name=team_config.get('name', ''),
+                description=team_config.get('description', ''),
+                use_case=team_config.get('use_case', ''),
+                members=members,
+                workflow_coverage=config.get('workflow_coverage', []),
+                details={
+                    key: value for key, value in config.items()
+                    if key not in ('team', 'agents', 'workflow_coverage')
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Error parsing team file {file_path}: {e}")
+            return None
+
 # 全局 BMAD 核心实例
 bmad_core = BMADCore()
 
-# 全局 LLM 客户端实例
-llm_client = get_llm_client()
+# 智能体推荐器（首次使用时按目录版本构建向量矩阵）
+agent_router = AgentRouter()
+
+# 目录扫描器（按文件缓存验证结果）
+catalog_scanner = CatalogScanner()
+
+# 智能体激活包缓存
+agent_bundles = AgentBundleCache(BMAD_CORE_PATH)
+
+# 项目文档章节索引（按文件修改时间失效）
+doc_sections = SectionIndex()
+
+# 按内容寻址的产物存储
+artifact_store = ArtifactStore(ARTIFACT_DIR)
+
+# 工作流程状态列表的保留策略（超出上限的条目写入 .bmad-data/state）
+state_retention = StateRetention(DATA_DIR / "state")
+
+# 跨运行的步骤耗时历史（用于估算剩余时间）
+duration_history = DurationHistory(DATA_DIR / "step_durations.jsonl")
+
+# 历史运行的步骤指标（列存储，供 analyze_runs 查询）
+run_analytics = RunAnalytics(DATA_DIR / "analytics")
+
+def _last_progress_time(state: Dict[str, Any]) -> Optional[datetime]:
+    """最近一次完成步骤的时间（还没有完成的步骤时为开始时间）"""
+    completed = state.get("completed_steps") or []
+    timestamp = (
+        (completed[-1].get("completed_at") if completed else None)
+        or ((state.get("rollup") or {}).get("completed_steps") or {}).get("last_at")
+        or state.get("started_at")
+    )
+    try:
+        return datetime.fromisoformat(timestamp) if timestamp else None
+    except (TypeError, ValueError):
+        return None
+
+def _workflow_eta(workflow: WorkflowInfo, state: Dict[str, Any]) -> Dict[str, Any]:
+    """当前运行的剩余时间估算"""
+    now = datetime.now()
+    last_progress = _last_progress_time(state)
+    elapsed = (now - last_progress).total_seconds() if last_progress else 0.0
+    plan = plan_remaining(workflow.id, workflow.sequence, state.get("current_step", 0),
+                          duration_history, elapsed)
+    plan["eta_at"] = (now + timedelta(seconds=plan["eta_seconds"])).isoformat()
+    return plan
+
+def _run_id_of(state: Dict[str, Any]) -> Optional[str]:
+    """工作流程运行的ID（旧版本导出的状态没有 run_id 时由工作流程ID和开始时间生成）"""
+    if not state:
+        return None
+    return state.get("run_id") or f"{state.get('workflow_id')}-{state.get('started_at', '')}"
+
+def _current_run_id() -> Optional[str]:
+    """当前工作流程运行的ID"""
+    return _run_id_of(bmad_core.workflow_state)
+
+def _discard_run(run_id: Optional[str]):
+    """删除不再可达的运行写入磁盘的早期历史"""
+    if run_id:
+        state_retention.discard(run_id)
+
+def _stored_inputs(step: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """步骤 requires 中已在产物存储里的输入（名称 -> 最新版本引用）"""
+    run_id = _current_run_id()
+    if not step or not run_id:
+        return {}
+    requires = step.get("requires") or []
+    if not isinstance(requires, list):
+        requires = [requires]
+    stored = {normalize_name(name): name for name in artifact_store.list(run_id)}
+    inputs = {}
+    for required in requires:
+        name = stored.get(normalize_name(required))
+        if name:
+            entry = artifact_store.resolve(run_id, name)
+            inputs[str(required)] = {"name": name, "digest": entry["digest"], "version": entry["version"]}
+    return inputs
+
+# devLoadAlwaysFiles 上下文组装器
+dev_context = ContextAssembler(PROJECT_ROOT)
+
+def _assemble_dev_context(files: Optional[List[str]] = None, token_budget: Optional[int] = None) -> Dict[str, Any]:
+    """按配置（或指定的文件列表）组装开发上下文"""
+    if files is None:
+        files = (bmad_core.config or {}).get("devLoadAlwaysFiles") or []
+    budget = DEV_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    with tracer.span("context.assemble", files=len(files), token_budget=budget) as span:
+        result = dev_context.assemble(files, budget)
+        span.set_attribute("context.tokens", result["tokens"])
+        span.set_attribute("context.cached", result["cached"])
+    return result
+
+# list_agents 可返回的字段
+AGENT_LIST_FIELDS = ["id", "name", "title", "icon", "description", "when_to_use", "role", "focus"]
+AGENT_DETAIL_FIELDS = list(AgentInfo.__dataclass_fields__)
+WORKFLOW_LIST_FIELDS = ["id", "name", "description", "type", "project_types"]
+WORKFLOW_DETAIL_FIELDS = list(WorkflowInfo.__dataclass_fields__)
+
+def _not_modified(version_key: str, version: str) -> Dict[str, Any]:
+    """客户端缓存仍然有效时返回的极简响应"""
+    return {
+        "success": True,
+        "not_modified": True,
+        version_key: version
+    }
+
+def _invalid_fields_error(fields: Optional[List[str]], valid_fields: List[str]) -> Optional[Dict[str, Any]]:
+    """校验 fields 参数"""
+    unknown = invalid_fields(fields, valid_fields)
+    if unknown:
+        return {
+            "success": False,
+            "error": f"未知的字段: {', '.join(unknown)}",
+            "valid_fields": valid_fields
+        }
+    return None
+
+def _state_payload(since_revision: Optional[int]) -> Dict[str, Any]:
+    """工作流程状态响应：不带 since_revision 时返回完整状态，否则返回增量"""
+    journal = bmad_core.state_journal
+    if since_revision is None:
+        return {
+            "revision": journal.revision,
+            "state": bmad_core.workflow_state
+        }
+    return {
+        "revision": journal.revision,
+        "delta": journal.delta(bmad_core.workflow_state, since_revision)
+    }
+
+def _recommend_agents(task: str, top_k: int) -> List[Dict[str, Any]]:
+    """按任务描述对智能体排序"""
+    agent_router.ensure(bmad_core.catalog_version, bmad_core.agents)
+    recommendations = []
+    for agent_id, score in agent_router.recommend(task, top_k):
+        agent = bmad_core.agents[agent_id]
+        recommendations.append({
+            "id": agent_id,
+            "name": agent.name,
+            "title": agent.title,
+            "icon": agent.icon,
+            "when_to_use": agent.when_to_use,
+            "score": round(score, 4)
+        })
+    return recommendations
 
 # 创建不使用装饰器的核心函数
-def _list_agents_core() -> Dict[str, Any]:
+def _list_agents_core(
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    if_version: Optional[str] = None
+) -> Dict[str, Any]:
     """核心 list_agents 函数（不使用装饰器）"""
     try:
+        catalog_version = bmad_core.catalog_version
+        if if_version and if_version == catalog_version:
+            return _not_modified("catalog_version", catalog_version)
+
+        error = _invalid_fields_error(fields, AGENT_LIST_FIELDS)
+        if error:
+            return error
+
         agents_list = []
-        for agent_id, agent in bmad_core.agents.items():
-            agents_list.append({
+        for agent_id, agent in sorted(bmad_core.agents.items()):
+            agents_list.append(project_fields({
                 "id": agent.id,
                 "name": agent.name,
                 "title": agent.title,
@@ -229,14 +778,19 @@ def _list_agents_core() -> Dict[str, Any]:
                 "when_to_use": agent.when_to_use,
                 "role": agent.role,
                 "focus": agent.focus
-            })
+            }, fields))
+
+        page = paginate(agents_list, catalog_version, limit, cursor)
 
         return {
             "success": True,
-            "agents": agents_list,
-            "count": len(agents_list),
+            "agents": page["items"],
+            "count": len(page["items"]),
+            "total": page["total"],
+            "next_cursor": page["next_cursor"],
+            "catalog_version": catalog_version,
             "current_agent": bmad_core.current_agent,
-            "message": f"发现 {len(agents_list)} 个智能体"
+            "message": f"发现 {page['total']} 个智能体"
         }
     except Exception as e:
         return {
@@ -247,34 +801,59 @@ def _list_agents_core() -> Dict[str, Any]:
             "current_agent": None
         }
 
-@mcp.tool()
-def list_agents() -> Dict[str, Any]:
+@bmad_tool()
+def list_agents(
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    if_version: Optional[str] = None
+) -> Dict[str, Any]:
     """
     列出所有可用的 BMAD 智能体
 
+    Args:
+        fields: 只返回指定字段（如 ['id', 'title']），默认返回全部字段
+        limit: 每页数量，默认不分页
+        cursor: 上一页返回的 next_cursor
+        if_version: 客户端缓存的 catalog_version，未变化时只返回 not_modified
+
     Returns:
         包含所有智能体信息的字典
     """
-    return _list_agents_core()
-
-@mcp.tool()
-def get_agent_details(agent_id: str) -> Dict[str, Any]:
+    return _list_agents_core(fields, limit, cursor, if_version)
+
+@bmad_tool()
+def get_agent_details(
+    agent_id: str,
+    fields: Optional[List[str]] = None,
+    if_version: Optional[str] = None
+) -> Dict[str, Any]:
     """
     获取特定智能体的详细信息
     
     Args:
         agent_id: 智能体ID
+        fields: 只返回指定字段，默认返回全部字段
+        if_version: 客户端缓存的该智能体 version，未变化时只返回 not_modified
         
     Returns:
         智能体的详细信息
     """
     if agent_id not in bmad_core.agents:
         return {"error": f"Agent '{agent_id}' not found"}
-    
+
+    version = bmad_core.entry_versions.get(f"agent:{agent_id}", "")
+    if if_version and if_version == version:
+        return _not_modified("version", version)
+
+    error = _invalid_fields_error(fields, AGENT_DETAIL_FIELDS)
+    if error:
+        return error
+
     agent = bmad_core.agents[agent_id]
-    return asdict(agent)
+    return {**project_fields(asdict(agent), fields), "version": version}
 
-@mcp.tool()
+@bmad_tool(writes_state=True)
 def activate_agent(agent_id: str) -> Dict[str, Any]:
     """
     激活指定的智能体
@@ -304,52 +883,159 @@ def activate_agent(agent_id: str) -> Dict[str, Any]:
         }
     }
 
-@mcp.tool()
-def list_workflows() -> Dict[str, Any]:
+@bmad_tool()
+def get_agent_bundle(agent_id: str, compress: bool = False, if_version: Optional[str] = None) -> Dict[str, Any]:
+    """
+    获取智能体激活包：角色定义加上全部已解析的依赖内容（任务、模板、清单等）
+
+    依赖按 {root}/{type}/{name}.md 解析，一次调用即可获得完整装备的智能体。
+
+    Args:
+        agent_id: 智能体ID
+        compress: 为 True 时返回 gzip + base64 编码的包
+        if_version: 上次获得的 bundle_version，未变化时返回 not_modified
+
+    Returns:
+        激活包
+    """
+    if agent_id not in bmad_core.agents:
+        return {"error": f"Agent '{agent_id}' not found"}
+
+    bundle = agent_bundles.get(
+        agent_id,
+        bmad_core.agents[agent_id],
+        bmad_core.entry_versions.get(f"agent:{agent_id}", "")
+    )
+
+    if if_version and if_version == bundle["bundle_version"]:
+        return _not_modified("bundle_version", bundle["bundle_version"])
+
+    if compress:
+        encoded = agent_bundles.compressed(agent_id)
+        return {
+            "success": True,
+            "agent_id": agent_id,
+            "bundle_version": bundle["bundle_version"],
+            "encoding": "gzip+base64",
+            "compressed_bytes": len(encoded),
+            "data": encode_bundle(encoded)
+        }
+
+    return {"success": True, **bundle}
+
+@bmad_tool()
+def list_workflows(
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    if_version: Optional[str] = None
+) -> Dict[str, Any]:
     """
     列出所有可用的工作流程
+
+    Args:
+        fields: 只返回指定字段（如 ['name', 'type']），默认返回全部字段
+        limit: 每页数量，默认不分页
+        cursor: 上一页返回的 next_cursor
+        if_version: 客户端缓存的 catalog_version，未变化时只返回 not_modified
     
     Returns:
         包含所有工作流程信息的字典
     """
+    catalog_version = bmad_core.catalog_version
+    if if_version and if_version == catalog_version:
+        return _not_modified("catalog_version", catalog_version)
+
+    error = _invalid_fields_error(fields, WORKFLOW_LIST_FIELDS)
+    if error:
+        return error
+
+    workflow_ids = sorted(bmad_core.workflows)
+    try:
+        page = paginate(workflow_ids, catalog_version, limit, cursor)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
+    workflows = {}
+    for workflow_id in page["items"]:
+        workflow = bmad_core.workflows[workflow_id]
+        # id 是结果字典的键，不在记录中；fields=["id"] 时记录为空
+        entry = project_fields({
+            "name": workflow.name,
+            "description": workflow.description,
+            "type": workflow.type,
+            "project_types": workflow.project_types
+        }, fields)
+        workflows[workflow_id] = entry
+
     return {
-        "workflows": {
-            workflow_id: {
-                "name": workflow.name,
-                "description": workflow.description,
-                "type": workflow.type,
-                "project_types": workflow.project_types
-            }
-            for workflow_id, workflow in bmad_core.workflows.items()
-        },
+        "workflows": workflows,
+        "total": page["total"],
+        "next_cursor": page["next_cursor"],
+        "catalog_version": catalog_version,
         "current_workflow": bmad_core.current_workflow
     }
 
-@mcp.tool()
-def get_workflow_details(workflow_id: str) -> Dict[str, Any]:
+@bmad_tool()
+def get_workflow_details(
+    workflow_id: str,
+    fields: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    if_version: Optional[str] = None
+) -> Dict[str, Any]:
     """
     获取特定工作流程的详细信息
     
     Args:
         workflow_id: 工作流程ID
+        fields: 只返回指定字段（如不需要步骤时省略 'sequence'），默认返回全部字段
+        limit: sequence 每页步骤数，默认返回全部步骤
+        cursor: 上一页返回的 next_cursor
+        if_version: 客户端缓存的该工作流程 version，未变化时只返回 not_modified
         
     Returns:
         工作流程的详细信息
     """
     if workflow_id not in bmad_core.workflows:
         return {"error": f"Workflow '{workflow_id}' not found"}
-    
+
+    version = bmad_core.entry_versions.get(f"workflow:{workflow_id}", "")
+    if if_version and if_version == version:
+        return _not_modified("version", version)
+
+    error = _invalid_fields_error(fields, WORKFLOW_DETAIL_FIELDS)
+    if error:
+        return error
+
     workflow = bmad_core.workflows[workflow_id]
-    return asdict(workflow)
+    details = project_fields(asdict(workflow), fields)
 
-@mcp.tool()
-def start_workflow(workflow_id: str, project_type: Optional[str] = None) -> Dict[str, Any]:
+    if "sequence" in details:
+        try:
+            page = paginate(details["sequence"], version, limit, cursor)
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        details["sequence"] = page["items"]
+        details["sequence_total"] = page["total"]
+        details["next_cursor"] = page["next_cursor"]
+
+    details["version"] = version
+    return details
+
+@bmad_tool(writes_state=True)
+def start_workflow(
+    workflow_id: str,
+    project_type: Optional[str] = None,
+    compact: bool = False
+) -> Dict[str, Any]:
     """
     启动指定的工作流程
 
     Args:
         workflow_id: 工作流程ID
         project_type: 项目类型（可选）
+        compact: 为 True 时不回显状态，只返回 revision（之后用 get_workflow_delta 同步）
 
     Returns:
         工作流程启动结果
@@ -366,22 +1052,27 @@ def start_workflow(workflow_id: str, project_type: Optional[str] = None) -> Dict
             "supported_types": workflow.project_types
         }
 
-    # 初始化工作流程状态
-    bmad_core.current_workflow = workflow_id
-    bmad_core.workflow_state = {
-        "workflow_id": workflow_id,
-        "project_type": project_type,
-        "current_step": 0,
-        "completed_steps": [],
-        "created_artifacts": [],
-        "started_at": datetime.now().isoformat(),
-        "status": "active"
-    }
+    # 初始化工作流程状态（替换的运行不再可达，删除它的溢出文件）
+    with tracer.span("state.update", workflow_id=workflow_id, operation="start"):
+        _discard_run(_current_run_id())
+        bmad_core.current_workflow = workflow_id
+        started_at = datetime.now()
+        bmad_core.workflow_state = {
+            "workflow_id": workflow_id,
+            "run_id": f"{workflow_id}-{started_at:%Y%m%d-%H%M%S}-{os.urandom(3).hex()}",
+            "project_type": project_type,
+            "current_step": 0,
+            "completed_steps": [],
+            "created_artifacts": [],
+            "started_at": started_at.isoformat(),
+            "status": "active"
+        }
+        revision = bmad_core.state_journal.reset()
 
     # 获取第一个步骤
     first_step = workflow.sequence[0] if workflow.sequence else None
 
-    return {
+    result = {
         "success": True,
         "message": f"Started workflow: {workflow.name}",
         "workflow": {
@@ -391,14 +1082,20 @@ def start_workflow(workflow_id: str, project_type: Optional[str] = None) -> Dict
             "total_steps": len(workflow.sequence)
         },
         "next_step": first_step,
-        "state": bmad_core.workflow_state
+        "revision": revision
     }
+    if not compact:
+        result["state"] = bmad_core.workflow_state
+    return result
 
-@mcp.tool()
-def get_workflow_status() -> Dict[str, Any]:
+@bmad_tool()
+def get_workflow_status(since_revision: Optional[int] = None) -> Dict[str, Any]:
     """
     获取当前工作流程的状态
 
+    Args:
+        since_revision: 客户端已同步的 revision，提供时以增量代替完整的步骤和产物列表
+
     Returns:
         当前工作流程状态信息
     """
@@ -416,7 +1113,7 @@ def get_workflow_status() -> Dict[str, Any]:
     if current_step_index < total_steps:
         current_step = workflow.sequence[current_step_index]
 
-    return {
+    result = {
         "workflow": {
             "id": workflow.id,
             "name": workflow.name,
@@ -425,16 +1122,32 @@ def get_workflow_status() -> Dict[str, Any]:
         "progress": {
             "current_step": current_step_index,
             "total_steps": total_steps,
-            "percentage": round(progress, 2),
-            "completed_steps": state.get("completed_steps", []),
-            "created_artifacts": state.get("created_artifacts", [])
+            "percentage": round(progress, 2)
         },
         "current_step": current_step,
         "status": state.get("status", "unknown"),
-        "started_at": state.get("started_at")
+        "started_at": state.get("started_at"),
+        "revision": bmad_core.state_journal.revision
     }
 
-@mcp.tool()
+    if current_step_index < total_steps:
+        plan = _workflow_eta(workflow, state)
+        result["eta"] = {
+            key: plan[key]
+            for key in ("eta_seconds", "eta_p80_seconds", "eta_at", "critical_path_seconds", "bottlenecks")
+        }
+
+    if since_revision is None:
+        result["progress"]["completed_steps"] = state.get("completed_steps", [])
+        result["progress"]["created_artifacts"] = state.get("created_artifacts", [])
+        if state.get("rollup"):
+            result["progress"]["rollup"] = state["rollup"]
+    else:
+        result["delta"] = bmad_core.state_journal.delta(state, since_revision)
+
+    return result
+
+@bmad_tool(writes_state=True)
 def advance_workflow_step(artifacts_created: Optional[List[str]] = None) -> Dict[str, Any]:
     """
     推进工作流程到下一步
@@ -456,31 +1169,56 @@ def advance_workflow_step(artifacts_created: Optional[List[str]] = None) -> Dict
     if current_step_index >= len(workflow.sequence):
         return {"error": "Workflow already completed"}
 
-    # 记录完成的步骤
-    completed_step = workflow.sequence[current_step_index]
-    state["completed_steps"].append({
-        "step_index": current_step_index,
-        "step": completed_step,
-        "completed_at": datetime.now().isoformat(),
-        "artifacts": artifacts_created or []
-    })
-
-    # 添加创建的产物
-    if artifacts_created:
-        state["created_artifacts"].extend(artifacts_created)
-
-    # 推进到下一步
-    state["current_step"] = current_step_index + 1
-
-    # 检查是否完成
-    if state["current_step"] >= len(workflow.sequence):
-        state["status"] = "completed"
-        state["completed_at"] = datetime.now().isoformat()
-        next_step = None
-        message = f"Workflow '{workflow.name}' completed successfully!"
-    else:
-        next_step = workflow.sequence[state["current_step"]]
-        message = f"Advanced to step {state['current_step'] + 1} of {len(workflow.sequence)}"
+    with tracer.span("state.update", workflow_id=workflow.id, operation="advance",
+                     step_index=current_step_index):
+        # 记录完成的步骤
+        # 只记录步骤序号，步骤定义可通过 workflow.sequence[step_index] 查到
+        completed_step = workflow.sequence[current_step_index]
+        completed_at = datetime.now()
+        last_progress = _last_progress_time(state)
+        if last_progress:
+            agent = completed_step.get("agent") if isinstance(completed_step, dict) else None
+            agent = str(agent) if agent else None
+            seconds = (completed_at - last_progress).total_seconds()
+            duration_history.record(workflow.id, current_step_index, agent, seconds)
+            run_analytics.append([{
+                "run": _current_run_id(),
+                "workflow": workflow.id,
+                "step": current_step_index,
+                "agent": agent,
+                "duration": seconds,
+                "completed_at": completed_at.timestamp(),
+                "artifacts": len(artifacts_created or [])
+            }])
+        ops = state_retention.append_ops(state, "completed_steps", {
+            "step_index": current_step_index,
+            "completed_at": completed_at.isoformat(),
+            "artifacts": artifacts_created or []
+        }, _current_run_id())
+
+        # 添加创建的产物（同名产物只记录一次）
+        known_artifacts = set(state.get("created_artifacts", []))
+        for artifact in dict.fromkeys(artifacts_created or []):
+            if artifact not in known_artifacts:
+                ops.append({"op": "add", "path": "/created_artifacts/-", "value": artifact})
+
+        # 推进到下一步
+        ops.append({"op": "replace", "path": "/current_step", "value": current_step_index + 1})
+
+        # 检查是否完成
+        if current_step_index + 1 >= len(workflow.sequence):
+            ops.append({"op": "replace", "path": "/status", "value": "completed"})
+            ops.append({"op": "add", "path": "/completed_at", "value": datetime.now().isoformat()})
+
+        revision = bmad_core.state_journal.record(state, ops)
+
+        if state["current_step"] >= len(workflow.sequence):
+            next_step = None
+            message = f"Workflow '{workflow.name}' completed successfully!"
+        else:
+            next_step = workflow.sequence[state["current_step"]]
+            message = f"Advanced to step {state['current_step'] + 1} of {len(workflow.sequence)}"
+        stored_inputs = _stored_inputs(next_step)
 
     return {
         "success": True,
@@ -492,10 +1230,12 @@ def advance_workflow_step(artifacts_created: Optional[List[str]] = None) -> Dict
             "total_steps": len(workflow.sequence),
             "percentage": round((state["current_step"] / len(workflow.sequence)) * 100, 2)
         },
-        "status": state["status"]
+        "status": state["status"],
+        "stored_inputs": stored_inputs,
+        "revision": revision
     }
 
-@mcp.tool()
+@bmad_tool()
 def list_tasks(agent_id: Optional[str] = None) -> Dict[str, Any]:
     """
     列出可用的任务
@@ -506,21 +1246,17 @@ def list_tasks(agent_id: Optional[str] = None) -> Dict[str, Any]:
     Returns:
         任务列表
     """
-    tasks = bmad_core.tasks
+    catalog = bmad_core.catalog
+    tasks = catalog.tasks
 
     if agent_id:
-        if agent_id not in bmad_core.agents:
+        if agent_id not in catalog.agents:
             return {"error": f"Agent '{agent_id}' not found"}
 
-        agent = bmad_core.agents[agent_id]
-        agent_tasks = {}
-
-        # 获取智能体相关的任务
-        for task_type, task_list in agent.dependencies.items():
-            if task_type == "tasks":
-                for task_name in task_list:
-                    if task_name in tasks:
-                        agent_tasks[task_name] = asdict(tasks[task_name])
+        agent_tasks = {
+            task_name: asdict(tasks[task_name])
+            for task_name in catalog.agent_tasks.get(agent_id, [])
+        }
 
         return {
             "agent": agent_id,
@@ -531,7 +1267,7 @@ def list_tasks(agent_id: Optional[str] = None) -> Dict[str, Any]:
         "tasks": {name: asdict(task) for name, task in tasks.items()}
     }
 
-@mcp.tool()
+@bmad_tool(writes_state=True)
 def execute_task(task_name: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     执行指定的任务
@@ -557,6 +1293,7 @@ def execute_task(task_name: str, context: Optional[Dict[str, Any]] = None) -> Di
         "success": True,
         "message": f"Executed task '{task_name}' with agent '{bmad_core.current_agent}'",
         "task": asdict(task),
+        "instructions": bmad_core.load_task_body(task_name),
         "agent": bmad_core.current_agent,
         "context": context or {},
         "executed_at": datetime.now().isoformat()
@@ -564,32 +1301,50 @@ def execute_task(task_name: str, context: Optional[Dict[str, Any]] = None) -> Di
 
     # 如果有活动的工作流程，记录任务执行
     if bmad_core.current_workflow:
-        if "task_executions" not in bmad_core.workflow_state:
-            bmad_core.workflow_state["task_executions"] = []
-
-        bmad_core.workflow_state["task_executions"].append({
-            "task_name": task_name,
-            "agent": bmad_core.current_agent,
-            "executed_at": datetime.now().isoformat(),
-            "context": context
-        })
+        with tracer.span("state.update", workflow_id=bmad_core.current_workflow, operation="task_execution"):
+            ops = state_retention.append_ops(bmad_core.workflow_state, "task_executions", {
+                "task_name": task_name,
+                "agent": bmad_core.current_agent,
+                "executed_at": datetime.now().isoformat(),
+                "context": compact_context(context)
+            }, _current_run_id())
+            result["revision"] = bmad_core.state_journal.record(bmad_core.workflow_state, ops)
 
     return result
 
-@mcp.tool()
-def call_agent_with_llm(agent_id: str, task: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+@bmad_tool()
+def call_agent_with_llm(
+    agent_id: str,
+    task: str,
+    context: Optional[Dict[str, Any]] = None,
+    include_dev_context: bool = False
+) -> Dict[str, Any]:
     """
     使用 LLM 调用智能体执行任务
 
     Args:
-        agent_id: 智能体ID
+        agent_id: 智能体ID，传入 "auto" 时根据任务描述自动选择最匹配的智能体
         task: 要执行的任务描述
         context: 任务上下文信息
+        include_dev_context: 是否把 devLoadAlwaysFiles 组装后的内容加入上下文
 
     Returns:
         智能体执行结果
     """
     try:
+        routing = None
+        if agent_id == "auto":
+            recommendations = _recommend_agents(task, 3)
+            if not recommendations:
+                return {
+                    "success": False,
+                    "error": "无法根据任务描述自动选择智能体，请指定 agent_id",
+                    "available_agents": list(bmad_core.agents.keys())
+                }
+            agent_id = recommendations[0]["id"]
+            routing = {"selected": agent_id, "candidates": recommendations}
+            current_span().set_attribute("agent.routed_to", agent_id)
+
         # 检查智能体是否存在
         if agent_id not in bmad_core.agents:
             return {
@@ -600,8 +1355,17 @@ def call_agent_with_llm(agent_id: str, task: str, context: Optional[Dict[str, An
 
         agent = bmad_core.agents[agent_id]
 
+        dev_context_summary = None
+        if include_dev_context:
+            assembled = _assemble_dev_context()
+            context = {**(context or {}), "devLoadAlwaysFiles": assembled["content"]}
+            dev_context_summary = {
+                key: assembled[key] for key in ("tokens", "token_budget", "files", "missing", "truncated", "cached")
+            }
+
         # 构建角色提示
-        role_prompt = f"""你现在是 {agent.name}（{agent.title}）。
+        with tracer.span("prompt.build", agent_id=agent_id) as span:
+            role_prompt = f"""你现在是 {agent.name}（{agent.title}）。
 
 🎭 角色身份：{agent.identity}
 
@@ -614,9 +1378,10 @@ def call_agent_with_llm(agent_id: str, task: str, context: Optional[Dict[str, An
 🔧 使用场景：{agent.when_to_use}
 
 请以这个角色的身份，用专业的态度和方式来处理用户的任务。保持角色的专业性和一致性。"""
+            span.set_attribute("prompt.chars", len(role_prompt))
 
         # 获取当前 LLM 模式
-        current_mode = "builtin_llm" if llm_client.use_builtin_llm else "external_api"
+        current_mode = "builtin_llm" if is_builtin_mode() else "external_api"
 
         if current_mode == "builtin_llm":
             # 内置 LLM 模式：返回角色提示让 Cursor 的 LLM 使用
@@ -631,6 +1396,8 @@ def call_agent_with_llm(agent_id: str, task: str, context: Optional[Dict[str, An
                 "mode": "builtin_llm",
                 "mode_description": "Cursor 内置 LLM",
                 "message": f"已激活 {agent.name}，请以此角色身份处理任务",
+                "routing": routing,
+                "dev_context": dev_context_summary,
                 "executed_at": datetime.now().isoformat()
             }
         else:
@@ -650,16 +1417,26 @@ def call_agent_with_llm(agent_id: str, task: str, context: Optional[Dict[str, An
                     "focus": agent.focus
                 }
 
-                # 调用 LLM
-                result = llm_client_instance.call_agent(agent_id, agent_config, task, context)
+                # 调用 LLM（与进行中的相同请求合并）
+                key = request_key("call_agent", agent_id=agent_id, agent_config=agent_config, task=task, context=context)
+                with llm_calls.track(), tracer.span("llm.call", agent_id=agent_id, mode=current_mode) as span:
+                    result, coalesced = llm_flights.do(
+                        key, lambda: llm_client_instance.call_agent(agent_id, agent_config, task, context)
+                    )
+                    span.set_attribute("llm.coalesced", coalesced)
 
                 # 添加模式信息和时间戳
+                result["coalesced"] = coalesced
                 result["mode"] = "external_api"
                 result["mode_description"] = "DeepSeek API"
+                result["routing"] = routing
+                result["dev_context"] = dev_context_summary
                 result["executed_at"] = datetime.now().isoformat()
 
                 return result
 
+            except ServerDraining as e:
+                return {"success": False, "agent_id": agent_id, "task": task, "error": str(e), "retryable": True}
             except Exception as api_error:
                 return {
                     "success": False,
@@ -678,7 +1455,163 @@ def call_agent_with_llm(agent_id: str, task: str, context: Optional[Dict[str, An
             "error": f"调用智能体失败: {str(e)}"
         }
 
-@mcp.tool()
+@bmad_tool()
+def list_teams() -> Dict[str, Any]:
+    """
+    列出所有智能体团队
+
+    Returns:
+        团队列表（成员只包含智能体ID）
+    """
+    teams = [
+        {
+            "id": team.id,
+            "name": team.name,
+            "description": team.description,
+            "use_case": team.use_case,
+            "members": [member.get("id") for member in team.members],
+            "workflow_coverage": team.workflow_coverage
+        }
+        for _, team in sorted(bmad_core.teams.items())
+    ]
+    return {
+        "success": True,
+        "teams": teams,
+        "count": len(teams),
+        "catalog_version": bmad_core.catalog_version
+    }
+
+@bmad_tool()
+def get_team(team_id: str) -> Dict[str, Any]:
+    """
+    获取团队详细信息
+
+    Args:
+        team_id: 团队ID
+
+    Returns:
+        团队信息，成员附带对应智能体的标题和图标
+    """
+    if team_id not in bmad_core.teams:
+        return {
+            "error": f"Team '{team_id}' not found",
+            "available_teams": sorted(bmad_core.teams)
+        }
+
+    team = bmad_core.teams[team_id]
+    members = []
+    for member in team.members:
+        agent = bmad_core.agents.get(member.get("id"))
+        members.append({
+            **member,
+            "available": agent is not None,
+            "title": agent.title if agent else None,
+            "icon": agent.icon if agent else None
+        })
+
+    return {
+        "success": True,
+        "team": {**asdict(team), "members": members},
+        "version": bmad_core.entry_versions.get(f"team:{team_id}")
+    }
+
+@bmad_tool()
+async def call_team(
+    team_id: str,
+    task: str,
+    context: Optional[Dict[str, Any]] = None,
+    members: Optional[List[str]] = None,
+    timeout_seconds: float = TEAM_CALL_TIMEOUT
+) -> Dict[str, Any]:
+    """
+    将任务并发分发给团队中的所有智能体并汇总结果
+
+    每个成员在独立线程中执行 call_agent_with_llm，超时的成员不会阻塞其他成员
+    （超时的调用会在后台继续运行到结束，但结果被丢弃）。
+
+    Args:
+        team_id: 团队ID
+        task: 要执行的任务描述
+        context: 共享的任务上下文，每个成员还会收到自己在团队中的角色和职责
+        members: 可选的成员子集（智能体ID）
+        timeout_seconds: 每个成员的超时时间（秒）
+
+    Returns:
+        每个成员的结果以及超时和失败的成员列表
+    """
+    if team_id not in bmad_core.teams:
+        return {
+            "success": False,
+            "error": f"Team '{team_id}' not found",
+            "available_teams": sorted(bmad_core.teams)
+        }
+
+    team = bmad_core.teams[team_id]
+    team_members = {member.get("id"): member for member in team.members}
+
+    if members:
+        unknown = [agent_id for agent_id in members if agent_id not in team_members]
+        if unknown:
+            return {
+                "success": False,
+                "error": f"不是团队 '{team_id}' 的成员: {', '.join(unknown)}",
+                "team_members": list(team_members)
+            }
+        selected = list(dict.fromkeys(members))
+    else:
+        selected = list(team_members)
+
+    skipped = [agent_id for agent_id in selected if agent_id not in bmad_core.agents]
+    selected = [agent_id for agent_id in selected if agent_id in bmad_core.agents]
+
+    async def run_member(agent_id: str):
+        member = team_members[agent_id]
+        member_context = {
+            **(context or {}),
+            "team": {
+                "id": team.id,
+                "name": team.name,
+                "role": member.get("role"),
+                "primary_focus": member.get("primary_focus"),
+                "responsibilities": member.get("responsibilities", [])
+            }
+        }
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                asyncio.to_thread(call_agent_with_llm, agent_id, task, member_context),
+                timeout=max(0.0, timeout_seconds)
+            )
+            status = "ok" if result.get("success") else "error"
+        except asyncio.TimeoutError:
+            result, status = None, "timeout"
+        except Exception as e:
+            result, status = {"success": False, "error": str(e)}, "error"
+        return agent_id, status, result, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(run_member(agent_id) for agent_id in selected))
+
+    responses, statuses = {}, {}
+    for agent_id, status, result, elapsed_ms in outcomes:
+        statuses[agent_id] = {"status": status, "elapsed_ms": round(elapsed_ms, 3)}
+        if result is not None:
+            responses[agent_id] = result
+
+    return {
+        "success": any(entry["status"] == "ok" for entry in statuses.values()),
+        "team_id": team_id,
+        "team_name": team.name,
+        "task": task,
+        "responses": responses,
+        "members": statuses,
+        "timed_out": [agent_id for agent_id, entry in statuses.items() if entry["status"] == "timeout"],
+        "failed": [agent_id for agent_id, entry in statuses.items() if entry["status"] == "error"],
+        "skipped_members": skipped,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+@bmad_tool()
 def analyze_requirements_with_llm(requirements: str, project_type: str = "web-app") -> Dict[str, Any]:
     """
     使用 LLM 分析项目需求
@@ -697,13 +1630,18 @@ def analyze_requirements_with_llm(requirements: str, project_type: str = "web-ap
             return {"error": "LLM 客户端未初始化"}
 
         # 调用需求分析
-        result = llm_client.analyze_requirements(requirements, project_type)
+        key = request_key("analyze_requirements", requirements=requirements, project_type=project_type)
+        with llm_calls.track():
+            result, coalesced = llm_flights.do(key, lambda: llm_client.analyze_requirements(requirements, project_type))
 
         # 添加时间戳
+        result["coalesced"] = coalesced
         result["analyzed_at"] = datetime.now().isoformat()
 
         return result
 
+    except ServerDraining as e:
+        return {"success": False, "error": str(e), "retryable": True}
     except Exception as e:
         return {
             "success": False,
@@ -712,20 +1650,40 @@ def analyze_requirements_with_llm(requirements: str, project_type: str = "web-ap
             "error": f"需求分析失败: {str(e)}"
         }
 
-@mcp.tool()
-def list_templates() -> Dict[str, Any]:
+@bmad_tool()
+def list_templates(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    if_version: Optional[str] = None
+) -> Dict[str, Any]:
     """
     列出所有可用的模板
 
+    Args:
+        limit: 每页数量，默认不分页
+        cursor: 上一页返回的 next_cursor
+        if_version: 客户端缓存的 catalog_version，未变化时只返回 not_modified
+
     Returns:
         模板列表
     """
+    catalog_version = bmad_core.catalog_version
+    if if_version and if_version == catalog_version:
+        return _not_modified("catalog_version", catalog_version)
+
+    try:
+        page = paginate(sorted(bmad_core.templates), catalog_version, limit, cursor)
+    except ValueError as e:
+        return {"success": False, "error": str(e)}
+
     return {
-        "templates": list(bmad_core.templates.keys()),
-        "count": len(bmad_core.templates)
+        "templates": page["items"],
+        "count": page["total"],
+        "next_cursor": page["next_cursor"],
+        "catalog_version": catalog_version
     }
 
-@mcp.tool()
+@bmad_tool()
 def get_template(template_name: str) -> Dict[str, Any]:
     """
     获取指定模板的内容
@@ -744,7 +1702,207 @@ def get_template(template_name: str) -> Dict[str, Any]:
         "content": bmad_core.templates[template_name]
     }
 
-@mcp.tool()
+@bmad_tool()
+def shard_document(path: str, destination: Optional[str] = None, level: int = 2) -> Dict[str, Any]:
+    """
+    按标题把大型 markdown 文档拆分为分片
+
+    PRD 和架构文档默认写入 core-config.yaml 中的 prdShardedLocation / architectureShardedLocation，
+    其他文档写入同名目录。只有内容变化的分片会被重写。
+
+    Args:
+        path: 文档路径
+        destination: 可选的分片目录，覆盖配置
+        level: 按几级标题拆分（默认二级）
+
+    Returns:
+        分片列表、索引文件和各分片的 created / updated / unchanged 状态
+    """
+    source = Path(path)
+    if not source.is_file():
+        return {"error": f"Document '{path}' not found"}
+    if not 1 <= level <= 6:
+        return {"error": "level 必须在 1 到 6 之间"}
+
+    target = Path(destination) if destination else shard_location(bmad_core.config or {}, source.resolve(), PROJECT_ROOT)
+    try:
+        result = shard_markdown(source, target, level)
+    except (OSError, UnicodeDecodeError) as e:
+        return {"error": f"Failed to shard document '{path}': {e}"}
+
+    return {"success": True, **result}
+
+@bmad_tool()
+def read_doc_sections(path: str, headings: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    只读取文档中需要的章节
+
+    Args:
+        path: 文档路径
+        headings: 要读取的章节标题（大小写不敏感，也可以用 kebab-case）；省略时返回文档大纲
+
+    Returns:
+        章节内容（包含下级章节）、未找到的标题和读取的字节数
+    """
+    document = Path(path)
+    if not document.is_file():
+        return {"error": f"Document '{path}' not found"}
+
+    try:
+        if not headings:
+            return {"success": True, **doc_sections.outline(document)}
+        result = doc_sections.read(document, headings)
+    except OSError as e:
+        return {"error": f"Failed to read document '{path}': {e}"}
+
+    return {"success": bool(result["sections"]), **result}
+
+@bmad_tool()
+def assemble_dev_context(files: Optional[List[str]] = None, token_budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    组装开发上下文（默认使用 core-config.yaml 的 devLoadAlwaysFiles）
+
+    文件内容按修改时间缓存，跨文件重复的段落只保留一次，总量受 token 预算限制。
+
+    Args:
+        files: 可选的文件列表（相对项目根目录），覆盖配置
+        token_budget: token 预算（默认 BMAD_DEV_CONTEXT_TOKENS）
+
+    Returns:
+        组装后的内容、每个文件的 token 数和状态（included / truncated / omitted）、缺失的文件
+    """
+    if token_budget is not None and token_budget <= 0:
+        return {"error": "token_budget 必须大于 0"}
+
+    result = _assemble_dev_context(files, token_budget)
+    return {"success": True, "project_root": str(PROJECT_ROOT), **result}
+
+@bmad_tool()
+def put_artifact(
+    name: str,
+    content: str,
+    run_id: Optional[str] = None,
+    encoding: str = "utf-8",
+    codec: str = "zlib"
+) -> Dict[str, Any]:
+    """
+    保存产物内容（按内容哈希寻址，块级去重）
+
+    Args:
+        name: 产物名称，与工作流程步骤的 creates / requires 对应（例如 prd.md）
+        content: 产物内容
+        run_id: 工作流程运行ID，默认当前运行
+        encoding: content 的编码（utf-8 或 base64）
+        codec: 块压缩方式（zlib / lzma / none）
+
+    Returns:
+        内容哈希、版本号以及新写入的块数和字节数
+    """
+    run_id = run_id or _current_run_id()
+    if not run_id:
+        return {"error": "No active workflow; pass run_id explicitly"}
+    if codec not in ARTIFACT_CODECS:
+        return {"error": f"Unsupported codec '{codec}'", "supported_codecs": list(ARTIFACT_CODECS)}
+
+    try:
+        data = base64.b64decode(content, validate=True) if encoding == "base64" else content.encode("utf-8")
+    except ValueError as e:
+        return {"error": f"Invalid base64 content: {e}"}
+
+    step_index = bmad_core.workflow_state.get("current_step") if run_id == _current_run_id() else None
+    with tracer.span("artifact.put", run_id=run_id, artifact=name, bytes=len(data)) as span:
+        try:
+            result = artifact_store.put(run_id, name, data, codec, step_index)
+        except OSError as e:
+            return {"error": f"Failed to store artifact '{name}': {e}"}
+        span.set_attribute("artifact.new_chunks", result["new_chunks"])
+
+    return {"success": True, **result}
+
+@bmad_tool()
+def get_artifact(
+    name: Optional[str] = None,
+    run_id: Optional[str] = None,
+    version: Optional[int] = None,
+    digest: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    读取产物内容
+
+    Args:
+        name: 产物名称（与 run_id 一起使用）
+        run_id: 工作流程运行ID，默认当前运行
+        version: 版本号，默认最新版本
+        digest: 内容哈希；指定时直接按哈希读取
+
+    Returns:
+        产物内容（非 UTF-8 内容以 base64 返回）
+    """
+    entry = None
+    if not digest:
+        if not name:
+            return {"error": "需要指定 name 或 digest"}
+        run_id = run_id or _current_run_id()
+        if not run_id:
+            return {"error": "No active workflow; pass run_id explicitly"}
+        entry = artifact_store.resolve(run_id, name, version)
+        if entry is None:
+            return {"error": f"Artifact '{name}' not found in run '{run_id}'"}
+        digest = entry["digest"]
+    elif not artifact_store.has(digest):
+        return {"error": f"Artifact '{digest}' not found"}
+
+    try:
+        data = artifact_store.read(digest)
+    except (OSError, ValueError) as e:
+        return {"error": f"Failed to read artifact '{digest}': {e}"}
+
+    try:
+        content, encoding = data.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        content, encoding = base64.b64encode(data).decode("ascii"), "base64"
+
+    return {
+        "success": True,
+        "name": name,
+        "run_id": run_id,
+        "digest": digest,
+        "version": entry["version"] if entry else None,
+        "size": len(data),
+        "encoding": encoding,
+        "content": content
+    }
+
+@bmad_tool()
+def list_artifacts(run_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    列出一次工作流程运行中的产物及其版本
+
+    Args:
+        run_id: 工作流程运行ID，默认当前运行
+
+    Returns:
+        每个产物的版本列表，以及存储中的块数和占用字节数
+    """
+    run_id = run_id or _current_run_id()
+    if not run_id:
+        return {"error": "No active workflow; pass run_id explicitly"}
+
+    artifacts = artifact_store.list(run_id)
+    chunk_count, stored_bytes = artifact_store.disk_usage()
+    return {
+        "success": True,
+        "run_id": run_id,
+        "artifacts": artifacts,
+        "count": len(artifacts),
+        "store": {
+            "chunks": chunk_count,
+            "stored_bytes": stored_bytes,
+            "logical_bytes": sum(entry["size"] for versions in artifacts.values() for entry in versions)
+        }
+    }
+
+@bmad_tool()
 def get_system_status() -> Dict[str, Any]:
     """
     获取 BMAD 系统状态
@@ -753,7 +1911,7 @@ def get_system_status() -> Dict[str, Any]:
         系统状态信息
     """
     # 获取当前 LLM 模式
-    current_mode = "builtin_llm" if llm_client.use_builtin_llm else "external_api"
+    current_mode = "builtin_llm" if is_builtin_mode() else "external_api"
 
     return {
         "bmad_core_path": str(BMAD_CORE_PATH),
@@ -768,10 +1926,11 @@ def get_system_status() -> Dict[str, Any]:
         "system_time": datetime.now().isoformat(),
         "llm_mode": current_mode,
         "llm_mode_description": "Cursor 内置 LLM" if current_mode == "builtin_llm" else "DeepSeek API",
-        "llm_client_ready": llm_client is not None
+        "llm_client_ready": get_llm_client() is not None,
+        "llm_requests": llm_flights.stats()
     }
 
-@mcp.tool()
+@bmad_tool()
 def switch_llm_mode(mode: str) -> Dict[str, Any]:
     """
     切换 LLM 模式
@@ -838,10 +1997,10 @@ def switch_llm_mode(mode: str) -> Dict[str, Any]:
         return {
             "success": False,
             "error": f"切换模式失败: {str(e)}",
-            "current_mode": "builtin_llm" if llm_client.use_builtin_llm else "external_api"
+            "current_mode": "builtin_llm" if is_builtin_mode() else "external_api"
         }
 
-@mcp.tool()
+@bmad_tool()
 def get_llm_mode_info() -> Dict[str, Any]:
     """
     获取 LLM 模式详细信息
@@ -849,7 +2008,7 @@ def get_llm_mode_info() -> Dict[str, Any]:
     Returns:
         LLM 模式信息
     """
-    current_mode = "builtin_llm" if llm_client.use_builtin_llm else "external_api"
+    current_mode = "builtin_llm" if is_builtin_mode() else "external_api"
 
     mode_info = {
         "current_mode": current_mode,
@@ -893,15 +2052,18 @@ def get_llm_mode_info() -> Dict[str, Any]:
 
     return mode_info
 
-@mcp.tool()
+@bmad_tool()
 def scan_bmad_core() -> Dict[str, Any]:
     """
     扫描 .bmad-core 目录并验证文件
 
+    只验证上次扫描后发生变化的文件，并复用目录加载时的解析结果；
+    scan_result.timing 中给出每个文件的耗时和结果来源。
+
     Returns:
         扫描结果和验证报告
     """
-    scan_result = BMADUtils.scan_bmad_core(BMAD_CORE_PATH)
+    scan_result = catalog_scanner.scan(BMAD_CORE_PATH, bmad_core.parsed_files)
     report = format_scan_report(scan_result)
 
     return {
@@ -909,7 +2071,7 @@ def scan_bmad_core() -> Dict[str, Any]:
         "report": report
     }
 
-@mcp.tool()
+@bmad_tool()
 def validate_agent(agent_id: str) -> Dict[str, Any]:
     """
     验证特定智能体文件
@@ -927,7 +2089,7 @@ def validate_agent(agent_id: str) -> Dict[str, Any]:
 
     return BMADUtils.validate_agent_file(agent_file)
 
-@mcp.tool()
+@bmad_tool()
 def validate_workflow(workflow_id: str) -> Dict[str, Any]:
     """
     验证特定工作流程文件
@@ -945,13 +2107,72 @@ def validate_workflow(workflow_id: str) -> Dict[str, Any]:
 
     return BMADUtils.validate_workflow_file(workflow_file)
 
-@mcp.tool()
-def export_workflow_state(output_file: str) -> Dict[str, Any]:
+# 导入时超出保留上限的条目攒够这么多再写入磁盘
+IMPORT_SPILL_BATCH = 1000
+
+def _import_state_records(records) -> Dict[str, Any]:
+    """
+    从流式记录重建工作流程状态
+
+    历史列表按保留上限只在内存中留最近的条目，更早的条目分批写入磁盘并计入汇总，
+    导入再长的历史内存占用也保持有界。移出的条目先写入临时运行，整个文件读取成功后
+    才换入运行的溢出文件；读取失败时运行原有的历史保持不变。
+    """
+    state = None
+    history_complete = False
+    staging_id = state_retention.staging_run()
+    buffers: Dict[str, deque] = {}
+    rollup: Dict[str, Any] = {}
+
+    def spill(key: str, keep: int):
+        buffer = buffers[key]
+        evicted = [buffer.popleft() for _ in range(len(buffer) - keep)]
+        rollup[key] = state_retention.evict({"rollup": rollup}, key, evicted, staging_id)
+
+    try:
+        for key, entry in records:
+            if key is None:
+                state = dict(entry)
+                # 完整历史导出的文件中，汇总会根据导入时移出的条目重新计算
+                history_complete = bool(state.pop("history_complete", False))
+                if history_complete:
+                    state.pop("rollup", None)
+                else:
+                    rollup = dict(state.pop("rollup", None) or {})
+                continue
+            if state is None:
+                raise ValueError("状态文件缺少状态主体")
+            buffer = buffers.setdefault(key, deque())
+            buffer.append(entry)
+            limit = state_retention.limits.get(key)
+            if limit and len(buffer) >= limit + IMPORT_SPILL_BATCH:
+                spill(key, limit)
+
+        if state is None:
+            raise ValueError("状态文件为空")
+        for key, buffer in buffers.items():
+            limit = state_retention.limits.get(key)
+            if limit and len(buffer) > limit:
+                spill(key, limit)
+            state[key] = list(buffer)
+        if rollup:
+            state["rollup"] = rollup
+    except BaseException:
+        state_retention.discard(staging_id)
+        raise
+
+    # 只有带完整历史的文件才替换运行原有的溢出条目
+    state_retention.commit_staged(staging_id, _run_id_of(state), replace=history_complete)
+    return state
+
+@bmad_tool()
+def export_workflow_state(output_file: str, format: Optional[str] = None) -> Dict[str, Any]:
     """
-    导出当前工作流程状态到文件
+    导出当前工作流程状态到文件（包括已写入磁盘的早期历史）
 
     Args:
         output_file: 输出文件路径
+        format: json / jsonl / gzip / lzma / binary，默认根据扩展名推断（.jsonl / .gz / .xz / .bin），否则为 json
 
     Returns:
         导出结果
@@ -960,24 +2181,45 @@ def export_workflow_state(output_file: str) -> Dict[str, Any]:
         return {"error": "No active workflow to export"}
 
     output_path = Path(output_file)
-    success = BMADUtils.export_workflow_state(bmad_core.workflow_state, output_path)
+    fmt = format or format_for_path(output_path)
+    if fmt not in STATE_FORMATS:
+        return {"error": f"Unsupported format '{fmt}'", "supported_formats": list(STATE_FORMATS)}
 
-    if success:
-        return {
-            "success": True,
-            "message": f"Workflow state exported to {output_file}",
-            "file_path": str(output_path.absolute())
-        }
-    else:
-        return {"error": f"Failed to export workflow state to {output_file}"}
+    state = bmad_core.workflow_state
+    run_id = _current_run_id()
+    body, _ = split_state(state)
+    body.pop("rollup", None)
+    body["history_complete"] = True
+
+    def records():
+        for key in STREAM_KEYS:
+            entries = state_retention.history(state, key, run_id) if key in state_retention.limits else state.get(key) or []
+            for entry in entries:
+                yield key, entry
+
+    with tracer.span("state.export", format=fmt) as span:
+        try:
+            written = write_state(output_path, body, records(), fmt)
+        except (OSError, ValueError, TypeError) as e:
+            return {"error": f"Failed to export workflow state to {output_file}: {e}"}
+        span.set_attribute("state.bytes", written["bytes"])
+
+    return {
+        "success": True,
+        "message": f"Workflow state exported to {output_file}",
+        "file_path": str(output_path.absolute()),
+        **written
+    }
 
-@mcp.tool()
-def import_workflow_state(input_file: str) -> Dict[str, Any]:
+@bmad_tool(writes_state=True)
+def import_workflow_state(input_file: str, compact: bool = False, format: Optional[str] = None) -> Dict[str, Any]:
     """
     从文件导入工作流程状态
 
     Args:
         input_file: 输入文件路径
+        compact: 为 True 时不回显导入的状态，只返回 revision
+        format: 文件格式，默认根据文件头自动识别
 
     Returns:
         导入结果
@@ -986,27 +2228,40 @@ def import_workflow_state(input_file: str) -> Dict[str, Any]:
 
     if not input_path.exists():
         return {"error": f"Input file '{input_file}' not found"}
+    if format is not None and format not in STATE_FORMATS:
+        return {"error": f"Unsupported format '{format}'", "supported_formats": list(STATE_FORMATS)}
 
-    state = BMADUtils.import_workflow_state(input_path)
+    previous_run_id = _current_run_id()
+    with tracer.span("state.import", format=format or "auto"):
+        try:
+            state = _import_state_records(read_state(input_path, format))
+        except (OSError, ValueError) as e:
+            return {"error": f"Failed to import workflow state from {input_file}: {e}"}
+    if previous_run_id != _run_id_of(state):
+        _discard_run(previous_run_id)
 
-    if state:
-        bmad_core.workflow_state = state
-        bmad_core.current_workflow = state.get("workflow_id")
+    bmad_core.workflow_state = state
+    bmad_core.current_workflow = state.get("workflow_id")
+    revision = bmad_core.state_journal.reset()
 
-        return {
-            "success": True,
-            "message": f"Workflow state imported from {input_file}",
-            "workflow_id": bmad_core.current_workflow,
-            "state": state
-        }
-    else:
-        return {"error": f"Failed to import workflow state from {input_file}"}
+    result = {
+        "success": True,
+        "message": f"Workflow state imported from {input_file}",
+        "workflow_id": bmad_core.current_workflow,
+        "revision": revision
+    }
+    if not compact:
+        result["state"] = state
+    return result
 
-@mcp.tool()
-def generate_workflow_report() -> Dict[str, Any]:
+@bmad_tool()
+def generate_workflow_report(since_revision: Optional[int] = None) -> Dict[str, Any]:
     """
     生成当前工作流程的执行报告
 
+    Args:
+        since_revision: 客户端已同步的 revision，提供时以增量代替完整状态
+
     Returns:
         工作流程报告
     """
@@ -1018,10 +2273,207 @@ def generate_workflow_report() -> Dict[str, Any]:
     return {
         "workflow_id": bmad_core.current_workflow,
         "report": report,
-        "state": bmad_core.workflow_state
+        **_state_payload(since_revision)
+    }
+
+@bmad_tool()
+def get_workflow_eta() -> Dict[str, Any]:
+    """
+    估算当前工作流程的剩余时间
+
+    每个剩余步骤的耗时取历史中位数（同一步骤 -> 同一智能体 -> 全局 -> 默认值），
+    在 requires/creates 依赖图上计算关键路径；同一智能体的步骤不能并行。
+
+    Returns:
+        ETA（中位数和 P80）、关键路径、瓶颈步骤以及每个剩余步骤的估算
+    """
+    if not bmad_core.current_workflow:
+        return {"error": "No active workflow"}
+
+    workflow = bmad_core.workflows[bmad_core.current_workflow]
+    state = bmad_core.workflow_state
+    if state.get("current_step", 0) >= len(workflow.sequence):
+        return {"success": True, "workflow_id": workflow.id, "status": "completed", "eta_seconds": 0.0}
+
+    with tracer.span("workflow.eta", workflow_id=workflow.id):
+        plan = _workflow_eta(workflow, state)
+    return {"success": True, "workflow_id": workflow.id, **plan}
+
+# 导入历史运行时攒够这么多行再写入列存储
+ANALYTICS_BATCH_ROWS = 10000
+
+def _step_agent(workflow_id: str, step_index: int) -> Optional[str]:
+    """工作流程定义中步骤的智能体"""
+    workflow = bmad_core.workflows.get(workflow_id)
+    if not workflow or not isinstance(step_index, int) or not 0 <= step_index < len(workflow.sequence):
+        return None
+    step = workflow.sequence[step_index]
+    return step.get("agent") if isinstance(step, dict) else None
+
+@bmad_tool()
+def ingest_workflow_runs(path: str) -> Dict[str, Any]:
+    """
+    把导出的工作流程状态文件导入历史运行分析
+
+    Args:
+        path: 状态文件，或包含状态文件的目录（递归查找 .json / .jsonl / .gz / .xz / .bin）
+
+    Returns:
+        导入的运行数和步骤行数、已存在而跳过的运行，以及无法读取的文件
+    """
+    source = Path(path)
+    if not source.exists():
+        return {"error": f"Path '{path}' not found"}
+    files = sorted(
+        candidate for candidate in source.rglob("*")
+        if candidate.is_file() and candidate.suffix.lower() in STATE_SUFFIXES
+    ) if source.is_dir() else [source]
+
+    ingested = skipped = rows_written = 0
+    failed: List[Dict[str, str]] = []
+    batch: List[Dict[str, Any]] = []
+    pending_runs = set()
+
+    with tracer.span("analytics.ingest", files=len(files)) as span:
+        for file_path in files:
+            try:
+                records = read_state(file_path)
+                key, body = next(records)
+                run_id = _run_id_of(body) if key is None and isinstance(body, dict) else None
+                if run_id is None:
+                    raise ValueError("状态文件缺少状态主体")
+                if run_id in pending_runs or run_analytics.has_run(run_id):
+                    skipped += 1
+                    continue
+                rows = list(rows_from_state(itertools.chain([(key, body)], records), _run_id_of, _step_agent))
+            except (OSError, ValueError, StopIteration) as e:
+                failed.append({"file": str(file_path), "error": str(e) or type(e).__name__})
+                continue
+            pending_runs.add(run_id)
+            batch.extend(rows)
+            ingested += 1
+            if len(batch) >= ANALYTICS_BATCH_ROWS:
+                rows_written += run_analytics.append(batch)
+                batch, pending_runs = [], set()
+        rows_written += run_analytics.append(batch)
+        span.set_attribute("analytics.rows", rows_written)
+
+    return {
+        "success": True,
+        "files": len(files),
+        "runs_ingested": ingested,
+        "runs_skipped": skipped,
+        "rows_ingested": rows_written,
+        "total_rows": run_analytics.rows,
+        "failed": failed
     }
 
-@mcp.tool()
+@bmad_tool()
+def analyze_runs(
+    group_by: Optional[List[str]] = None,
+    metric: str = "duration",
+    percentiles: Optional[List[float]] = None,
+    workflow_id: Optional[str] = None,
+    agent: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = 50
+) -> Dict[str, Any]:
+    """
+    统计历史运行的步骤指标
+
+    例如 greenfield-service 中 architect 步骤耗时的 P95：
+    analyze_runs(group_by=["agent"], percentiles=[95], workflow_id="greenfield-service", agent="architect")
+
+    Args:
+        group_by: 分组维度：workflow / agent / step / run，默认 ["workflow"]
+        metric: duration（步骤耗时秒数）/ artifacts（步骤产物数）/ run_duration（每次运行的总耗时）/ run_steps（每次运行的步骤数）
+        percentiles: 分位数（0-100），默认 [50, 90, 95]
+        workflow_id: 只统计该工作流程
+        agent: 只统计该智能体的步骤
+        since: 只统计该时间（ISO 格式）之后完成的步骤
+        limit: 最多返回的组数（按样本数降序，1-1000）
+
+    Returns:
+        每组的样本数、平均值、最小值、最大值和分位数
+    """
+    limit = max(1, min(int(limit), 1000))
+    start = time.perf_counter()
+    with tracer.span("analytics.query", metric=metric) as span:
+        try:
+            result = run_analytics.analyze(
+                group_by or ["workflow"], metric,
+                DEFAULT_PERCENTILES if percentiles is None else percentiles,
+                workflow_id, agent, since, limit
+            )
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        span.set_attribute("analytics.rows", result["rows"])
+
+    return {
+        "success": True,
+        **result,
+        "took_ms": round((time.perf_counter() - start) * 1000, 3)
+    }
+
+@bmad_tool()
+def get_workflow_history(kind: str = "completed_steps", offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+    """
+    分页读取当前运行的完整历史（包括已移出内存、写入磁盘的早期条目）
+
+    Args:
+        kind: completed_steps 或 task_executions
+        offset: 起始位置（按时间顺序）
+        limit: 返回条数
+
+    Returns:
+        历史条目
+    """
+    if not bmad_core.current_workflow:
+        return {"error": "No active workflow"}
+    if kind not in state_retention.limits:
+        return {"error": f"Unknown history kind '{kind}'", "valid_kinds": list(state_retention.limits)}
+
+    offset, limit = max(0, offset), max(1, limit)
+    entries = []
+    total = 0
+    for index, entry in enumerate(state_retention.history(bmad_core.workflow_state, kind, _current_run_id())):
+        total = index + 1
+        if offset <= index < offset + limit:
+            entries.append(entry)
+
+    return {
+        "success": True,
+        "kind": kind,
+        "entries": entries,
+        "offset": offset,
+        "total": total,
+        "in_memory": len(bmad_core.workflow_state.get(kind) or [])
+    }
+
+@bmad_tool()
+def get_workflow_delta(since_revision: int = 0) -> Dict[str, Any]:
+    """
+    获取工作流程状态自指定 revision 之后的变化
+
+    增量为 JSON Patch (RFC 6902) 操作列表，按顺序应用到本地副本即可得到最新状态；
+    增量不可用时（状态被替换或日志已截断）delta.full 为 True 并附带完整状态。
+
+    Args:
+        since_revision: 客户端已同步的 revision
+
+    Returns:
+        状态增量
+    """
+    if not bmad_core.current_workflow:
+        return {"error": "No active workflow"}
+
+    return {
+        "success": True,
+        "workflow_id": bmad_core.current_workflow,
+        **_state_payload(since_revision)
+    }
+
+@bmad_tool(writes_state=True)
 def reset_workflow() -> Dict[str, Any]:
     """
     重置当前工作流程状态
@@ -1033,8 +2485,10 @@ def reset_workflow() -> Dict[str, Any]:
         return {"message": "No active workflow to reset"}
 
     old_workflow = bmad_core.current_workflow
+    _discard_run(_current_run_id())
     bmad_core.current_workflow = None
     bmad_core.workflow_state = {}
+    bmad_core.state_journal.reset()
 
     return {
         "success": True,
@@ -1042,7 +2496,7 @@ def reset_workflow() -> Dict[str, Any]:
         "previous_workflow": old_workflow
     }
 
-@mcp.tool()
+@bmad_tool()
 def get_agent_tasks(agent_id: str) -> Dict[str, Any]:
     """
     获取特定智能体的所有相关任务和能力
@@ -1059,12 +2513,10 @@ def get_agent_tasks(agent_id: str) -> Dict[str, Any]:
     agent = bmad_core.agents[agent_id]
 
     # 获取智能体相关的任务
-    agent_tasks = {}
-    for task_type, task_list in agent.dependencies.items():
-        if task_type == "tasks":
-            for task_name in task_list:
-                if task_name in bmad_core.tasks:
-                    agent_tasks[task_name] = asdict(bmad_core.tasks[task_name])
+    agent_tasks = {
+        task_name: asdict(bmad_core.tasks[task_name])
+        for task_name in bmad_core.agent_tasks.get(agent_id, [])
+    }
 
     # 获取智能体相关的模板
     agent_templates = {}
@@ -1081,5 +2533,316 @@ def get_agent_tasks(agent_id: str) -> Dict[str, Any]:
         "dependencies": agent.dependencies
     }
 
+@bmad_tool()
+def reload_catalog() -> Dict[str, Any]:
+    """
+    重新加载 .bmad-core 目录（智能体、工作流程、任务、模板和配置）
+
+    Returns:
+        新的 catalog_version 和发生变化的条目
+    """
+    try:
+        result = bmad_core.reload()
+    except Exception as e:
+        return {"success": False, "error": f"重新加载失败: {str(e)}"}
+    if catalog_snapshot is not None:
+        catalog_snapshot.publish(bmad_core.catalog)
+
+    return {
+        "success": True,
+        "message": f"目录已重新加载，{len(result['changed_entries'])} 个条目发生变化",
+        **result
+    }
+
+@bmad_tool()
+def recommend_agent(task: str, top_k: int = 3) -> Dict[str, Any]:
+    """
+    根据任务描述推荐最合适的智能体
+
+    使用 whenToUse / role / focus 等字段的 TF-IDF 向量与任务描述计算余弦相似度。
+
+    Args:
+        task: 任务描述
+        top_k: 返回的智能体数量（1-20）
+
+    Returns:
+        按得分降序排列的智能体
+    """
+    if not task or not task.strip():
+        return {"success": False, "error": "任务描述不能为空"}
+
+    top_k = max(1, min(int(top_k), 20))
+    recommendations = _recommend_agents(task, top_k)
+
+    return {
+        "success": True,
+        "task": task,
+        "recommendations": recommendations,
+        "count": len(recommendations),
+        "message": "" if recommendations else "没有与任务描述匹配的智能体"
+    }
+
+@bmad_tool()
+def check_catalog_integrity(
+    severity: Optional[str] = None,
+    kind: Optional[str] = None,
+    source: Optional[str] = None,
+    limit: int = 100,
+    force: bool = False
+) -> Dict[str, Any]:
+    """
+    检查目录交叉引用：悬空的 agent / uses / requires / dependencies 引用、依赖环和无法执行的步骤
+
+    结果在目录加载和重载时计算并缓存。
+
+    Args:
+        severity: 可选的级别过滤：error / warning
+        kind: 可选的问题类型过滤，例如 dangling_agent、cycle、unreachable_step
+        source: 可选的来源前缀过滤，例如 "workflow:greenfield-ui" 或 "agent:pm"
+        limit: 返回的问题数量上限
+        force: 为 True 时忽略缓存重新检查
+
+    Returns:
+        汇总和问题列表
+    """
+    integrity = bmad_core.check_integrity(force=force)
+    issues = filter_issues(integrity["issues"], severity, kind, source)
+
+    return {
+        "success": True,
+        "ok": integrity["ok"],
+        "summary": integrity["summary"],
+        "issues": issues[:max(0, limit)],
+        "matched": len(issues),
+        "catalog_version": bmad_core.catalog_version
+    }
+
+SEARCH_KINDS = ["agent", "workflow", "task", "template", "team"]
+
+@bmad_tool()
+def search_catalog(query: str, kinds: Optional[List[str]] = None, top_k: int = 10) -> Dict[str, Any]:
+    """
+    全文检索智能体、工作流程、任务、模板和团队（BM25 排序，支持中英文混合查询）
+
+    Args:
+        query: 查询文本
+        kinds: 可选的类型过滤：agent / workflow / task / template / team
+        top_k: 返回结果数（1-100）
+
+    Returns:
+        按相关度排序的结果
+    """
+    if not query or not query.strip():
+        return {"success": False, "error": "查询内容不能为空"}
+
+    unknown = [kind for kind in kinds or [] if kind not in SEARCH_KINDS]
+    if unknown:
+        return {
+            "success": False,
+            "error": f"未知的类型: {', '.join(unknown)}",
+            "valid_kinds": SEARCH_KINDS
+        }
+
+    top_k = max(1, min(int(top_k), 100))
+    start = time.perf_counter()
+    results = bmad_core.search_index.search(query, kinds, top_k)
+    took_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "success": True,
+        "query": query,
+        "results": results,
+        "count": len(results),
+        "indexed_documents": len(bmad_core.search_index),
+        "took_ms": round(took_ms, 3),
+        "catalog_version": bmad_core.catalog_version
+    }
+
+@bmad_tool()
+def get_metrics(format: str = "json", reset: bool = False) -> Dict[str, Any]:
+    """
+    获取 MCP 工具和 LLM 后端的运行指标
+
+    Args:
+        format: 输出格式，'json'（默认）或 'prometheus'
+        reset: 读取后是否清空指标
+
+    Returns:
+        调用次数、错误数、响应大小和延迟分布
+    """
+    if format not in ("json", "prometheus"):
+        return {
+            "success": False,
+            "error": f"无效的格式: {format}",
+            "valid_formats": ["json", "prometheus"]
+        }
+
+    if format == "prometheus":
+        result = {"success": True, "format": "prometheus", "content": metrics.render_prometheus()}
+    else:
+        result = {"success": True, "format": "json", **metrics.snapshot()}
+
+    if reset:
+        metrics.reset()
+
+    return result
+
+@bmad_tool()
+def configure_profiling(
+    enabled: Optional[bool] = None,
+    tools: Optional[List[str]] = None,
+    threshold_ms: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    开启、关闭或调整工具调用的 CPU 性能分析
+
+    Args:
+        enabled: 是否启用性能分析
+        tools: 需要分析的工具名列表，['*'] 表示全部工具
+        threshold_ms: 仅保存耗时超过该阈值（毫秒）的调用
+
+    Returns:
+        当前性能分析配置
+    """
+    if tools is not None:
+        unknown = [name for name in tools if name != "*" and name not in TOOL_NAMES]
+        if unknown:
+            return {
+                "success": False,
+                "error": f"未知的工具: {', '.join(unknown)}",
+                "available_tools": sorted(TOOL_NAMES)
+            }
+
+    settings = profiler.configure(enabled, tools, threshold_ms)
+    return {
+        "success": True,
+        "message": "性能分析已启用" if settings["enabled"] else "性能分析已关闭",
+        "settings": settings
+    }
+
+@bmad_tool()
+def list_profiles(
+    tool_name: Optional[str] = None,
+    limit: int = 20,
+    profile_id: Optional[str] = None,
+    top_n: int = 15
+) -> Dict[str, Any]:
+    """
+    列出已保存的性能分析结果，或查看单个结果的热点函数
+
+    Args:
+        tool_name: 按工具名过滤
+        limit: 返回的最大条目数
+        profile_id: 指定时返回该结果中累计耗时最高的函数
+        top_n: 热点函数数量
+
+    Returns:
+        性能分析结果列表（.pstats 和 .collapsed 文件路径）
+    """
+    if profile_id:
+        top_functions = profiler.top_functions(profile_id, top_n)
+        if top_functions is None:
+            return {"error": f"Profile '{profile_id}' not found"}
+        return {
+            "success": True,
+            "profile_id": profile_id,
+            "top_functions": top_functions
+        }
+
+    profiles = profiler.list_profiles(tool_name, limit)
+    return {
+        "success": True,
+        "settings": profiler.settings(),
+        "profiles": profiles,
+        "count": len(profiles)
+    }
+
+@bmad_tool()
+def memory_report(action: str = "report", top_n: int = 10, group_by: str = "lineno") -> Dict[str, Any]:
+    """
+    内存诊断：tracemalloc 快照、基线对比和 BMADCore 数据结构大小
+
+    Args:
+        action: 'start'（开始跟踪并记录基线）、'snapshot'（重置基线）、
+                'report'（当前热点和基线差异）或 'stop'（停止跟踪）
+        top_n: 返回的分配位置数量
+        group_by: 分配位置的聚合方式，'lineno'、'filename' 或 'traceback'
+
+    Returns:
+        内存使用报告
+    """
+    valid_actions = ["start", "snapshot", "report", "stop"]
+    if action not in valid_actions:
+        return {"success": False, "error": f"无效的操作: {action}", "valid_actions": valid_actions}
+    if group_by not in ("lineno", "filename", "traceback"):
+        return {"success": False, "error": f"无效的聚合方式: {group_by}",
+                "valid_group_by": ["lineno", "filename", "traceback"]}
+
+    try:
+        if action == "start":
+            status = memory_tracker.start()
+        elif action == "snapshot":
+            status = memory_tracker.reset_baseline()
+        elif action == "stop":
+            status = memory_tracker.stop()
+        else:
+            status = memory_tracker.status()
+    except RuntimeError as e:
+        return {"success": False, "error": str(e)}
+
+    result = {
+        "success": True,
+        "action": action,
+        "status": status,
+        "structures": structure_sizes({
+            "agents": bmad_core.agents,
+            "workflows": bmad_core.workflows,
+            "tasks": bmad_core.tasks,
+            "templates": bmad_core.templates,
+            "config": bmad_core.config,
+            "workflow_state": bmad_core.workflow_state
+        })
+    }
+
+    if action == "report" and memory_tracker.tracing:
+        result["top_allocations"] = memory_tracker.top_allocations(top_n, group_by)
+        if memory_tracker.baseline is not None:
+            result["growth_since_baseline"] = memory_tracker.diff(top_n, group_by)
+    elif action == "report":
+        result["note"] = "tracemalloc 未启动，仅返回数据结构大小；使用 memory_report('start') 开始跟踪"
+
+    return result
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def prometheus_metrics(request):
+    """HTTP 模式下的 Prometheus 抓取端点"""
+    from starlette.responses import PlainTextResponse
+
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+def _enable_worker_sharing():
+    """fork worker 前在主进程中准备共享的会话状态和目录快照"""
+    global shared_state, catalog_snapshot
+    worker_dir = DATA_DIR / "workers"
+    shared_state = SharedStateStore(worker_dir / "session.sqlite3")
+    shared_state.initialize(bmad_core)
+    catalog_snapshot = CatalogSnapshot(worker_dir / "catalog.pickle")
+    catalog_snapshot.publish(bmad_core.catalog)
+
+def main(argv: Optional[List[str]] = None):
+    """服务入口：配置日志后按 MCP_TRANSPORT / --transport 启动 MCP 服务"""
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    transport = parse_transport_args(argv)
+    if transport.transport == "stdio":
+        mcp.run()
+    elif transport.workers > 1 and hasattr(os, "fork"):
+        _enable_worker_sharing()
+        serve_workers(mcp, transport, llm_calls)
+    else:
+        serve_http(mcp, transport, llm_calls)
+
 if __name__ == "__main__":
-    mcp.run()
+    main()
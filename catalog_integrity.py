@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 目录完整性检查
+
+对整个目录做交叉引用检查：
+- 工作流程步骤的 agent（含 routes 分支）是否存在
+- 步骤的 uses 是否指向存在的任务或模板
+- 步骤的 requires 是否由更早步骤的 creates 产出（悬空引用、前向引用）
+- requires 形成的依赖环，以及因依赖无法满足而永远无法执行的步骤
+- 智能体 dependencies 是否指向存在的任务、模板、清单等资源（ALL 表示该类型的全部资源）
+- 团队成员和 workflow_coverage 是否指向存在的智能体和工作流程
+
+所有名称先建成哈希索引，检查时间与引用总数成线性关系。
+"""
+
+import re
+import time
+from collections import deque
+from typing import Dict, List, Any, Iterable, Optional, Set, Tuple
+
+# requires/creates 中可选产物的后缀
+_OPTIONAL_SUFFIX = re.compile(r"\s*\(optional\)\s*$", re.IGNORECASE)
+_SEPARATORS = re.compile(r"[\s_\-]+")
+_FILE_LIKE = re.compile(r"\.[a-z0-9]{1,5}$", re.IGNORECASE)
+
+# 问题严重级别
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+
+# 智能体 dependencies 中表示该类型全部资源的通配符（如 bmad-master 的 tasks: ALL）
+DEPENDENCY_WILDCARD = "ALL"
+
+
+def normalize_name(name: Any) -> str:
+    """统一产物/步骤名称：去掉 (optional) 后缀，大小写和分隔符不敏感"""
+    text = _OPTIONAL_SUFFIX.sub("", str(name)).strip().lower()
+    return _SEPARATORS.sub(" ", text)
+
+
+def resource_name(name: Any) -> str:
+    """依赖资源名称去掉扩展名，例如 create-doc.md -> create-doc"""
+    return re.sub(r"\.(md|ya?ml|txt)$", "", str(name).strip(), flags=re.IGNORECASE)
+
+
+def as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _step_label(workflow_id: str, index: int, step: Dict[str, Any]) -> str:
+    name = step.get("step") or step.get("creates") or step.get("action") or step.get("agent") or ""
+    return f"workflow:{workflow_id}#{index}" + (f" ({name})" if name else "")
+
+
+class _Report:
+    """收集检查结果"""
+
+    def __init__(self):
+        self.issues: List[Dict[str, Any]] = []
+        self.references = 0
+
+    def add(self, kind: str, severity: str, source: str, target: Any, message: str):
+        self.issues.append({
+            "kind": kind,
+            "severity": severity,
+            "source": source,
+            "target": target,
+            "message": message
+        })
+
+
+def _step_nodes(step: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """步骤本身及其 routes 分支（附带来源后缀）"""
+    nodes = [("", step)]
+    routes = step.get("routes")
+    if isinstance(routes, dict):
+        nodes.extend((f" route:{route}", branch) for route, branch in routes.items() if isinstance(branch, dict))
+    return nodes
+
+
+def _check_agent_refs(report: _Report, workflow_id: str, index: int, step: Dict[str, Any],
+                      agent_ids: Set[str]):
+    """检查步骤及其 routes 分支中的 agent 引用"""
+    label = _step_label(workflow_id, index, step)
+    for suffix, node in _step_nodes(step):
+        for agent in as_list(node.get("agent")):
+            report.references += 1
+            # agent 字段可能写成 "po/sm" 或 "various" 之类的组合，逐个检查
+            for agent_id in str(agent).split("/"):
+                agent_id = agent_id.strip()
+                if agent_id and agent_id not in agent_ids and agent_id != "various":
+                    report.add("dangling_agent", SEVERITY_ERROR, label + suffix, agent_id,
+                               f"智能体 '{agent_id}' 不存在")
+
+
+def _check_uses(report: _Report, workflow_id: str, index: int, step: Dict[str, Any],
+                usable: Set[str]):
+    """检查步骤及其 routes 分支中的 uses 引用"""
+    label = _step_label(workflow_id, index, step)
+    for suffix, node in _step_nodes(step):
+        for used in as_list(node.get("uses")):
+            report.references += 1
+            if resource_name(used) not in usable:
+                report.add("dangling_uses", SEVERITY_WARNING, label + suffix, used,
+                           f"引用的任务或模板 '{used}' 不存在")
+
+
+def step_producers(sequence: List[Any]) -> Dict[str, int]:
+    """产物/步骤名（normalize_name 后）-> 产出它的步骤序号，同名取最早的"""
+    producers: Dict[str, int] = {}
+    for index, step in enumerate(sequence):
+        if not isinstance(step, dict):
+            continue
+        for produced in as_list(step.get("creates")) + as_list(step.get("step")) + as_list(step.get("action")):
+            producers.setdefault(normalize_name(produced), index)
+    return producers
+
+
+def step_requires(step: Dict[str, Any]) -> List[Any]:
+    """步骤的 requires 列表"""
+    return as_list(step.get("requires"))
+
+
+def _check_sequence(report: _Report, workflow_id: str, sequence: List[Any]):
+    """检查 requires/creates 依赖关系：悬空、前向引用、依赖环和不可达步骤"""
+    steps = [(index, step) for index, step in enumerate(sequence) if isinstance(step, dict)]
+    producers = step_producers(sequence)
+
+    # 步骤 -> 所依赖的步骤
+    edges: Dict[int, Set[int]] = {index: set() for index, _ in steps}
+    unsatisfiable: Set[int] = set()
+
+    for index, step in steps:
+        label = _step_label(workflow_id, index, step)
+        for required in as_list(step.get("requires")):
+            report.references += 1
+            key = normalize_name(required)
+            producer = producers.get(key)
+
+            if producer is None:
+                if _FILE_LIKE.search(_OPTIONAL_SUFFIX.sub("", str(required))):
+                    report.add("dangling_requires", SEVERITY_ERROR, label, required,
+                               f"需要的产物 '{required}' 没有任何步骤产出")
+                    unsatisfiable.add(index)
+                else:
+                    # 非文件形式的需求（例如 "impact analysis"）可能由外部活动满足
+                    report.add("unresolved_requirement", SEVERITY_WARNING, label, required,
+                               f"需要的 '{required}' 无法对应到任何步骤的产出")
+                continue
+
+            if producer == index:
+                report.add("self_requires", SEVERITY_ERROR, label, required,
+                           f"步骤需要自己产出的 '{required}'")
+                continue
+
+            if producer > index:
+                report.add("forward_requires", SEVERITY_ERROR, label, required,
+                           f"'{required}' 在后面的步骤 #{producer} 才产出")
+            edges[index].add(producer)
+
+    # Kahn 拓扑排序：处理不到的步骤处于依赖环中或依赖了无法满足的步骤
+    dependents: Dict[int, List[int]] = {index: [] for index in edges}
+    pending = {index: len(deps) for index, deps in edges.items()}
+    for index, deps in edges.items():
+        for dep in deps:
+            dependents[dep].append(index)
+
+    queue = deque(index for index, count in pending.items() if count == 0 and index not in unsatisfiable)
+    resolved: Set[int] = set()
+    while queue:
+        index = queue.popleft()
+        resolved.add(index)
+        for dependent in dependents[index]:
+            pending[dependent] -= 1
+            if pending[dependent] == 0 and dependent not in unsatisfiable:
+                queue.append(dependent)
+
+    blocked = set(edges) - resolved
+    if not blocked:
+        return
+
+    cycles = _find_cycles({index: edges[index] & blocked for index in blocked})
+    in_cycle = set()
+    step_by_index = dict(steps)
+    for cycle in cycles:
+        in_cycle.update(cycle)
+        labels = [_step_label(workflow_id, index, step_by_index[index]) for index in cycle]
+        report.add("cycle", SEVERITY_ERROR, labels[0], labels,
+                   "步骤之间的 requires 形成依赖环: " + " -> ".join(labels + labels[:1]))
+
+    # 自身有悬空 requires 的步骤已单独报告
+    for index in sorted(blocked - in_cycle - unsatisfiable):
+        report.add("unreachable_step", SEVERITY_ERROR, _step_label(workflow_id, index, step_by_index[index]), None,
+                   "步骤依赖的产物永远无法产出，该步骤无法执行")
+
+
+def _find_cycles(graph: Dict[int, Set[int]]) -> List[List[int]]:
+    """Tarjan 强连通分量（迭代实现），返回包含环的分量"""
+    index_of: Dict[int, int] = {}
+    lowlink: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack: Set[int] = set()
+    components: List[List[int]] = []
+    counter = 0
+
+    for root in sorted(graph):
+        if root in index_of:
+            continue
+        work = [(root, iter(sorted(graph[root])))]
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in index_of:
+                    index_of[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(graph[child]))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[child])
+            if advanced:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or node in graph[node]:
+                    components.append(sorted(component))
+
+    return components
+
+
+def check_catalog(
+    agents: Dict[str, Any],
+    workflows: Dict[str, Any],
+    resources: Dict[str, Iterable[str]],
+    teams: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    检查整个目录的交叉引用
+
+    Args:
+        agents: 智能体ID -> AgentInfo
+        workflows: 工作流程ID -> WorkflowInfo
+        resources: 依赖类型（tasks / templates / checklists / ...）-> 可用名称
+        teams: 可选的团队ID -> TeamInfo
+
+    Returns:
+        问题列表和按类型、级别的汇总
+    """
+    started = time.perf_counter()
+    report = _Report()
+
+    agent_ids = set(agents)
+    resource_index = {kind: {resource_name(name) for name in names} for kind, names in resources.items()}
+    usable = set().union(*(resource_index.get(kind, set()) for kind in ("tasks", "templates", "utils", "checklists")))
+
+    for agent_id, agent in agents.items():
+        for dependency_type, names in (agent.dependencies or {}).items():
+            available = resource_index.get(dependency_type)
+            for name in as_list(names):
+                report.references += 1
+                if str(name).strip() == DEPENDENCY_WILDCARD:
+                    continue
+                if available is None or resource_name(name) not in available:
+                    report.add("dangling_dependency", SEVERITY_WARNING, f"agent:{agent_id}",
+                               f"{dependency_type}/{name}",
+                               f"依赖的 {dependency_type} '{name}' 不存在")
+
+    for workflow_id, workflow in workflows.items():
+        sequence = workflow.sequence if isinstance(workflow.sequence, list) else []
+        for index, step in enumerate(sequence):
+            if not isinstance(step, dict):
+                continue
+            _check_agent_refs(report, workflow_id, index, step, agent_ids)
+            _check_uses(report, workflow_id, index, step, usable)
+        _check_sequence(report, workflow_id, sequence)
+
+    for team_id, team in (teams or {}).items():
+        for member in team.members:
+            report.references += 1
+            if member.get("id") not in agent_ids:
+                report.add("dangling_team_member", SEVERITY_ERROR, f"team:{team_id}", member.get("id"),
+                           f"团队成员 '{member.get('id')}' 不是已知的智能体")
+        for workflow_id in team.workflow_coverage:
+            report.references += 1
+            if workflow_id not in workflows:
+                report.add("dangling_team_workflow", SEVERITY_WARNING, f"team:{team_id}", workflow_id,
+                           f"团队覆盖的工作流程 '{workflow_id}' 不存在")
+
+    by_kind: Dict[str, int] = {}
+    by_severity = {SEVERITY_ERROR: 0, SEVERITY_WARNING: 0}
+    for issue in report.issues:
+        by_kind[issue["kind"]] = by_kind.get(issue["kind"], 0) + 1
+        by_severity[issue["severity"]] += 1
+
+    return {
+        "ok": by_severity[SEVERITY_ERROR] == 0,
+        "issues": report.issues,
+        "summary": {
+            "by_kind": by_kind,
+            "by_severity": by_severity,
+            "checked_references": report.references,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3)
+        }
+    }
+
+
+def filter_issues(issues: List[Dict[str, Any]], severity: Optional[str] = None,
+                  kind: Optional[str] = None, source: Optional[str] = None) -> List[Dict[str, Any]]:
+    """按级别、类型或来源前缀过滤问题"""
+    return [
+        issue for issue in issues
+        if (not severity or issue["severity"] == severity)
+        and (not kind or issue["kind"] == kind)
+        and (not source or issue["source"].startswith(source))
+    ]
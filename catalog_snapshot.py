@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 目录快照
+
+多 worker 模式下目录只在主进程中解析一次，worker 通过 fork 继承（写时复制，只读共享）。
+某个 worker 重新加载目录后把解析结果写成快照文件，其他 worker 在下一次工具调用时
+发现快照变化，以 mmap 读取并反序列化，不需要重新解析 YAML / Markdown。
+
+目录数据整体放在一个 Catalog 对象中，替换目录只需替换一个引用。
+"""
+
+import mmap
+import os
+import pickle
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Catalog:
+    """
+    一份完整的目录（工作流程状态等会话数据不在其中）
+
+    发布后不再修改：重新加载或应用快照时构造新的 Catalog 并替换 BMADCore.catalog，
+    需要同时读取多个字段的调用先取得 catalog 引用，不会看到新旧目录混在一起。
+    """
+    config: Dict[str, Any] = field(default_factory=dict)
+    agents: Dict[str, Any] = field(default_factory=dict)
+    workflows: Dict[str, Any] = field(default_factory=dict)
+    tasks: Dict[str, Any] = field(default_factory=dict)
+    templates: Dict[str, str] = field(default_factory=dict)
+    teams: Dict[str, Any] = field(default_factory=dict)
+    entry_versions: Dict[str, str] = field(default_factory=dict)
+    catalog_version: str = ""
+    # 文件路径 -> {"signature", "hash", "config", "error"}，重载和扫描时复用
+    parsed_files: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    integrity: Dict[str, Any] = field(default_factory=dict)
+    integrity_version: Optional[str] = None
+    # 智能体ID -> 任务名列表
+    agent_tasks: Dict[str, List[str]] = field(default_factory=dict)
+
+
+class CatalogSnapshot:
+    """目录快照文件"""
+
+    def __init__(self, snapshot_file: Path):
+        self.snapshot_file = snapshot_file
+        self._signature: Optional[Tuple[int, int, int]] = None
+
+    def _current_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.snapshot_file.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def publish(self, catalog: Catalog) -> int:
+        """写出目录快照，返回字节数"""
+        payload = pickle.dumps(catalog, protocol=pickle.HIGHEST_PROTOCOL)
+        self.snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(prefix=f".{self.snapshot_file.name}.", suffix=".tmp",
+                                         dir=self.snapshot_file.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(temp_name, self.snapshot_file)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+        self._signature = self._current_signature()
+        return len(payload)
+
+    def changed(self) -> bool:
+        """快照是否被其他进程更新过"""
+        signature = self._current_signature()
+        return signature is not None and signature != self._signature
+
+    def load(self) -> Catalog:
+        """读取快照（以 mmap 映射文件，直接在映射上反序列化）"""
+        signature = self._current_signature()
+        with open(self.snapshot_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = pickle.loads(mapped)
+        self._signature = signature
+        return data
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 开发上下文组装
+
+把 core-config.yaml 中 devLoadAlwaysFiles 列出的文档组装为一段上下文：
+- 路径相对项目根目录解析，文件内容按 (修改时间, 大小) 缓存
+- 文档切分为段落/代码块，跨文件重复的块只保留第一次出现
+- 按 token 预算截断，超出预算的文件标记为 truncated / omitted
+
+所有文件签名未变化时直接返回上次组装的结果，热调用只做 stat，不读取文件。
+"""
+
+import hashlib
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+# 缓存的组装结果数（不同的文件列表和预算组合）
+MAX_ASSEMBLED = 32
+
+# 短于该长度的块（分隔线、单独的标题等）不参与去重
+MIN_DEDUP_CHARS = 40
+
+_FENCE_PATTERN = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+_CJK_PATTERN = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+_WHITESPACE = re.compile(r"\s+")
+
+# (块哈希, 块文本, token 估算)
+Block = Tuple[str, str, int]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩文字每字约 1 个 token，其余字符约 4 个字符 1 个 token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def split_blocks(text: str) -> List[str]:
+    """按空行切分段落，围栏代码块整体作为一个块"""
+    blocks, current = [], []
+    fence = None
+    for line in text.splitlines(keepends=True):
+        match = _FENCE_PATTERN.match(line)
+        if match:
+            marker = match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        if fence is None and not match and not line.strip():
+            if current:
+                blocks.append("".join(current))
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append("".join(current))
+    return blocks
+
+
+def _block_hash(block: str) -> str:
+    return hashlib.sha1(_WHITESPACE.sub(" ", block).strip().encode("utf-8")).hexdigest()
+
+
+class ContextAssembler:
+    """带缓存的开发上下文组装器"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+        # 文件路径 -> ((修改时间, 大小), 块列表)
+        self._files: Dict[str, Tuple[Tuple[int, int], List[Block]]] = {}
+        # (路径列表, 预算) -> (签名列表, 组装结果)
+        self._assembled: Dict[Tuple[Tuple[str, ...], int], Tuple[Tuple[Any, ...], Dict[str, Any]]] = {}
+        self.stats = {"file_reads": 0, "file_hits": 0, "assembled_hits": 0}
+
+    def resolve(self, path: str) -> Path:
+        candidate = Path(path)
+        return candidate if candidate.is_absolute() else self.root / candidate
+
+    def _signature(self, path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _blocks(self, path: Path, signature: Tuple[int, int]) -> List[Block]:
+        key = str(path)
+        cached = self._files.get(key)
+        if cached and cached[0] == signature:
+            self.stats["file_hits"] += 1
+            return cached[1]
+
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        blocks = [(_block_hash(block), block, estimate_tokens(block)) for block in split_blocks(text)]
+        with self._lock:
+            self._files[key] = (signature, blocks)
+            self.stats["file_reads"] += 1
+        return blocks
+
+    def assemble(self, paths: Iterable[str], token_budget: int) -> Dict[str, Any]:
+        """
+        组装上下文
+
+        Args:
+            paths: 文档路径（相对项目根目录）
+            token_budget: token 预算
+
+        Returns:
+            组装后的内容、每个文件的 token 数和去重/截断情况，以及缺失的文件
+        """
+        paths = tuple(dict.fromkeys(str(path) for path in paths))
+        resolved = [self.resolve(path) for path in paths]
+        signatures = tuple(self._signature(path) for path in resolved)
+
+        key = (paths, token_budget)
+        cached = self._assembled.get(key)
+        if cached and cached[0] == signatures:
+            self.stats["assembled_hits"] += 1
+            return {**cached[1], "cached": True}
+
+        seen = set()
+        parts: List[str] = []
+        files: List[Dict[str, Any]] = []
+        missing: List[str] = []
+        used = 0
+        duplicates = 0
+        exhausted = False
+
+        for path, full_path, signature in zip(paths, resolved, signatures):
+            if signature is None:
+                missing.append(path)
+                continue
+            try:
+                blocks = self._blocks(full_path, signature)
+            except OSError:
+                missing.append(path)
+                continue
+
+            entry = {"path": path, "tokens": 0, "blocks": 0, "duplicate_blocks": 0, "status": "included"}
+            files.append(entry)
+            if exhausted:
+                entry["status"] = "omitted"
+                continue
+
+            header = f"### {path}\n\n"
+            header_tokens = estimate_tokens(header)
+            if used + header_tokens > token_budget:
+                exhausted = True
+                entry["status"] = "omitted"
+                continue
+            selected = [header]
+            used += header_tokens
+            entry["tokens"] += header_tokens
+
+            for digest, block, tokens in blocks:
+                if len(block) >= MIN_DEDUP_CHARS:
+                    if digest in seen:
+                        entry["duplicate_blocks"] += 1
+                        duplicates += 1
+                        continue
+                    seen.add(digest)
+                if used + tokens > token_budget:
+                    exhausted = True
+                    entry["status"] = "truncated"
+                    break
+                selected.append(block.rstrip("\n") + "\n\n")
+                used += tokens
+                entry["tokens"] += tokens
+                entry["blocks"] += 1
+
+            parts.append("".join(selected))
+
+        result = {
+            "content": "".join(parts).rstrip("\n"),
+            "tokens": used,
+            "token_budget": token_budget,
+            "files": files,
+            "missing": missing,
+            "duplicate_blocks": duplicates,
+            "truncated": exhausted
+        }
+        with self._lock:
+            if key not in self._assembled and len(self._assembled) >= MAX_ASSEMBLED:
+                self._assembled.pop(next(iter(self._assembled)))
+            self._assembled[key] = (signatures, result)
+        return {**result, "cached": False}
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._assembled.clear()
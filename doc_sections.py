@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 文档章节索引
+
+为项目文档建立 标题 -> 字节范围 的索引（章节包含其下级章节），按文件 (修改时间, 大小)
+失效。读取章节时用 mmap 只切出需要的字节范围，不必读取和解码整个文件。
+"""
+
+import mmap
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from doc_sharder import iter_headings, slugify
+
+# (标题, 级别, 起始字节, 结束字节)
+Section = Tuple[str, int, int, int]
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_heading(heading: str) -> str:
+    """标题比较时忽略大小写和多余空白"""
+    return _SPACES.sub(" ", heading.strip()).lower()
+
+
+def build_sections(handle) -> List[Section]:
+    """
+    扫描二进制文件句柄，返回所有章节的字节范围
+
+    每个章节从标题行开始，到下一个同级或更高级标题（或文件末尾）结束。
+    """
+    handle.seek(0)
+    line_start = position = 0
+
+    def lines():
+        nonlocal line_start, position
+        for raw in handle:
+            line_start = position
+            position += len(raw)
+            yield raw.decode("utf-8", errors="replace")
+
+    sections: List[List[Any]] = []
+    open_sections: List[List[Any]] = []
+    for _, level, title in iter_headings(lines()):
+        if not level:
+            continue
+        start = line_start
+        while open_sections and open_sections[-1][1] >= level:
+            open_sections.pop()[3] = start
+        section = [title, level, start, None]
+        sections.append(section)
+        open_sections.append(section)
+    for section in open_sections:
+        section[3] = position
+    return [tuple(section) for section in sections]
+
+
+class SectionIndex:
+    """按文件缓存的章节索引"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 文件路径 -> ((修改时间, 大小), 章节列表, 标题查找表)
+        self._entries: Dict[str, Tuple[Tuple[int, int], List[Section], Dict[str, Section]]] = {}
+        self.stats = {"hits": 0, "builds": 0}
+
+    def _entry_for(self, path: Path, handle) -> Tuple[Tuple[int, int], List[Section], Dict[str, Section]]:
+        """返回与已打开文件当前内容一致的索引项"""
+        stat = os.fstat(handle.fileno())
+        signature = (stat.st_mtime_ns, stat.st_size)
+        key = str(path.resolve())
+
+        cached = self._entries.get(key)
+        if cached and cached[0] == signature:
+            self.stats["hits"] += 1
+            return cached
+
+        sections = build_sections(handle)
+        lookup: Dict[str, Section] = {}
+        for section in sections:
+            # 同名章节取第一个
+            lookup.setdefault(normalize_heading(section[0]), section)
+            lookup.setdefault(slugify(section[0]), section)
+        entry = (signature, sections, lookup)
+        with self._lock:
+            self._entries[key] = entry
+            self.stats["builds"] += 1
+        return entry
+
+    def outline(self, path: Path) -> Dict[str, Any]:
+        """文档大纲：每个章节的标题、级别和字节数"""
+        with open(path, "rb") as f:
+            (_, size), sections, _ = self._entry_for(path, f)
+        return {
+            "path": str(path),
+            "file_size": size,
+            "sections": [
+                {"title": title, "level": level, "bytes": end - start}
+                for title, level, start, end in sections
+            ]
+        }
+
+    def read(self, path: Path, headings: List[str]) -> Dict[str, Any]:
+        """
+        读取指定章节
+
+        Args:
+            path: 文档路径
+            headings: 标题（大小写不敏感）或其 kebab-case 形式，同名章节取第一个
+
+        Returns:
+            找到的章节内容、未找到的标题和实际读取的字节数
+        """
+        with open(path, "rb") as f:
+            (_, size), _, lookup = self._entry_for(path, f)
+
+            found, missing = [], []
+            for heading in headings:
+                section = lookup.get(normalize_heading(heading)) or lookup.get(slugify(heading))
+                if section is None:
+                    missing.append(heading)
+                else:
+                    found.append(section)
+
+            results = []
+            bytes_read = 0
+            if found and size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    for title, level, start, end in found:
+                        content = mm[start:end].decode("utf-8", errors="replace")
+                        bytes_read += end - start
+                        results.append({"title": title, "level": level, "content": content})
+
+        return {
+            "path": str(path),
+            "file_size": size,
+            "sections": results,
+            "missing": missing,
+            "bytes_read": bytes_read
+        }
+
+    def invalidate(self, path: Optional[Path] = None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(path.resolve()), None)
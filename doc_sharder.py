@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 文档分片
+
+按 core-config.yaml 的 prdSharded / architectureSharded 设置，把大型 markdown 文档
+按指定级别的标题拆分到分片目录，并生成 index.md（标题前的内容 + 各分片链接）。
+
+比拆分级别更高的标题（例如各二级章节之后的一级标题）结束当前分片，其下的内容
+与第一个分片前的内容一样写入 index.md。
+
+文档逐行流式读取，每个分片边写临时文件边计算哈希，内存占用与文档大小无关；
+内容与已有分片相同时丢弃临时文件，只有变化的分片才会被替换。
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+# 分片目录中的索引文件名
+INDEX_FILE = "index.md"
+
+# 比较已有分片时的读取块大小
+_CHUNK_SIZE = 1 << 16
+
+_FENCE_PATTERN = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_SLUG_STRIP = re.compile(r"[^\w\s-]", re.UNICODE)
+_SLUG_SEPARATORS = re.compile(r"[\s_-]+")
+
+
+def slugify(heading: str) -> str:
+    """标题转为 kebab-case 文件名，例如 Epic 1: Foundation -> epic-1-foundation"""
+    text = _SLUG_STRIP.sub("", heading.lower())
+    return _SLUG_SEPARATORS.sub("-", text).strip("-") or "section"
+
+
+def shard_location(config: Dict[str, Any], document: Path, project_root: Path = Path(".")) -> Path:
+    """
+    文档对应的分片目录
+
+    与 core-config 中的 prdFile / architectureFile 匹配时使用配置的分片位置，
+    否则使用文档同级、与文档同名的目录（docs/prd.md -> docs/prd）。
+    配置中的相对路径和相对的 document 都以 project_root 为基准比较。
+    """
+    resolved = (project_root / document).resolve()
+    for section, file_key, location_key in (
+        ("prd", "prdFile", "prdShardedLocation"),
+        ("architecture", "architectureFile", "architectureShardedLocation"),
+    ):
+        settings = config.get(section) or {}
+        configured = settings.get(file_key)
+        if configured and settings.get(location_key) and (project_root / configured).resolve() == resolved:
+            return project_root / settings[location_key]
+    return document.with_suffix("")
+
+
+class _ShardWriter:
+    """把一个分片写入临时文件并同时计算哈希"""
+
+    def __init__(self, directory: Path, name: str):
+        self.target = directory / name
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        self.temp_path = Path(temp_path)
+        self.handle = os.fdopen(fd, "w", encoding="utf-8", newline="")
+        self.digest = hashlib.sha1()
+        self.size = 0
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        self.digest.update(data)
+        self.size += len(data)
+        self.handle.write(text)
+
+    def commit(self) -> str:
+        """
+        完成写入
+
+        Returns:
+            created / updated / unchanged
+        """
+        self.handle.close()
+        if self.target.exists():
+            if _same_content(self.target, self.size, self.digest.hexdigest()):
+                self.temp_path.unlink()
+                return "unchanged"
+            status = "updated"
+        else:
+            status = "created"
+        os.replace(self.temp_path, self.target)
+        return status
+
+    def abort(self):
+        self.handle.close()
+        self.temp_path.unlink(missing_ok=True)
+
+
+def _same_content(path: Path, size: int, hexdigest: str) -> bool:
+    if path.stat().st_size != size:
+        return False
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest() == hexdigest
+
+
+def iter_headings(lines: Iterable[str]) -> Iterator[Tuple[str, int, Optional[str]]]:
+    """
+    逐行识别 markdown 标题
+
+    Yields:
+        (行, 标题级别, 标题)：非标题行的级别为 0；代码块中的 # 行不算标题
+    """
+    fence = None
+    for line in lines:
+        match = _FENCE_PATTERN.match(line)
+        if match:
+            marker = match.group(1)
+            if fence is None:
+                fence = marker
+            elif marker[0] == fence[0] and len(marker) >= len(fence):
+                fence = None
+        elif fence is None:
+            heading = _HEADING_PATTERN.match(line.rstrip("\r\n"))
+            if heading:
+                yield line, len(heading.group(1)), heading.group(2)
+                continue
+        yield line, 0, None
+
+
+def _scan_lines(lines: Iterable[str], level: int) -> Iterator[Tuple[Optional[str], bool, str]]:
+    """
+    逐行标注分片边界，并把分片内的标题整体提升 level-1 级（分片标题成为一级标题）
+
+    Yields:
+        (标题, 是否在分片内, 行)：遇到 level 级标题时标题非空；
+        更高级别的标题结束当前分片，直到下一个 level 级标题前的行都不在分片内
+    """
+    in_section = False
+    for line, depth, title in iter_headings(lines):
+        if depth == level:
+            in_section = True
+            yield title, True, line[level - 1:]
+            continue
+        if 0 < depth < level:
+            in_section = False
+        yield None, in_section, line[level - 1:] if in_section and depth > level else line
+
+
+def shard_markdown(source: Path, destination: Path, level: int = 2) -> Dict[str, Any]:
+    """
+    流式拆分 markdown 文档
+
+    Args:
+        source: 源文档
+        destination: 分片目录（不存在时创建）
+        level: 按几级标题拆分
+
+    Returns:
+        每个分片的文件名、标题和 created / updated / unchanged 状态，
+        以及目录中不再对应任何章节的旧分片
+    """
+    destination.mkdir(parents=True, exist_ok=True)
+    preamble = _ShardWriter(destination, INDEX_FILE)
+    current: Optional[_ShardWriter] = None
+    shards: List[Dict[str, Any]] = []
+    used_names = {INDEX_FILE}
+
+    try:
+        with open(source, "r", encoding="utf-8", newline="") as f:
+            for heading, in_section, line in _scan_lines(f, level):
+                if not in_section and current is not None:
+                    shards[-1]["status"] = current.commit()
+                    current = None
+                if heading is not None:
+                    if current is not None:
+                        shards[-1]["status"] = current.commit()
+                    base = slugify(heading)
+                    name, suffix = f"{base}.md", 2
+                    while name in used_names:
+                        name, suffix = f"{base}-{suffix}.md", suffix + 1
+                    used_names.add(name)
+                    current = _ShardWriter(destination, name)
+                    shards.append({"file": name, "title": heading, "status": None})
+                (preamble if current is None else current).write(line)
+        if current is not None:
+            shards[-1]["status"] = current.commit()
+            current = None
+
+        # 索引：标题前的内容加上分片链接，索引与分片一样只在变化时替换
+        if preamble.size:
+            preamble.write("\n")
+        preamble.write("## Sections\n\n")
+        for shard in shards:
+            preamble.write(f"- [{shard['title']}](./{shard['file']})\n")
+        index_status = preamble.commit()
+    except BaseException:
+        if current is not None:
+            current.abort()
+        preamble.abort()
+        raise
+
+    stale = sorted(
+        path.name for path in destination.glob("*.md")
+        if path.name not in used_names
+    )
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    for shard in shards:
+        counts[shard["status"]] += 1
+
+    return {
+        "source": str(source),
+        "destination": str(destination),
+        "index": {"file": INDEX_FILE, "status": index_status},
+        "shards": shards,
+        "counts": counts,
+        "stale": stale
+    }
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service HTTP 传输
+
+默认以 stdio 运行（每个 IDE 一个进程）；设置 MCP_TRANSPORT=http（Streamable HTTP）
+或 sse 后作为团队共享的网络服务运行：
+- 响应超过 BMAD_GZIP_MIN_BYTES 且客户端接受 gzip 时压缩（get_template、报告等大响应）；
+  http 模式默认以 JSON 而不是 SSE 流返回工具结果，这样结果也能被压缩
+- HTTP keep-alive 空闲超时为 BMAD_HTTP_KEEPALIVE 秒，客户端可复用连接
+- 收到关闭信号后先停止接受新连接、拒绝新的 LLM 调用，等待进行中的 LLM 调用完成
+  （最多 BMAD_SHUTDOWN_TIMEOUT 秒）后再关闭连接
+- BMAD_WORKERS > 1 时主进程绑定端口后 fork 出多个 worker 共享监听 socket，
+  worker 异常退出时自动重启；关闭信号转发给所有 worker，各自排空后退出
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import uvicorn
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ("stdio", "http", "sse")
+
+# LLM 调用排空后等待连接发送完响应的时间（秒）
+_CONNECTION_CLOSE_TIMEOUT = 5
+# 启动后这么快就退出的 worker 延迟重启，避免反复崩溃时空转
+_MIN_WORKER_LIFETIME = 1.0
+
+
+class ServerDraining(RuntimeError):
+    """服务正在关闭，不再接受新的调用"""
+
+
+class InflightTracker:
+    """进行中的调用计数；关闭时拒绝新调用并等待已有调用结束"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self.draining = False
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        with self._lock:
+            if self.draining:
+                raise ServerDraining("服务正在关闭，不再接受新的 LLM 调用，请稍后重试")
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def begin_drain(self):
+        with self._lock:
+            self.draining = True
+
+
+@dataclass
+class TransportConfig:
+    """传输方式配置（命令行参数优先于环境变量）"""
+    transport: str = "stdio"
+    host: str = "127.0.0.1"
+    port: int = 8000
+    path: Optional[str] = None
+    keepalive: float = 75.0
+    gzip_min_bytes: int = 1024
+    json_response: bool = True
+    shutdown_timeout: float = 30.0
+    workers: int = 1
+
+
+def parse_transport_args(argv: Optional[List[str]] = None) -> TransportConfig:
+    """解析命令行参数，未指定的参数取环境变量"""
+    parser = argparse.ArgumentParser(description="BMAD Agent FastMCP Service")
+    parser.add_argument("--transport", choices=TRANSPORTS + ("streamable-http",),
+                        default=os.getenv("MCP_TRANSPORT", "stdio").lower(),
+                        help="传输方式（环境变量 MCP_TRANSPORT，默认 stdio）")
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "127.0.0.1"),
+                        help="监听地址（环境变量 MCP_HOST）")
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", "8000")),
+                        help="监听端口（环境变量 MCP_PORT）")
+    parser.add_argument("--path", default=os.getenv("MCP_PATH") or None,
+                        help="MCP 端点路径（环境变量 MCP_PATH，默认 /mcp，sse 模式为 /sse）")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BMAD_WORKERS", "1")),
+                        help="HTTP 模式下的 worker 进程数（环境变量 BMAD_WORKERS，默认 1）")
+    args = parser.parse_args(argv)
+
+    transport = "http" if args.transport == "streamable-http" else args.transport
+    if transport not in TRANSPORTS:
+        parser.error(f"不支持的传输方式 '{args.transport}'，可选: {', '.join(TRANSPORTS)}")
+    return TransportConfig(
+        transport=transport,
+        host=args.host,
+        port=args.port,
+        path=args.path,
+        keepalive=float(os.getenv("BMAD_HTTP_KEEPALIVE", "75")),
+        gzip_min_bytes=int(os.getenv("BMAD_GZIP_MIN_BYTES", "1024")),
+        json_response=os.getenv("MCP_JSON_RESPONSE", "true").lower() == "true",
+        shutdown_timeout=float(os.getenv("BMAD_SHUTDOWN_TIMEOUT", "30")),
+        workers=max(1, args.workers),
+    )
+
+
+def build_http_app(mcp, config: TransportConfig):
+    """创建带 gzip 压缩的 ASGI 应用"""
+    middleware = [Middleware(GZipMiddleware, minimum_size=config.gzip_min_bytes, compresslevel=6)]
+    if config.transport == "sse":
+        return mcp.http_app(path=config.path, transport="sse", middleware=middleware)
+    return mcp.http_app(path=config.path, transport="http", middleware=middleware,
+                        json_response=config.json_response)
+
+
+class DrainingServer(uvicorn.Server):
+    """关闭前先排空进行中的 LLM 调用的 uvicorn 服务"""
+
+    def __init__(self, config: uvicorn.Config, tracker: InflightTracker, drain_timeout: float):
+        super().__init__(config)
+        self.tracker = tracker
+        self.drain_timeout = drain_timeout
+
+    async def drain(self) -> bool:
+        """拒绝新的 LLM 调用并等待进行中的调用结束，超时或强制退出时返回 False"""
+        self.tracker.begin_drain()
+        deadline = time.monotonic() + self.drain_timeout
+        if self.tracker.active:
+            logger.info("Waiting for %d in-flight LLM call(s) to finish", self.tracker.active)
+        while self.tracker.active and not self.force_exit:
+            if time.monotonic() >= deadline:
+                logger.warning("Shutdown timeout exceeded with %d LLM call(s) still running", self.tracker.active)
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    async def shutdown(self, sockets=None):
+        # 先停止接受新连接，已建立的连接继续发送进行中调用的响应
+        for server in getattr(self, "servers", []):
+            server.close()
+        await self.drain()
+        await super().shutdown(sockets)
+
+
+def _create_server(mcp, config: TransportConfig, tracker: InflightTracker) -> DrainingServer:
+    app = build_http_app(mcp, config)
+    uvicorn_config = uvicorn.Config(
+        app,
+        host=config.host,
+        port=config.port,
+        timeout_keep_alive=int(config.keepalive),
+        timeout_graceful_shutdown=_CONNECTION_CLOSE_TIMEOUT,
+        lifespan="on",
+        log_level=os.getenv("LOG_LEVEL", "INFO").lower(),
+    )
+    return DrainingServer(uvicorn_config, tracker, config.shutdown_timeout)
+
+
+def serve_http(mcp, config: TransportConfig, tracker: InflightTracker):
+    """以 HTTP / SSE 传输运行服务，直到收到关闭信号"""
+    server = _create_server(mcp, config, tracker)
+    logger.info("Starting BMAD MCP server with transport %r on http://%s:%d", config.transport, config.host, config.port)
+    asyncio.run(server.serve())
+
+
+def _run_worker(mcp, config: TransportConfig, tracker: InflightTracker, sock: socket.socket) -> int:
+    """worker 进程主体：在继承的监听 socket 上运行服务"""
+    # 自成进程组：终端的 Ctrl+C 只发给主进程，由主进程统一转发关闭信号
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        asyncio.run(_create_server(mcp, config, tracker).serve(sockets=[sock]))
+        return 0
+    except BaseException:
+        logger.exception("Worker %d crashed", os.getpid())
+        return 1
+
+
+def serve_workers(mcp, config: TransportConfig, tracker: InflightTracker):
+    """
+    预先 fork 多个 worker 进程运行 HTTP 服务
+
+    主进程绑定端口后 fork，worker 共享同一个监听 socket，由内核分配连接；
+    fork 前已加载的模块和目录数据以写时复制的方式在 worker 间共享。
+    """
+    if not hasattr(os, "fork") or config.workers <= 1:
+        if config.workers > 1:
+            logger.warning("Multi-worker mode requires os.fork; running a single process")
+        serve_http(mcp, config, tracker)
+        return
+
+    sock = socket.create_server((config.host, config.port), backlog=2048)
+    sock.set_inheritable(True)
+    # 冻结 fork 前的对象，避免垃圾回收触碰它们导致共享页被复制
+    gc.collect()
+    gc.freeze()
+
+    workers: Dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = _run_worker(mcp, config, tracker, sock)
+            finally:
+                os._exit(code)
+        workers[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info("Starting %d BMAD MCP workers with transport %r on http://%s:%d",
+                config.workers, config.transport, config.host, config.port)
+    for _ in range(config.workers):
+        spawn()
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = workers.pop(pid, None)
+        if started is None or stopping:
+            continue
+        logger.warning("Worker %d exited with status %d, restarting", pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < _MIN_WORKER_LIFETIME:
+            time.sleep(_MIN_WORKER_LIFETIME)
+        if not stopping:
+            spawn()
+    sock.close()
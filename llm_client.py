@@ -9,25 +9,30 @@ BMAD LLM 客户端 - 支持双模式
 可通过环境变量 USE_BUILTIN_LLM 控制模式切换
 """
 
+import importlib.util
 import json
 import logging
 import os
+import threading
+import time
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+from metrics import metrics
+from tracing import tracer, current_span
+
 logger = logging.getLogger(__name__)
 
 # 配置选项：是否使用内置 LLM（默认使用内置 LLM）
 USE_BUILTIN_LLM = os.getenv("USE_BUILTIN_LLM", "true").lower() == "true"
 
-try:
+# 只检查 OpenAI SDK 是否安装，真正的导入推迟到第一次外部 API 调用
+OPENAI_AVAILABLE = importlib.util.find_spec("openai") is not None
+
+def _load_openai_class():
+    """按需导入 OpenAI SDK（导入本身耗时数百毫秒，内置模式下永远不需要）"""
     from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    logger.warning("OpenAI SDK not available. Please install with: pip install openai")
+    return OpenAI
 
 @dataclass
 class LLMResponse:
@@ -49,22 +54,37 @@ class BMADLLMClient:
         """
         self.api_key = api_key
         self.use_builtin_llm = USE_BUILTIN_LLM
+        self._client = None
+        self._client_lock = threading.Lock()
 
         if self.use_builtin_llm:
             logger.info("🔧 使用 Cursor 内置 LLM 模式")
-            self.client = None
         else:
             if not api_key:
                 raise ValueError("外部 API 模式需要提供 API Key")
             if OPENAI_AVAILABLE:
-                self.client = OpenAI(
-                    api_key=api_key,
-                    base_url="https://api.deepseek.com"
-                )
-                logger.info("🌐 使用 DeepSeek API 模式")
+                logger.info("🌐 使用 DeepSeek API 模式（客户端将在首次调用时创建）")
             else:
-                self.client = None
-                logger.error("OpenAI SDK not available")
+                logger.error("OpenAI SDK not available. Please install with: pip install openai")
+
+    @property
+    def client(self):
+        """DeepSeek API 客户端，首次外部调用时才导入 SDK 并建立"""
+        if self._client is not None:
+            current_span().set_attribute("llm.client_cache_hit", True)
+            return self._client
+        if self.use_builtin_llm or not self.api_key or not OPENAI_AVAILABLE:
+            return None
+
+        with self._client_lock:
+            if self._client is None:
+                with tracer.span("llm.connect", backend="deepseek"):
+                    openai_class = _load_openai_class()
+                    self._client = openai_class(
+                        api_key=self.api_key,
+                        base_url="https://api.deepseek.com"
+                    )
+        return self._client
 
     def call_agent(
         self,
@@ -93,7 +113,9 @@ class BMADLLMClient:
         """内置 LLM 模式：返回角色提示让 Cursor LLM 处理"""
 
         # 构建详细的角色提示
-        role_prompt = self._build_builtin_llm_prompt(agent_id, agent_config, task, context)
+        with tracer.span("prompt.build", agent_id=agent_id, mode="builtin_llm") as span:
+            role_prompt = self._build_builtin_llm_prompt(agent_id, agent_config, task, context)
+            span.set_attribute("prompt.chars", len(role_prompt))
 
         return {
             "success": True,
@@ -131,27 +153,38 @@ class BMADLLMClient:
                 "error": "OpenAI SDK not available. Please install with: pip install openai"
             }
 
-        # 构建系统提示
-        system_prompt = self._build_agent_system_prompt(agent_id, agent_config)
+        with tracer.span("prompt.build", agent_id=agent_id, mode="external_api") as span:
+            # 构建系统提示
+            system_prompt = self._build_agent_system_prompt(agent_id, agent_config)
 
-        # 构建用户消息
-        user_message = self._build_user_message(task, context)
+            # 构建用户消息
+            user_message = self._build_user_message(task, context)
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ]
+            messages = [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message}
+            ]
+            span.set_attribute("prompt.chars", len(system_prompt) + len(user_message))
 
+        start = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=4000,
-                stream=False
-            )
+            with tracer.span("llm.request", backend="deepseek", model=model) as span:
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=4000,
+                    stream=False
+                )
 
-            choice = response.choices[0]
+                choice = response.choices[0]
+                usage = response.usage.model_dump() if response.usage else {}
+                span.set_attributes({
+                    "tokens.prompt": usage.get("prompt_tokens", 0),
+                    "tokens.completion": usage.get("completion_tokens", 0),
+                    "finish_reason": choice.finish_reason
+                })
+            metrics.record_llm("deepseek", model, time.perf_counter() - start, False, usage)
 
             return {
                 "success": True,
@@ -159,12 +192,13 @@ class BMADLLMClient:
                 "task": task,
                 "mode": "external_api",
                 "response": choice.message.content,
-                "usage": response.usage.model_dump() if response.usage else {},
+                "usage": usage,
                 "model": response.model,
                 "finish_reason": choice.finish_reason
             }
 
         except Exception as e:
+            metrics.record_llm("deepseek", model, time.perf_counter() - start, True)
             logger.error(f"Agent call failed: {e}")
             return {
                 "success": False,
@@ -389,5 +423,17 @@ def initialize_llm_client(api_key: str = None):
     return llm_client
 
 def get_llm_client() -> Optional[BMADLLMClient]:
-    """获取 LLM 客户端实例"""
-    return llm_client
\ No newline at end of file
+    """获取 LLM 客户端实例，首次调用时按环境变量初始化"""
+    if llm_client is None:
+        try:
+            initialize_llm_client(os.getenv("DEEPSEEK_API_KEY"))
+        except ValueError as e:
+            logger.error(f"LLM 客户端初始化失败: {e}")
+            return None
+    return llm_client
+
+def is_builtin_mode() -> bool:
+    """当前是否为内置 LLM 模式（不触发客户端初始化）"""
+    if llm_client is not None:
+        return llm_client.use_builtin_llm
+    return USE_BUILTIN_LLM
\ No newline at end of file
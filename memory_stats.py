@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 内存诊断
+
+基于 tracemalloc 的快照与差异分析，以及 BMADCore 各数据结构的近似字节数统计，
+用于在长期运行的服务中在线定位内存增长。
+"""
+
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+# 快照统计中忽略的内部帧
+_IGNORED_FILES = (
+    tracemalloc.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+)
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    递归估算对象占用的字节数
+
+    共享对象只计算一次，结果是近似值（不含分配器开销和驻留字符串的共享）。
+    """
+    if seen is None:
+        seen = set()
+
+    total = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        obj_id = id(current)
+        if obj_id in seen:
+            continue
+        seen.add(obj_id)
+
+        try:
+            total += sys.getsizeof(current)
+        except TypeError:
+            continue
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool, type(None))):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        else:
+            instance_dict = getattr(current, "__dict__", None)
+            if instance_dict is not None:
+                stack.append(instance_dict)
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+
+    return total
+
+
+def current_rss_bytes() -> Optional[int]:
+    """读取当前进程的常驻内存（仅 Linux，其他平台返回 None）"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _format_frame(frame) -> str:
+    return f"{frame.filename}:{frame.lineno}"
+
+
+class MemoryTracker:
+    """tracemalloc 快照管理"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.baseline_taken_at: Optional[str] = None
+        self.started_here = False
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10) -> Dict[str, Any]:
+        """开始跟踪内存分配并记录基线快照"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, frames))
+                self.started_here = True
+            self._take_baseline()
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        """停止跟踪并释放快照"""
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            self.baseline = None
+            self.baseline_taken_at = None
+            self.started_here = False
+        return self.status()
+
+    def reset_baseline(self) -> Dict[str, Any]:
+        """以当前状态作为新的基线"""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc 未启动，请先执行 start")
+            self._take_baseline()
+        return self.status()
+
+    def _take_baseline(self):
+        gc.collect()
+        self.baseline = self._snapshot()
+        self.baseline_taken_at = datetime.now().isoformat()
+
+    @staticmethod
+    def _snapshot() -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([
+            tracemalloc.Filter(False, pattern) for pattern in _IGNORED_FILES
+        ])
+
+    def status(self) -> Dict[str, Any]:
+        """当前跟踪状态"""
+        result = {
+            "tracing": tracemalloc.is_tracing(),
+            "baseline_taken_at": self.baseline_taken_at,
+            "rss_bytes": current_rss_bytes()
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            result.update({
+                "traced_current_bytes": current,
+                "traced_peak_bytes": peak,
+                "traceback_limit": tracemalloc.get_traceback_limit()
+            })
+        return result
+
+    def top_allocations(self, top_n: int = 10, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """当前存活内存按分配位置排序"""
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc 未启动，请先执行 start")
+
+        gc.collect()
+        statistics = self._snapshot().statistics(group_by)
+        return [
+            {
+                "location": _format_frame(stat.traceback[0]),
+                "traceback": [_format_frame(frame) for frame in stat.traceback] if group_by == "traceback" else None,
+                "size_bytes": stat.size,
+                "count": stat.count
+            }
+            for stat in statistics[:top_n]
+        ]
+
+    def diff(self, top_n: int = 10, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        """与基线快照对比，按增长字节数排序"""
+        if not tracemalloc.is_tracing() or self.baseline is None:
+            raise RuntimeError("没有基线快照，请先执行 start 或 snapshot")
+
+        gc.collect()
+        statistics = self._snapshot().compare_to(self.baseline, group_by)
+        statistics.sort(key=lambda stat: stat.size_diff, reverse=True)
+        return [
+            {
+                "location": _format_frame(stat.traceback[0]),
+                "traceback": [_format_frame(frame) for frame in stat.traceback] if group_by == "traceback" else None,
+                "size_bytes": stat.size,
+                "size_diff_bytes": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff
+            }
+            for stat in statistics[:top_n]
+        ]
+
+
+def structure_sizes(structures: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """
+    统计各数据结构的近似字节数
+
+    每个结构单独计算（不共享 seen 集合），因此结构之间共享的对象会被重复计入。
+    """
+    result = {}
+    for name, value in structures.items():
+        try:
+            entries = len(value)
+        except TypeError:
+            entries = 1
+        result[name] = {
+            "entries": entries,
+            "approx_bytes": deep_sizeof(value)
+        }
+    return result
+
+
+# 全局内存跟踪器
+memory_tracker = MemoryTracker()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 指标采集
+
+为每个 MCP 工具记录调用次数、错误数、响应大小和固定分桶的延迟直方图，
+LLM 后端延迟单独记录，便于区分工具自身开销和模型耗时。
+支持导出为 JSON 快照或 Prometheus 文本格式。
+"""
+
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+# 是否启用指标采集（关闭后工具函数不做任何包装）
+METRICS_ENABLED = os.getenv("BMAD_METRICS_ENABLED", "true").lower() == "true"
+
+# 延迟分桶上界（秒），与 Prometheus 客户端默认分桶一致并补充了长尾
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+
+class Histogram:
+    """固定分桶直方图，最后一个桶对应 +Inf"""
+
+    __slots__ = ("bounds", "counts", "total", "count", "maximum")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+    def observe(self, value: float):
+        """记录一个观测值"""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.maximum:
+            self.maximum = value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶内线性插值估算分位数（不超过实际观测到的最大值）"""
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                if index >= len(self.bounds):
+                    # 落在 +Inf 桶内时返回观测到的最大值
+                    return self.maximum
+                upper = self.bounds[index]
+                estimate = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                return min(estimate, self.maximum)
+            cumulative += bucket_count
+
+        return self.maximum
+
+    def cumulative_buckets(self) -> List[Tuple[str, int]]:
+        """返回 Prometheus 风格的累积分桶 (le, count)"""
+        result = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds, self.counts):
+            cumulative += bucket_count
+            result.append((_format_float(bound), cumulative))
+        result.append(("+Inf", cumulative + self.counts[-1]))
+        return result
+
+
+class CallStats:
+    """单个工具（或 LLM 后端）的调用统计"""
+
+    __slots__ = ("calls", "errors", "payload_bytes_total", "payload_bytes_max", "latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.payload_bytes_total = 0
+        self.payload_bytes_max = 0
+        self.latency = Histogram()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为 JSON 友好的摘要"""
+        latency = self.latency
+
+        def _ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.calls, 4) if self.calls else 0.0,
+            "latency_ms": {
+                "avg": _ms(latency.total / latency.count) if latency.count else None,
+                "p50": _ms(latency.quantile(0.5)),
+                "p95": _ms(latency.quantile(0.95)),
+                "p99": _ms(latency.quantile(0.99)),
+                "total": _ms(latency.total)
+            },
+            "payload_bytes": {
+                "avg": round(self.payload_bytes_total / self.calls) if self.calls else 0,
+                "max": self.payload_bytes_max,
+                "total": self.payload_bytes_total
+            }
+        }
+
+
+class MetricsRegistry:
+    """进程内指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tools: Dict[str, CallStats] = {}
+        self.llm: Dict[Tuple[str, str], CallStats] = {}
+        self.llm_tokens: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self.started_at = time.time()
+
+    def record_tool(self, name: str, elapsed: float, error: bool, payload_bytes: int):
+        """记录一次工具调用"""
+        with self._lock:
+            stats = self.tools.get(name)
+            if stats is None:
+                stats = self.tools[name] = CallStats()
+            stats.calls += 1
+            stats.errors += 1 if error else 0
+            stats.payload_bytes_total += payload_bytes
+            if payload_bytes > stats.payload_bytes_max:
+                stats.payload_bytes_max = payload_bytes
+            stats.latency.observe(elapsed)
+
+    def record_llm(
+        self,
+        backend: str,
+        model: str,
+        elapsed: float,
+        error: bool,
+        usage: Optional[Dict[str, Any]] = None
+    ):
+        """记录一次 LLM 后端请求（与工具耗时分开统计）"""
+        key = (backend, model)
+        with self._lock:
+            stats = self.llm.get(key)
+            if stats is None:
+                stats = self.llm[key] = CallStats()
+                self.llm_tokens[key] = {"prompt_tokens": 0, "completion_tokens": 0}
+            stats.calls += 1
+            stats.errors += 1 if error else 0
+            stats.latency.observe(elapsed)
+            if usage:
+                tokens = self.llm_tokens[key]
+                tokens["prompt_tokens"] += int(usage.get("prompt_tokens") or 0)
+                tokens["completion_tokens"] += int(usage.get("completion_tokens") or 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取当前指标快照"""
+        with self._lock:
+            tools = {name: stats.to_dict() for name, stats in sorted(self.tools.items())}
+            llm = {}
+            for (backend, model), stats in sorted(self.llm.items()):
+                entry = stats.to_dict()
+                entry.pop("payload_bytes")
+                entry["tokens"] = dict(self.llm_tokens[(backend, model)])
+                llm[f"{backend}/{model}"] = entry
+
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "tools": tools,
+            "llm_backends": llm,
+            "total_calls": sum(entry["calls"] for entry in tools.values()),
+            "total_errors": sum(entry["errors"] for entry in tools.values())
+        }
+
+    def render_prometheus(self) -> str:
+        """渲染为 Prometheus 文本暴露格式"""
+        lines = []
+
+        with self._lock:
+            tools = sorted(self.tools.items())
+            llm = sorted(self.llm.items())
+            llm_tokens = {key: dict(value) for key, value in self.llm_tokens.items()}
+
+        lines.append("# HELP bmad_tool_calls_total Total MCP tool calls.")
+        lines.append("# TYPE bmad_tool_calls_total counter")
+        for name, stats in tools:
+            lines.append(f'bmad_tool_calls_total{{tool="{name}"}} {stats.calls}')
+
+        lines.append("# HELP bmad_tool_errors_total MCP tool calls that raised or returned an error.")
+        lines.append("# TYPE bmad_tool_errors_total counter")
+        for name, stats in tools:
+            lines.append(f'bmad_tool_errors_total{{tool="{name}"}} {stats.errors}')
+
+        lines.append("# HELP bmad_tool_response_bytes_total Serialized response bytes returned by MCP tools.")
+        lines.append("# TYPE bmad_tool_response_bytes_total counter")
+        for name, stats in tools:
+            lines.append(f'bmad_tool_response_bytes_total{{tool="{name}"}} {stats.payload_bytes_total}')
+
+        lines.append("# HELP bmad_tool_latency_seconds MCP tool latency including LLM backend time.")
+        lines.append("# TYPE bmad_tool_latency_seconds histogram")
+        for name, stats in tools:
+            _render_histogram(lines, "bmad_tool_latency_seconds", f'tool="{name}"', stats.latency)
+
+        lines.append("# HELP bmad_llm_requests_total LLM backend requests.")
+        lines.append("# TYPE bmad_llm_requests_total counter")
+        for (backend, model), stats in llm:
+            lines.append(f'bmad_llm_requests_total{{backend="{backend}",model="{model}"}} {stats.calls}')
+
+        lines.append("# HELP bmad_llm_errors_total Failed LLM backend requests.")
+        lines.append("# TYPE bmad_llm_errors_total counter")
+        for (backend, model), stats in llm:
+            lines.append(f'bmad_llm_errors_total{{backend="{backend}",model="{model}"}} {stats.errors}')
+
+        lines.append("# HELP bmad_llm_tokens_total Tokens consumed by LLM backend requests.")
+        lines.append("# TYPE bmad_llm_tokens_total counter")
+        for (backend, model), _ in llm:
+            for kind, value in llm_tokens.get((backend, model), {}).items():
+                kind_label = kind.replace("_tokens", "")
+                lines.append(
+                    f'bmad_llm_tokens_total{{backend="{backend}",model="{model}",kind="{kind_label}"}} {value}'
+                )
+
+        lines.append("# HELP bmad_llm_latency_seconds LLM backend request latency.")
+        lines.append("# TYPE bmad_llm_latency_seconds histogram")
+        for (backend, model), stats in llm:
+            _render_histogram(
+                lines, "bmad_llm_latency_seconds",
+                f'backend="{backend}",model="{model}"', stats.latency
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self.tools.clear()
+            self.llm.clear()
+            self.llm_tokens.clear()
+            self.started_at = time.time()
+
+
+def _format_float(value: float) -> str:
+    """格式化分桶上界，去掉多余的尾随零"""
+    return repr(float(value))
+
+
+def _render_histogram(lines: List[str], name: str, labels: str, histogram: Histogram):
+    """输出一个直方图的 bucket/sum/count 行"""
+    for le, count in histogram.cumulative_buckets():
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.total}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+
+def _is_error_result(result: Any) -> bool:
+    """工具约定：返回 error 字段或 success=False 视为失败"""
+    return isinstance(result, dict) and ("error" in result or result.get("success") is False)
+
+
+# 指标包装的一次调用内计算过大小的响应：[(响应对象, 字节数) 或 None]。
+# 内层的链路追踪和外层的指标包装共用，每个响应只序列化一次；调用结束时随上下文一起释放，
+# 没有指标包装时不缓存
+_payload_cache: contextvars.ContextVar = contextvars.ContextVar("bmad_payload_cache", default=None)
+
+
+def payload_size(result: Any) -> int:
+    """估算工具响应序列化后的字节数"""
+    cache = _payload_cache.get()
+    if cache is not None and cache[0] is not None and cache[0][0] is result:
+        return cache[0][1]
+    try:
+        size = len(json.dumps(result, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        size = 0
+    if cache is not None:
+        cache[0] = (result, size)
+    return size
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+
+def instrument(func=None, *, name: Optional[str] = None, registry: Optional[MetricsRegistry] = None):
+    """
+    为工具函数挂载指标采集
+
+    同时支持同步和异步函数，保留原函数签名供 FastMCP 生成参数模式。
+    """
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        tool_name = name or fn.__name__
+        target = registry or metrics
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                token = _payload_cache.set([None])
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException:
+                    target.record_tool(tool_name, time.perf_counter() - start, True, 0)
+                    raise
+                else:
+                    target.record_tool(
+                        tool_name, time.perf_counter() - start,
+                        _is_error_result(result), payload_size(result)
+                    )
+                    return result
+                finally:
+                    _payload_cache.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _payload_cache.set([None])
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                target.record_tool(tool_name, time.perf_counter() - start, True, 0)
+                raise
+            else:
+                target.record_tool(
+                    tool_name, time.perf_counter() - start,
+                    _is_error_result(result), payload_size(result)
+                )
+                return result
+            finally:
+                _payload_cache.reset(token)
+
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 按需 CPU 性能分析
+
+为选定的 MCP 工具挂载 cProfile，调用耗时超过阈值时写出：
+- <profile_id>.pstats:    可用 pstats / snakeviz 打开的原始数据
+- <profile_id>.collapsed: 折叠栈格式，可直接交给 flamegraph.pl / speedscope 生成火焰图
+
+通过环境变量 BMAD_PROFILE_TOOLS 启用，也可以运行时通过 configure_profiling 工具切换。
+关闭时包装函数只做一次布尔判断。
+
+同一时刻整个进程只分析一个调用：Python 3.12 起 cProfile 基于进程级的 sys.monitoring，
+第二个 enable() 会抛出 ValueError，因此并发的其他调用直接不分析。
+只支持 cProfile，不接入 pyinstrument 等采样分析器：折叠栈由 cProfile 的调用边耗时推算，
+不需要额外依赖，pstats 文件也能直接用现有工具打开。
+"""
+
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+import types
+from collections import defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Set
+
+from utils import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# 性能分析配置
+PROFILE_TOOLS = os.getenv("BMAD_PROFILE_TOOLS", "")  # 逗号分隔的工具名，'*' 表示全部
+PROFILE_THRESHOLD_MS = float(os.getenv("BMAD_PROFILE_THRESHOLD_MS", "100"))
+PROFILE_DIR = Path(os.getenv("BMAD_PROFILE_DIR", str(DATA_DIR / "profiles")))
+
+# 折叠栈展开的最大深度，以及低于该耗时（微秒）的路径不再展开
+COLLAPSED_MAX_DEPTH = 64
+COLLAPSED_MIN_MICROSECONDS = 1
+
+# 进程内同一时刻只允许一个 cProfile 处于启用状态
+_profile_lock = threading.Lock()
+
+
+@types.coroutine
+def _suspend(value):
+    """把协程让出的对象原样交给事件循环，返回恢复时传回的值"""
+    return (yield value)
+
+
+def _function_label(func: tuple) -> str:
+    """将 pstats 函数键转换为可读的帧名"""
+    file_name, line, name = func
+    if file_name == "~":
+        # 内置函数，例如 <built-in method time.sleep>
+        return name
+    return f"{name} ({Path(file_name).name}:{line})"
+
+
+def _collapsed_label(func: tuple) -> str:
+    """折叠栈格式中帧名不能包含分号和空格"""
+    return _function_label(func).replace(";", ":").replace(" ", "_")
+
+
+def stats_to_collapsed(stats: "pstats.Stats") -> List[str]:
+    """
+    将 cProfile 统计转换为折叠栈行
+
+    cProfile 只记录调用边而非完整调用栈，这里按调用边耗时比例把每个函数的
+    自身耗时分摊到从根函数出发的各条路径上，结果与 flameprof 等工具一致。
+    """
+    raw = stats.stats
+    callees: Dict[tuple, List[tuple]] = defaultdict(list)
+    roots = []
+
+    for func, (_, _, _, _, callers) in raw.items():
+        known_callers = [caller for caller in callers if caller in raw]
+        if not known_callers:
+            roots.append(func)
+        for caller in known_callers:
+            callees[caller].append(func)
+
+    samples: Dict[str, int] = defaultdict(int)
+
+    def walk(func: tuple, path: List[str], on_path: Set[tuple], fraction: float, depth: int):
+        _, _, self_time, cumulative_time, _ = raw[func]
+        path.append(_collapsed_label(func))
+        on_path.add(func)
+
+        self_us = int(self_time * fraction * 1e6)
+        if self_us > 0:
+            samples[";".join(path)] += self_us
+
+        if depth < COLLAPSED_MAX_DEPTH:
+            for child in callees.get(func, ()):
+                if child in on_path:
+                    continue
+                child_cumulative = raw[child][3]
+                edge_cumulative = raw[child][4][func][3]
+                if child_cumulative <= 0:
+                    continue
+                child_fraction = fraction * edge_cumulative / child_cumulative
+                if child_fraction * child_cumulative * 1e6 < COLLAPSED_MIN_MICROSECONDS:
+                    continue
+                walk(child, path, on_path, child_fraction, depth + 1)
+
+        on_path.discard(func)
+        path.pop()
+
+    for root in roots:
+        walk(root, [], set(), 1.0, 0)
+
+    return [f"{stack} {count}" for stack, count in sorted(samples.items())]
+
+
+class ToolProfiler:
+    """MCP 工具的按需性能分析器"""
+
+    def __init__(
+        self,
+        tools: str = PROFILE_TOOLS,
+        threshold_ms: float = PROFILE_THRESHOLD_MS,
+        output_dir: Path = PROFILE_DIR,
+        max_index: int = 200
+    ):
+        self.tools: Set[str] = {name.strip() for name in tools.split(",") if name.strip()}
+        self.enabled = bool(self.tools)
+        self.threshold_ms = threshold_ms
+        self.output_dir = output_dir
+        self.profiles = deque(maxlen=max_index)
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    def configure(
+        self,
+        enabled: Optional[bool] = None,
+        tools: Optional[List[str]] = None,
+        threshold_ms: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """运行时调整性能分析配置"""
+        if tools is not None:
+            self.tools = {name.strip() for name in tools if name.strip()}
+        if threshold_ms is not None:
+            self.threshold_ms = max(0.0, float(threshold_ms))
+        if enabled is not None:
+            self.enabled = enabled
+        if self.enabled and not self.tools:
+            self.tools = {"*"}
+        return self.settings()
+
+    def settings(self) -> Dict[str, Any]:
+        """当前配置"""
+        return {
+            "enabled": self.enabled,
+            "tools": sorted(self.tools),
+            "threshold_ms": self.threshold_ms,
+            "output_dir": str(self.output_dir),
+            "profiler": "cProfile"
+        }
+
+    def should_profile(self, tool_name: str) -> bool:
+        """判断当前调用是否需要分析（已有调用在分析时不再分析）"""
+        if not self.enabled or _profile_lock.locked():
+            return False
+        return "*" in self.tools or tool_name in self.tools
+
+    def profiled(self, func=None, *, name: Optional[str] = None):
+        """装饰器：在启用时用 cProfile 包裹工具函数"""
+        def decorator(fn):
+            tool_name = name or fn.__name__
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled or not self.should_profile(tool_name):
+                        return await fn(*args, **kwargs)
+                    session = self._begin()
+                    if session is None:
+                        return await fn(*args, **kwargs)
+                    profile, start = session
+                    try:
+                        return await self._profile_steps(profile, fn(*args, **kwargs))
+                    finally:
+                        self._end(tool_name, profile, start)
+
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or not self.should_profile(tool_name):
+                    return fn(*args, **kwargs)
+                session = self._begin()
+                if session is None:
+                    return fn(*args, **kwargs)
+                profile, start = session
+                profile.enable()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self._end(tool_name, profile, start)
+
+            return wrapper
+
+        if func is not None:
+            return decorator(func)
+        return decorator
+
+    def _begin(self):
+        """占用进程内的分析器并确认可以启用；已被占用时返回 None，调用不做分析"""
+        import cProfile
+
+        if not _profile_lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            # 其他工具（调试器、覆盖率）已占用 sys.monitoring 时 enable() 会失败
+            profile.enable()
+            profile.disable()
+        except ValueError:
+            _profile_lock.release()
+            return None
+        return profile, time.perf_counter()
+
+    @staticmethod
+    async def _profile_steps(profile: "cProfile.Profile", coro):
+        """
+        逐步驱动协程，只在协程自身执行时启用分析
+
+        await 期间事件循环运行的其他任务不计入结果；耗时阈值仍按整个调用的墙钟时间判断。
+        """
+        value, error = None, None
+        while True:
+            profile.enable()
+            try:
+                if error is None:
+                    yielded = coro.send(value)
+                else:
+                    yielded = coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                profile.disable()
+            try:
+                value, error = await _suspend(yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+    def _end(self, tool_name: str, profile: "cProfile.Profile", start: float):
+        profile.disable()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        _profile_lock.release()
+
+        if elapsed_ms < self.threshold_ms:
+            return
+
+        try:
+            self._write_profile(tool_name, profile, elapsed_ms)
+        except Exception as e:
+            logger.warning(f"写出性能分析结果失败 ({tool_name}): {e}")
+
+    def _write_profile(self, tool_name: str, profile: "cProfile.Profile", elapsed_ms: float):
+        import pstats
+
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+
+        profile_id = f"{tool_name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{sequence}"
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+        pstats_file = self.output_dir / f"{profile_id}.pstats"
+        collapsed_file = self.output_dir / f"{profile_id}.collapsed"
+
+        profile.dump_stats(str(pstats_file))
+        stats = pstats.Stats(profile)
+        with open(collapsed_file, 'w', encoding='utf-8') as f:
+            f.write("\n".join(stats_to_collapsed(stats)))
+            f.write("\n")
+
+        self.profiles.append({
+            "profile_id": profile_id,
+            "tool": tool_name,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "created_at": datetime.now().isoformat(),
+            "pstats_file": str(pstats_file),
+            "collapsed_file": str(collapsed_file)
+        })
+
+    def list_profiles(self, tool_name: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """列出已写出的分析结果（新的在前）"""
+        profiles = [p for p in reversed(self.profiles) if not tool_name or p["tool"] == tool_name]
+        if not profiles and self.output_dir.exists():
+            # 进程重启后从目录中恢复索引
+            for pstats_file in sorted(self.output_dir.glob("*.pstats"), key=lambda p: p.stat().st_mtime, reverse=True):
+                profile_tool = pstats_file.stem.split("-", 1)[0]
+                if tool_name and profile_tool != tool_name:
+                    continue
+                profiles.append({
+                    "profile_id": pstats_file.stem,
+                    "tool": profile_tool,
+                    "elapsed_ms": None,
+                    "created_at": datetime.fromtimestamp(pstats_file.stat().st_mtime).isoformat(),
+                    "pstats_file": str(pstats_file),
+                    "collapsed_file": str(pstats_file.with_suffix(".collapsed"))
+                })
+        return profiles[:limit]
+
+    def top_functions(self, profile_id: str, top_n: int = 15) -> Optional[List[Dict[str, Any]]]:
+        """读取分析结果中累计耗时最高的函数"""
+        if Path(profile_id).name != profile_id:
+            return None
+
+        pstats_file = self.output_dir / f"{profile_id}.pstats"
+        if not pstats_file.exists():
+            return None
+
+        import pstats
+
+        stats = pstats.Stats(str(pstats_file))
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "function": _function_label(func),
+                "calls": nc,
+                "self_ms": round(tt * 1000, 3),
+                "cumulative_ms": round(ct * 1000, 3)
+            }
+            for func, (_, nc, tt, ct, _) in entries[:top_n]
+        ]
+
+
+# 全局性能分析器
+profiler = ToolProfiler()
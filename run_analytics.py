@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 历史运行分析
+
+每个完成的步骤是一行，按列存放在 .npy 文件中（运行、工作流程、步骤序号、智能体、
+耗时、完成时间、产物数）；字符串列以编码存储，编码表是逐行追加的文本文件。
+- 追加只写列文件末尾并改写固定长度的 .npy 文件头，最后更新 meta.json 中的行数，
+  读取方以 meta.json 为准，不会读到写了一半的行
+- 查询时列文件以 memmap 打开，过滤、分组、排序和分位数都是向量化运算；
+  未安装 NumPy 时退化为纯 Python 实现，结果相同
+"""
+
+import ast
+import importlib.util
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Any, Iterable, Iterator, Optional, Tuple
+
+from utils import file_lock
+
+# NumPy 只在查询时导入，避免拖慢服务启动
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+# 列名 -> (.npy 类型描述, array 类型码)
+COLUMNS = {
+    "run": ("<i4", "i"),
+    "workflow": ("<i4", "i"),
+    "step": ("<i4", "i"),
+    "agent": ("<i4", "i"),
+    "duration": ("<f8", "d"),
+    "completed_at": ("<f8", "d"),
+    "artifacts": ("<i4", "i"),
+}
+# 以编码存储的字符串列
+DICTIONARY_COLUMNS = ("run", "workflow", "agent")
+
+# 步骤级指标和运行级指标（每次运行一行，先按运行汇总步骤）
+STEP_METRICS = ("duration", "artifacts")
+RUN_METRICS = ("run_duration", "run_steps")
+METRICS = STEP_METRICS + RUN_METRICS
+# 运行级指标可用的分组维度
+GROUP_FIELDS = ("workflow", "agent", "step", "run")
+RUN_GROUP_FIELDS = ("workflow", "run")
+
+DEFAULT_PERCENTILES = (50, 90, 95)
+
+# .npy 文件头固定为 128 字节，行数变化时可以原地改写
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(descr: str, rows: int) -> bytes:
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({rows},), }}"
+    padding = _NPY_HEADER_SIZE - len(_NPY_MAGIC) - 2 - len(header) - 1
+    return _NPY_MAGIC + struct.pack("<H", len(header) + padding + 1) + (header + " " * padding + "\n").encode("latin1")
+
+
+def _read_npy(path: Path, typecode: str, rows: int) -> array:
+    """不依赖 NumPy 读取列文件的前 rows 行"""
+    values = array(typecode)
+    with open(path, "rb") as f:
+        if f.read(len(_NPY_MAGIC)) != _NPY_MAGIC:
+            raise ValueError(f"不是本模块写入的 .npy 文件: {path}")
+        header_length = struct.unpack("<H", f.read(2))[0]
+        descr = ast.literal_eval(f.read(header_length).decode("latin1"))["descr"]
+        values.frombytes(f.read(rows * values.itemsize))
+    if descr[0] == "<" and sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _percentiles(ordered: List[float], fractions: List[float]) -> List[float]:
+    """已排序样本的分位数（线性插值，与 numpy.percentile 默认方法一致）"""
+    last = len(ordered) - 1
+    result = []
+    for fraction in fractions:
+        position = last * fraction
+        lower = int(position)
+        upper = min(lower + 1, last)
+        result.append(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower))
+    return result
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def rows_from_state(
+    records: Iterable[Tuple[Optional[str], Any]],
+    run_id_of: Callable[[Dict[str, Any]], Optional[str]],
+    step_agent: Callable[[str, int], Optional[str]]
+) -> Iterator[Dict[str, Any]]:
+    """
+    从工作流程状态记录（state_codec.read_state 的输出）生成步骤行
+
+    步骤耗时是相邻两次 completed_at 之差，第一个步骤从 started_at 算起。
+
+    Args:
+        records: (列表名, 条目) 记录，第一条是状态主体
+        run_id_of: 由状态主体得到运行ID
+        step_agent: (工作流程ID, 步骤序号) -> 智能体，条目中没有步骤定义时使用
+    """
+    run_id = workflow_id = None
+    previous = None
+    for key, entry in records:
+        if key is None:
+            run_id = run_id_of(entry)
+            workflow_id = str(entry.get("workflow_id") or "")
+            previous = _timestamp(entry.get("started_at"))
+            continue
+        if key != "completed_steps" or not isinstance(entry, dict):
+            continue
+        completed_at = _timestamp(entry.get("completed_at"))
+        if completed_at is None:
+            continue
+        step = entry.get("step") if isinstance(entry.get("step"), dict) else {}
+        step_index = entry.get("step_index", step.get("index", -1))
+        agent = step.get("agent") or step_agent(workflow_id, step_index)
+        if previous is not None and completed_at >= previous:
+            yield {
+                "run": run_id,
+                "workflow": workflow_id,
+                "step": int(step_index),
+                "agent": str(agent) if agent else None,
+                "duration": completed_at - previous,
+                "completed_at": completed_at,
+                "artifacts": len(entry.get("artifacts") or []),
+            }
+        previous = completed_at
+
+
+class RunAnalytics:
+    """按列存储的步骤指标"""
+
+    def __init__(self, root: Path, use_numpy: bool = NUMPY_AVAILABLE):
+        self.root = root
+        self.use_numpy = use_numpy
+        self._lock = threading.Lock()
+        self._signature = None
+        self.rows = 0
+        # 编码表：列名 -> 值列表 / 值 -> 编码
+        self._values: Dict[str, List[str]] = {name: [] for name in DICTIONARY_COLUMNS}
+        self._codes: Dict[str, Dict[str, int]] = {name: {} for name in DICTIONARY_COLUMNS}
+        # 列名 -> 已提交（meta.json 计入）的编码表文件字节数
+        self._dictionary_bytes: Dict[str, int] = {name: 0 for name in DICTIONARY_COLUMNS}
+        self._cache: Dict[Any, Dict[str, Any]] = {}
+        # 列名 -> 按值升序的行序号（NumPy 数组）
+        self._orders: Dict[str, Any] = {}
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.root / "meta.json"
+
+    def _column_path(self, name: str) -> Path:
+        return self.root / f"{name}.npy"
+
+    def _dictionary_path(self, name: str) -> Path:
+        return self.root / f"{name}.dict"
+
+    def _refresh(self):
+        """meta.json 变化时（其他进程写入）重新加载行数和编码表"""
+        try:
+            stat = self._meta_path.stat()
+        except FileNotFoundError:
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        for name in DICTIONARY_COLUMNS:
+            count = meta["dictionaries"].get(name, 0)
+            values: List[str] = []
+            size = 0
+            if count:
+                with open(self._dictionary_path(name), "rb") as f:
+                    for line in f:
+                        if len(values) == count:
+                            break
+                        values.append(json.loads(line))
+                        size += len(line)
+            self._values[name] = values
+            self._dictionary_bytes[name] = size
+            self._codes[name] = {value: code for code, value in enumerate(values)}
+        self.rows = meta["rows"]
+        self._signature = signature
+        self._cache.clear()
+        self._orders.clear()
+
+    def has_run(self, run_id: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return run_id in self._codes["run"]
+
+    def append(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """追加步骤行，返回追加的行数（多进程追加由文件锁串行化）"""
+        with self._lock, file_lock(self.root / ".lock"):
+            self._refresh()
+            committed = {name: len(self._values[name]) for name in DICTIONARY_COLUMNS}
+            try:
+                return self._append(rows)
+            except BaseException:
+                # 未提交的新值从编码表中撤回
+                for name, count in committed.items():
+                    for value in self._values[name][count:]:
+                        del self._codes[name][value]
+                    del self._values[name][count:]
+                raise
+
+    def _append(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """写入列文件和编码表，最后提交 meta.json（调用方持有锁）"""
+        buffers = {name: array(typecode) for name, (_, typecode) in COLUMNS.items()}
+        new_values: Dict[str, List[str]] = {name: [] for name in DICTIONARY_COLUMNS}
+        for row in rows:
+            for name, buffer in buffers.items():
+                value = row.get(name)
+                if name in DICTIONARY_COLUMNS:
+                    if value is None:
+                        buffer.append(-1)
+                        continue
+                    value = str(value)
+                    code = self._codes[name].get(value)
+                    if code is None:
+                        code = self._codes[name][value] = len(self._values[name])
+                        self._values[name].append(value)
+                        new_values[name].append(value)
+                    buffer.append(code)
+                else:
+                    buffer.append(value if value is not None else -1)
+        count = len(buffers["run"])
+        if not count:
+            return 0
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        dictionary_bytes = dict(self._dictionary_bytes)
+        for name, values in new_values.items():
+            if values:
+                path = self._dictionary_path(name)
+                data = "".join(json.dumps(value, ensure_ascii=False) + "\n" for value in values).encode("utf-8")
+                with open(path, "r+b" if path.exists() else "w+b") as f:
+                    # 丢弃之前未提交的追加留下的行，编码与行号保持一致
+                    f.seek(dictionary_bytes[name])
+                    f.truncate()
+                    f.write(data)
+                dictionary_bytes[name] += len(data)
+
+        rows_after = self.rows + count
+        for name, buffer in buffers.items():
+            descr = COLUMNS[name][0]
+            if sys.byteorder == "big":
+                buffer.byteswap()
+            path = self._column_path(name)
+            with open(path, "r+b" if path.exists() else "w+b") as f:
+                f.seek(_NPY_HEADER_SIZE + self.rows * buffer.itemsize)
+                f.truncate()
+                buffer.tofile(f)
+                # 数据写完后再更新文件头中的行数
+                f.seek(0)
+                f.write(_npy_header(descr, rows_after))
+
+        meta = {
+            "version": 1,
+            "rows": rows_after,
+            "dictionaries": {name: len(self._values[name]) for name in DICTIONARY_COLUMNS},
+        }
+        fd, temp_name = tempfile.mkstemp(prefix=".meta.", suffix=".tmp", dir=self.root)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp_name, self._meta_path)
+
+        self.rows = rows_after
+        self._dictionary_bytes = dictionary_bytes
+        stat = self._meta_path.stat()
+        self._signature = (stat.st_mtime_ns, stat.st_size)
+        self._cache.clear()
+        self._orders.clear()
+        return count
+
+    def _load(self, names: Iterable[str]) -> Dict[str, Any]:
+        if self.use_numpy:
+            import numpy as np
+
+            return {name: np.load(self._column_path(name), mmap_mode="r")[:self.rows] for name in names}
+        return {name: _read_npy(self._column_path(name), COLUMNS[name][1], self.rows) for name in names}
+
+    def analyze(
+        self,
+        group_by: Iterable[str] = ("workflow",),
+        metric: str = "duration",
+        percentiles: Iterable[float] = DEFAULT_PERCENTILES,
+        workflow_id: Optional[str] = None,
+        agent: Optional[str] = None,
+        since: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        分组统计
+
+        Args:
+            group_by: 分组维度（workflow / agent / step / run），step 按 (工作流程, 步骤序号) 分组
+            metric: duration / artifacts（每个步骤一个值），run_duration / run_steps（每次运行一个值）
+            percentiles: 分位数（0-100）
+            workflow_id: 只统计该工作流程
+            agent: 只统计该智能体的步骤
+            since: 只统计该时间（ISO 格式）之后完成的步骤
+            limit: 最多返回的组数
+
+        Returns:
+            每组的样本数、平均值、最小值、最大值和分位数，按样本数降序
+        """
+        group_by = tuple(dict.fromkeys(group_by))
+        percentiles = tuple(float(value) for value in percentiles)
+        if metric not in METRICS:
+            raise ValueError(f"不支持的指标 '{metric}'，可选: {', '.join(METRICS)}")
+        allowed = RUN_GROUP_FIELDS if metric in RUN_METRICS else GROUP_FIELDS
+        unknown = [field for field in group_by if field not in allowed]
+        if unknown:
+            raise ValueError(f"指标 {metric} 不支持按 {', '.join(unknown)} 分组，可选: {', '.join(allowed)}")
+        if any(not 0 <= value <= 100 for value in percentiles):
+            raise ValueError("分位数必须在 0 到 100 之间")
+        since_ts = _timestamp(since)
+        if since and since_ts is None:
+            raise ValueError(f"无法解析时间 '{since}'")
+
+        with self._lock:
+            self._refresh()
+            key = (group_by, metric, percentiles, workflow_id, agent, since_ts, limit)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+
+            result = {
+                "metric": metric,
+                "group_by": list(group_by),
+                "percentiles": list(percentiles),
+                "rows": self.rows,
+                "backend": "numpy" if self.use_numpy else "python",
+                "groups": []
+            }
+            filters = {}
+            for name, value in (("workflow", workflow_id), ("agent", agent)):
+                if value is not None:
+                    filters[name] = self._codes[name].get(value)
+                    if filters[name] is None:
+                        return result
+
+            if self.rows:
+                # step 维度由工作流程和步骤序号两列组成
+                dimensions = [name for field in group_by for name in (("workflow", "step") if field == "step" else (field,))]
+                dimensions = list(dict.fromkeys(dimensions))
+                value_column = "duration" if metric in ("duration", "run_duration") else "artifacts"
+                needed = set(dimensions) | set(filters) | {value_column}
+                if metric in RUN_METRICS:
+                    needed.add("run")
+                if since_ts is not None:
+                    needed.add("completed_at")
+                columns = self._load(needed)
+                compute = self._groups_numpy if self.use_numpy else self._groups_python
+                groups, matched, total_groups = compute(
+                    columns, dimensions, metric, value_column, percentiles, filters, since_ts, limit)
+                result["groups"] = [self._label(group, dimensions, group_by, percentiles) for group in groups]
+                # 步骤级指标为匹配的行数，运行级指标为匹配的运行数
+                result["matched"] = matched
+                result["total_groups"] = total_groups
+
+            self._cache[key] = result
+            return result
+
+    def _label(self, group: Tuple, dimensions: List[str], group_by: Tuple[str, ...],
+               percentiles: Tuple[float, ...]) -> Dict[str, Any]:
+        codes, count, total, low, high, values = group
+        decoded = {}
+        for name, code in zip(dimensions, codes):
+            if name in DICTIONARY_COLUMNS:
+                decoded[name] = self._values[name][code] if code >= 0 else None
+            else:
+                decoded[name] = int(code)
+        entry = {field: decoded[field] for field in group_by if field != "step"}
+        if "step" in group_by:
+            entry["workflow"] = decoded["workflow"]
+            entry["step"] = decoded["step"]
+        entry.update({
+            "count": int(count),
+            "mean": round(float(total) / count, 3),
+            "min": round(float(low), 3),
+            "max": round(float(high), 3),
+            **{f"p{value:g}": round(float(result), 3) for value, result in zip(percentiles, values)}
+        })
+        return entry
+
+    def _value_order(self, name: str, column) -> Any:
+        order = self._orders.get(name)
+        if order is None:
+            import numpy as np
+
+            order = self._orders[name] = np.argsort(column, kind="stable")
+        return order
+
+    def _groups_numpy(self, columns, dimensions, metric, value_column, percentiles, filters, since_ts, limit):
+        import numpy as np
+
+        mask = None
+        for name, code in filters.items():
+            condition = columns[name] == code
+            mask = condition if mask is None else mask & condition
+        if since_ts is not None:
+            condition = columns["completed_at"] >= since_ts
+            mask = condition if mask is None else mask & condition
+
+        if metric in RUN_METRICS:
+            # 先按运行汇总：每次运行一行（运行编码是连续整数，直接 bincount）；
+            # 维度取该运行某一行的值，同一运行只属于一个工作流程
+            runs = np.asarray(columns["run"])
+            weights = np.asarray(columns[value_column]) if metric == "run_duration" else None
+            if mask is not None:
+                runs = runs[mask]
+                weights = weights[mask] if weights is not None else None
+            steps = np.bincount(runs)
+            present = np.flatnonzero(steps)
+            values = (np.bincount(runs, weights=weights) if weights is not None else steps)[present].astype(np.float64)
+            dimension_codes = {}
+            for name in dimensions:
+                per_run = np.full(len(steps), -1, dtype=np.int64)
+                column = np.asarray(columns[name])
+                per_run[runs] = column[mask] if mask is not None else column
+                dimension_codes[name] = per_run[present]
+            # 值升序
+            order = np.argsort(values, kind="stable")
+        else:
+            # 值升序的行序号与查询无关，按列缓存；过滤只需从中挑出匹配的行
+            order = self._value_order(value_column, columns[value_column])
+            if mask is not None:
+                order = order[mask[order]]
+            values = np.asarray(columns[value_column])
+            dimension_codes = {name: np.asarray(columns[name]) for name in dimensions}
+        values = values[order].astype(np.float64, copy=False)
+        dimension_codes = {name: codes[order].astype(np.int64) for name, codes in dimension_codes.items()}
+        if not len(values):
+            return [], 0, 0
+
+        # 各维度编码组合为一个整数键（-1 表示空值，先平移到 0）
+        keys = np.zeros(len(values), dtype=np.int64)
+        bases = []
+        for name in dimensions:
+            codes = dimension_codes[name] + 1
+            base = int(codes.max()) + 1
+            keys = keys * base + codes
+            bases.append(base)
+
+        # 按键稳定排序后每组内的值仍然升序；键范围小时用 int16 走基数排序
+        sortable = keys.astype(np.int16) if bases and keys.max() < 2 ** 15 else keys
+        order = np.argsort(sortable, kind="stable")
+        keys, values = keys[order], values[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        counts = np.diff(np.append(starts, len(keys)))
+        ends = starts + counts - 1
+        totals = np.add.reduceat(values, starts)
+
+        quantiles = []
+        for value in percentiles:
+            position = (counts - 1) * (value / 100.0)
+            offset = np.floor(position)
+            lower = starts + offset.astype(np.int64)
+            upper = np.minimum(lower + 1, ends)
+            quantiles.append(values[lower] + (values[upper] - values[lower]) * (position - offset))
+
+        group_keys = keys[starts]
+        decoded = []
+        for base in reversed(bases):
+            decoded.append(group_keys % base - 1)
+            group_keys = group_keys // base
+        decoded.reverse()
+
+        ranking = np.argsort(-counts, kind="stable")[:limit]
+        groups = [
+            (
+                tuple(int(codes[i]) for codes in decoded),
+                int(counts[i]), float(totals[i]), float(values[starts[i]]), float(values[ends[i]]),
+                [float(column[i]) for column in quantiles]
+            )
+            for i in ranking
+        ]
+        return groups, len(values), len(starts)
+
+    def _groups_python(self, columns, dimensions, metric, value_column, percentiles, filters, since_ts, limit):
+        value_data = columns[value_column]
+        indices = range(self.rows)
+        for name, code in filters.items():
+            data = columns[name]
+            indices = [i for i in indices if data[i] == code]
+        if since_ts is not None:
+            timestamps = columns["completed_at"]
+            indices = [i for i in indices if timestamps[i] >= since_ts]
+
+        samples: Dict[Tuple[int, ...], List[float]] = {}
+        if metric in RUN_METRICS:
+            runs = columns["run"]
+            per_run: Dict[int, List[Any]] = {}
+            for i in indices:
+                entry = per_run.get(runs[i])
+                if entry is None:
+                    entry = per_run[runs[i]] = [tuple(columns[name][i] for name in dimensions), 0.0]
+                entry[1] += value_data[i] if metric == "run_duration" else 1
+            for key, total in per_run.values():
+                samples.setdefault(key, []).append(float(total))
+        else:
+            for i in indices:
+                key = tuple(columns[name][i] for name in dimensions)
+                samples.setdefault(key, []).append(float(value_data[i]))
+
+        fractions = [value / 100.0 for value in percentiles]
+        ranked = sorted(sorted(samples), key=lambda key: -len(samples[key]))[:limit]
+        groups = []
+        for key in ranked:
+            ordered = sorted(samples[key])
+            groups.append((key, len(ordered), sum(ordered), ordered[0], ordered[-1], _percentiles(ordered, fractions)))
+        return groups, sum(len(values) for values in samples.values()), len(samples)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 目录全文检索
+
+内存倒排索引 + BM25 排序，覆盖智能体、工作流程、任务和模板。
+分词对中英文混排友好：拉丁字母和数字按单词切分，中日韩文字按相邻二元组切分。
+索引按条目内容版本增量更新，目录重载时只重新分词发生变化的条目。
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Any, Optional, Tuple
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 假名、中日韩统一表意文字（含扩展 A 和兼容区）、韩文音节
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_PATTERN = re.compile(rf"[a-z0-9_]+|[{_CJK_RANGES}]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为检索词
+
+    英文单词转为小写，中日韩连续文字切分为二元组（单字按单字保留），
+    这样无需词典也能匹配 "需求分析" 与 "分析需求" 中的公共片段。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        run = match.group()
+        if run[0].isascii() or len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class SearchIndex:
+    """BM25 倒排索引"""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        # doc_id -> (kind, version, length, meta)
+        self.documents: Dict[str, Tuple[str, str, int, Dict[str, Any]]] = {}
+        # term -> {doc_id: term_frequency}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # doc_id -> 文档包含的词，删除时只清理这些倒排表
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.total_length = 0
+        # doc_id -> (kind, BM25 长度归一化项)，文档集合变化后在下次查询时重算
+        self._norms: Optional[Dict[str, Tuple[str, float]]] = None
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def upsert(self, doc_id: str, kind: str, version: str, text: str,
+               meta: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        添加或更新文档
+
+        Returns:
+            版本未变化时返回 False（不重新分词）
+        """
+        existing = self.documents.get(doc_id)
+        if existing and existing[1] == version:
+            return False
+
+        frequencies = Counter(tokenize(text))
+        length = sum(frequencies.values())
+
+        with self._lock:
+            if existing:
+                self._remove_locked(doc_id)
+            for term, frequency in frequencies.items():
+                self.postings.setdefault(term, {})[doc_id] = frequency
+            self.documents[doc_id] = (kind, version, length, meta or {})
+            self._doc_terms[doc_id] = tuple(frequencies)
+            self.total_length += length
+            self._norms = None
+        return True
+
+    def remove(self, doc_id: str) -> bool:
+        """删除文档"""
+        with self._lock:
+            if doc_id not in self.documents:
+                return False
+            self._remove_locked(doc_id)
+            return True
+
+    def _remove_locked(self, doc_id: str):
+        _, _, length, _ = self.documents.pop(doc_id)
+        self.total_length -= length
+        self._norms = None
+        for term in self._doc_terms.pop(doc_id, ()):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+
+    def sync(
+        self,
+        versions: Dict[str, str],
+        loader: Callable[[str], Tuple[str, Dict[str, Any]]]
+    ) -> Dict[str, int]:
+        """
+        按条目版本同步索引
+
+        Args:
+            versions: 文档ID（"kind:name" 形式）到内容版本的映射
+            loader: 根据文档ID返回 (文本, 元数据)，只对新增或变化的条目调用
+
+        Returns:
+            新增、更新、删除和未变化的文档数
+        """
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+        for doc_id in [doc_id for doc_id in self.documents if doc_id not in versions]:
+            self.remove(doc_id)
+            stats["removed"] += 1
+
+        for doc_id, version in versions.items():
+            existing = self.documents.get(doc_id)
+            if existing and existing[1] == version:
+                stats["unchanged"] += 1
+                continue
+            text, meta = loader(doc_id)
+            self.upsert(doc_id, doc_id.split(":", 1)[0], version, text, meta)
+            stats["updated" if existing else "added"] += 1
+
+        return stats
+
+    def _compute_norms(self) -> Dict[str, Tuple[str, float]]:
+        average_length = self.total_length / len(self.documents) or 1.0
+        self._norms = {
+            doc_id: (kind, self.k1 * (1 - self.b + self.b * length / average_length))
+            for doc_id, (kind, _, length, _) in self.documents.items()
+        }
+        return self._norms
+
+    def search(self, query: str, kinds: Optional[Iterable[str]] = None,
+               top_k: int = 10) -> List[Dict[str, Any]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            kinds: 可选的类型过滤（agent / workflow / task / template）
+            top_k: 返回结果数
+
+        Returns:
+            按得分降序排列的结果
+        """
+        terms = set(tokenize(query))
+        if not terms or top_k <= 0:
+            return []
+
+        kind_filter = set(kinds) if kinds else None
+        with self._lock:
+            document_count = len(self.documents)
+            if not document_count:
+                return []
+            norms = self._norms if self._norms is not None else self._compute_norms()
+
+            scores: Dict[str, float] = {}
+            k1_plus_1 = self.k1 + 1
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (document_count - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, frequency in posting.items():
+                    kind, norm = norms[doc_id]
+                    if kind_filter is not None and kind not in kind_filter:
+                        continue
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * k1_plus_1 / (frequency + norm)
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [
+                {
+                    "id": doc_id.split(":", 1)[1],
+                    "kind": self.documents[doc_id][0],
+                    "score": round(score, 4),
+                    **self.documents[doc_id][3]
+                }
+                for doc_id, score in best
+            ]
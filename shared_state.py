@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 多进程共享的工作流程状态
+
+多 worker 模式下每个进程都有自己的 BMADCore，当前智能体、当前工作流程和工作流程状态
+保存在一个 SQLite 数据库（WAL 模式）中，按 revision 同步：
+- 每次工具调用前比较数据库中的 revision，落后时只拉取之后的 JSON Patch 操作并回放，
+  操作日志不连续（状态被整体替换或日志已截断）时才读取完整状态
+- 修改状态的工具在 BEGIN IMMEDIATE 事务中执行：先同步，执行后把新的操作和状态写回，
+  多个 worker 的修改因此串行化，revision 全局单调递增
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, Optional, Tuple
+
+# 数据库中保留的操作条数（与 StateJournal 的默认长度一致）
+MAX_OPS = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revision INTEGER NOT NULL,
+    base_revision INTEGER NOT NULL,
+    current_agent TEXT,
+    current_workflow TEXT,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ops (
+    revision INTEGER PRIMARY KEY,
+    ops TEXT NOT NULL
+);
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class SharedStateStore:
+    """
+    SQLite 中的共享会话状态
+
+    core 需要有 current_agent、current_workflow、workflow_state 和 state_journal 属性（即 BMADCore）。
+    """
+
+    def __init__(self, db_file: Path, max_ops: int = MAX_OPS):
+        self.db_file = db_file
+        self.max_ops = max_ops
+        self._local = threading.local()
+        # 同一进程内的同步和写事务互斥，避免重复回放
+        self._lock = threading.RLock()
+        # 本进程的状态可能与数据库不一致（写事务失败），下次同步时完整读取
+        self._stale = False
+
+    def _connection(self) -> sqlite3.Connection:
+        # 连接不能跨 fork 使用，按 (进程, 线程) 创建
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(str(self.db_file), timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def initialize(self, core):
+        """用 core 的当前状态覆盖数据库（启动 worker 前在主进程中调用）"""
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connection()
+        connection.executescript(_SCHEMA)
+        with self._lock:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute("DELETE FROM ops")
+                self._write_full(connection, core)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def _write_full(self, connection: sqlite3.Connection, core):
+        journal = core.state_journal
+        connection.execute(
+            "INSERT OR REPLACE INTO session (id, revision, base_revision, current_agent, current_workflow, state) "
+            "VALUES (1, ?, ?, ?, ?, ?)",
+            (journal.revision, journal.base_revision, core.current_agent, core.current_workflow,
+             _dumps(core.workflow_state))
+        )
+
+    def _head(self, connection: sqlite3.Connection) -> Tuple[int, int, Optional[str], Optional[str]]:
+        row = connection.execute(
+            "SELECT revision, base_revision, current_agent, current_workflow FROM session WHERE id = 1"
+        ).fetchone()
+        if row is None:
+            raise RuntimeError("共享状态数据库未初始化")
+        return row
+
+    def pull(self, core) -> bool:
+        """把数据库中更新的状态同步到 core，返回是否有变化"""
+        with self._lock:
+            return self._pull(self._connection(), core)
+
+    def _pull(self, connection: sqlite3.Connection, core) -> bool:
+        revision, base_revision, current_agent, current_workflow = self._head(connection)
+        journal = core.state_journal
+        core.current_agent = current_agent
+        core.current_workflow = current_workflow
+        if revision == journal.revision and not self._stale:
+            return False
+
+        # 本地 revision 落在同一次整体替换之后时只回放增量
+        if not self._stale and journal.base_revision == base_revision and base_revision <= journal.revision < revision:
+            rows = connection.execute(
+                "SELECT revision, ops FROM ops WHERE revision > ? ORDER BY revision", (journal.revision,)
+            ).fetchall()
+            if rows and rows[0][0] == journal.revision + 1 and rows[-1][0] == revision:
+                for entry_revision, ops in rows:
+                    journal.replay(core.workflow_state, entry_revision, json.loads(ops))
+                return True
+
+        state = connection.execute("SELECT state FROM session WHERE id = 1").fetchone()[0]
+        entries = [
+            (entry_revision, json.loads(ops))
+            for entry_revision, ops in connection.execute(
+                "SELECT revision, ops FROM ops WHERE revision > ? ORDER BY revision", (base_revision,)
+            )
+        ]
+        core.workflow_state = json.loads(state)
+        journal.restore(revision, base_revision, entries[-self.max_ops:])
+        self._stale = False
+        return True
+
+    @contextmanager
+    def transaction(self, core) -> Iterator[None]:
+        """在写事务中执行修改状态的操作，结束时把修改写回数据库"""
+        with self._lock:
+            connection = self._connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._pull(connection, core)
+                journal = core.state_journal
+                start = (journal.revision, core.current_agent, core.current_workflow)
+                yield
+                self._push(connection, core, start)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                self._stale = True
+                raise
+
+    def _push(self, connection: sqlite3.Connection, core, start: Tuple[int, Optional[str], Optional[str]]):
+        journal = core.state_journal
+        start_revision = start[0]
+        if (journal.revision, core.current_agent, core.current_workflow) == start:
+            return
+        if journal.revision == start_revision:
+            connection.execute(
+                "UPDATE session SET current_agent = ?, current_workflow = ? WHERE id = 1",
+                (core.current_agent, core.current_workflow)
+            )
+            return
+
+        if journal.base_revision > start_revision:
+            # 状态被整体替换，之前的操作不再可用
+            connection.execute("DELETE FROM ops")
+            entries = journal.entries_after(journal.base_revision)
+        else:
+            entries = journal.entries_after(start_revision)
+        connection.executemany(
+            "INSERT OR REPLACE INTO ops (revision, ops) VALUES (?, ?)",
+            [(entry_revision, _dumps(ops)) for entry_revision, ops in entries]
+        )
+        connection.execute("DELETE FROM ops WHERE revision <= ?", (journal.revision - self.max_ops,))
+        self._write_full(connection, core)
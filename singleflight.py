@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service LLM 请求合并（single-flight）
+
+多个客户端或批量任务同时发出相同的 LLM 请求时，只有第一个（leader）真正调用后端，
+其余请求等待同一次调用并共享结果：
+- 请求按规范化后的参数（排序键的 JSON）计算 SHA-256 作为键，只合并同时进行中的请求，
+  调用结束后键立即释放，不缓存结果
+- 同步工具在线程池中执行（fastmcp 3.0 起；更早的版本在事件循环上直接调用同步工具，
+  等待者会阻塞事件循环），客户端断开时取消的只是等待它的协程，线程里的调用会继续完成，
+  因此 leader 的调用方断开不会影响等待同一结果的其他请求
+- 每个调用方拿到结果的独立副本，可以各自添加字段；调用抛出的异常同样传给所有等待者
+"""
+
+import copy
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+def request_key(kind: str, **fields: Any) -> str:
+    """规范化请求参数的哈希（字段顺序和字典键顺序不影响结果）"""
+    canonical = json.dumps({"kind": kind, **fields}, sort_keys=True, ensure_ascii=False,
+                           separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同键的并发调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行 fn，或等待进行中的相同调用
+
+        Returns:
+            (结果副本, 是否共享了其他请求的调用)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        # leader 也拿副本：等待者可能仍在复制原始结果
+        return copy.deepcopy(call.result), not leader
+
+    def stats(self) -> Dict[str, Any]:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": self.in_flight}
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 工作流程状态导入导出格式
+
+支持的格式：
+- json：兼容旧版本的缩进 JSON（整个文件一次性读取）
+- jsonl：第一行是格式头，第二行是去掉历史列表的状态主体，之后每行一个历史条目
+- gzip / lzma：压缩的 jsonl
+- binary：带长度前缀的记录，值使用紧凑的类型标记编码，字典键在同一个文件内只写一次
+
+除 json 外都可以逐条流式读取，导入时不需要把整个文件读入内存；写入先写临时文件再改名，
+导出中断不会留下半个文件。导入时根据文件头自动识别格式；文件截断、损坏或结构不对时
+读取统一抛出 ValueError。
+"""
+
+import gzip
+import io
+import json
+import lzma
+import os
+import struct
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Dict, List, Any, BinaryIO, Iterable, Iterator, Optional, Tuple
+
+FORMATS = ("json", "jsonl", "gzip", "lzma", "binary")
+
+# 逐条写出的历史列表
+STREAM_KEYS = ("completed_steps", "task_executions", "created_artifacts")
+
+_EXTENSIONS = {
+    ".json": "json",
+    ".jsonl": "jsonl",
+    ".gz": "gzip",
+    ".xz": "lzma",
+    ".lzma": "lzma",
+    ".bin": "binary",
+}
+# 可识别的状态文件扩展名
+SUFFIXES = tuple(_EXTENSIONS)
+
+_FORMAT_NAME = "bmad-workflow-state"
+_FORMAT_VERSION = 1
+_BINARY_MAGIC = b"BMADST\x01"
+_GZIP_MAGIC = b"\x1f\x8b"
+_XZ_MAGIC = b"\xfd7zXZ\x00"
+
+# 二进制编码的类型标记
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _LIST, _DICT = range(8)
+_DOUBLE = struct.Struct(">d")
+
+# (列表名, 条目)；列表名为 None 时条目是状态主体
+Record = Tuple[Optional[str], Any]
+
+# 解码截断或损坏的数据时可能抛出的异常，读取时统一转换为 ValueError
+_DECODE_ERRORS = (IndexError, KeyError, TypeError, RecursionError, struct.error, EOFError,
+                  zlib.error, lzma.LZMAError, gzip.BadGzipFile)
+
+
+def format_for_path(path: Path) -> str:
+    """根据扩展名推断导出格式，无法识别时使用 json"""
+    return _EXTENSIONS.get(path.suffix.lower(), "json")
+
+
+def split_state(state: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, List[Any]]]:
+    """拆分为状态主体和历史列表"""
+    body = {key: value for key, value in state.items() if key not in STREAM_KEYS}
+    return body, {key: state[key] for key in STREAM_KEYS if key in state}
+
+
+# ---------------------------------------------------------------- 二进制编码
+
+def _write_varint(buffer: bytearray, value: int):
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: memoryview, offset: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class _BinaryEncoder:
+    """类型标记编码；字典键首次出现时写入文本，之后只写编号"""
+
+    def __init__(self):
+        self.keys: Dict[str, int] = {}
+
+    def encode(self, value: Any, buffer: bytearray):
+        if value is None:
+            buffer.append(_NONE)
+        elif value is True:
+            buffer.append(_TRUE)
+        elif value is False:
+            buffer.append(_FALSE)
+        elif isinstance(value, int):
+            buffer.append(_INT)
+            _write_varint(buffer, (value << 1) if value >= 0 else ((-value << 1) - 1))
+        elif isinstance(value, float):
+            buffer.append(_FLOAT)
+            buffer += _DOUBLE.pack(value)
+        elif isinstance(value, str):
+            data = value.encode("utf-8")
+            buffer.append(_STR)
+            _write_varint(buffer, len(data))
+            buffer += data
+        elif isinstance(value, (list, tuple)):
+            buffer.append(_LIST)
+            _write_varint(buffer, len(value))
+            for item in value:
+                self.encode(item, buffer)
+        elif isinstance(value, dict):
+            buffer.append(_DICT)
+            _write_varint(buffer, len(value))
+            for key, item in value.items():
+                self._encode_key(str(key), buffer)
+                self.encode(item, buffer)
+        else:
+            self.encode(str(value), buffer)
+
+    def _encode_key(self, key: str, buffer: bytearray):
+        index = self.keys.get(key)
+        if index is not None:
+            _write_varint(buffer, (index << 1) | 1)
+            return
+        self.keys[key] = len(self.keys)
+        data = key.encode("utf-8")
+        _write_varint(buffer, len(data) << 1)
+        buffer += data
+
+
+class _BinaryDecoder:
+    def __init__(self):
+        self.keys: List[str] = []
+
+    def decode(self, data: memoryview, offset: int = 0) -> Tuple[Any, int]:
+        tag = data[offset]
+        offset += 1
+        if tag == _NONE:
+            return None, offset
+        if tag == _TRUE:
+            return True, offset
+        if tag == _FALSE:
+            return False, offset
+        if tag == _INT:
+            raw, offset = _read_varint(data, offset)
+            return (raw >> 1) if not raw & 1 else -((raw + 1) >> 1), offset
+        if tag == _FLOAT:
+            return _DOUBLE.unpack_from(data, offset)[0], offset + 8
+        if tag == _STR:
+            length, offset = _read_varint(data, offset)
+            return str(data[offset:offset + length], "utf-8"), offset + length
+        if tag == _LIST:
+            count, offset = _read_varint(data, offset)
+            items = []
+            for _ in range(count):
+                item, offset = self.decode(data, offset)
+                items.append(item)
+            return items, offset
+        if tag == _DICT:
+            count, offset = _read_varint(data, offset)
+            result = {}
+            for _ in range(count):
+                key, offset = self._decode_key(data, offset)
+                result[key], offset = self.decode(data, offset)
+            return result, offset
+        raise ValueError(f"未知的类型标记: {tag}")
+
+    def _decode_key(self, data: memoryview, offset: int) -> Tuple[str, int]:
+        raw, offset = _read_varint(data, offset)
+        if raw & 1:
+            return self.keys[raw >> 1], offset
+        length = raw >> 1
+        key = str(data[offset:offset + length], "utf-8")
+        self.keys.append(key)
+        return key, offset + length
+
+
+def _read_binary_records(f: BinaryIO) -> Iterator[Record]:
+    decoder = _BinaryDecoder()
+    while True:
+        length = shift = 0
+        while True:
+            byte = f.read(1)
+            if not byte:
+                if shift:
+                    raise ValueError("二进制状态文件被截断")
+                return
+            length |= (byte[0] & 0x7F) << shift
+            if byte[0] < 0x80:
+                break
+            shift += 7
+        payload = f.read(length)
+        if len(payload) != length:
+            raise ValueError("二进制状态文件被截断")
+        record, _ = decoder.decode(memoryview(payload))
+        yield record
+
+
+# ---------------------------------------------------------------- 写入
+
+def _file_mode(path: Path) -> int:
+    """覆盖已有文件时沿用其权限，否则与 open() 新建文件一致（0666 去掉 umask）"""
+    try:
+        return path.stat().st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_state(path: Path, body: Dict[str, Any], records: Iterable[Tuple[str, Any]],
+                fmt: str) -> Dict[str, Any]:
+    """
+    原子地写出工作流程状态
+
+    Args:
+        path: 输出文件
+        body: 去掉历史列表的状态主体
+        records: (列表名, 条目) 序列，按时间顺序
+        fmt: 格式（json / jsonl / gzip / lzma / binary）
+
+    Returns:
+        格式、条目数和文件字节数
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的格式 '{fmt}'，可选: {', '.join(FORMATS)}")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as raw:
+            if fmt == "binary":
+                raw.write(_BINARY_MAGIC)
+                encoder = _BinaryEncoder()
+                for index, record in enumerate(_with_body(body, records)):
+                    buffer = bytearray()
+                    encoder.encode(record, buffer)
+                    header = bytearray()
+                    _write_varint(header, len(buffer))
+                    raw.write(header)
+                    raw.write(buffer)
+                    count = index
+            else:
+                if fmt == "gzip":
+                    stream = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0)
+                elif fmt == "lzma":
+                    stream = lzma.LZMAFile(raw, mode="wb", preset=3)
+                else:
+                    stream = None
+                text = io.TextIOWrapper(stream or raw, encoding="utf-8", newline="\n")
+
+                if fmt == "json":
+                    state = dict(body)
+                    for key, entry in records:
+                        state.setdefault(key, []).append(entry)
+                        count += 1
+                    json.dump(state, text, indent=2, ensure_ascii=False)
+                else:
+                    text.write(json.dumps({"format": _FORMAT_NAME, "version": _FORMAT_VERSION}) + "\n")
+                    for index, record in enumerate(_with_body(body, records)):
+                        text.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+                        count = index
+
+                text.flush()
+                text.detach()
+                if stream is not None:
+                    stream.close()
+            # 先落盘再改名，掉电后不会得到已改名但内容为空的文件
+            raw.flush()
+            os.fsync(raw.fileno())
+        # mkstemp 创建的临时文件权限为 0600
+        os.chmod(temp_name, _file_mode(path))
+        os.replace(temp_name, path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+    return {"format": fmt, "records": count, "bytes": path.stat().st_size}
+
+
+def _with_body(body: Dict[str, Any], records: Iterable[Tuple[str, Any]]) -> Iterator[Record]:
+    yield None, body
+    yield from records
+
+
+# ---------------------------------------------------------------- 读取
+
+def detect_format(path: Path) -> str:
+    """根据文件头识别格式"""
+    with open(path, "rb") as f:
+        head = f.read(len(_BINARY_MAGIC))
+        if head.startswith(_BINARY_MAGIC):
+            return "binary"
+        if head.startswith(_GZIP_MAGIC):
+            return "gzip"
+        if head.startswith(_XZ_MAGIC):
+            return "lzma"
+        f.seek(0)
+        first_line = f.readline(4096)
+    try:
+        header = json.loads(first_line)
+    except ValueError:
+        return "json"
+    return "jsonl" if isinstance(header, dict) and header.get("format") == _FORMAT_NAME else "json"
+
+
+def _read_jsonl_records(text: Iterable[str]) -> Iterator[Record]:
+    lines = iter(text)
+    header = json.loads(next(lines, "null") or "null")
+    if not isinstance(header, dict) or header.get("format") != _FORMAT_NAME:
+        raise ValueError("不是工作流程状态文件")
+    if header.get("version", 0) > _FORMAT_VERSION:
+        raise ValueError(f"不支持的状态文件版本: {header.get('version')}")
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _validated(records: Iterable[Any]) -> Iterator[Record]:
+    """检查记录结构：第一条是字典形式的状态主体，之后是已知历史列表的条目"""
+    body_seen = False
+    for record in records:
+        if not isinstance(record, (list, tuple)) or len(record) != 2:
+            raise ValueError(f"状态记录格式错误: {type(record).__name__}")
+        key, entry = record
+        if not body_seen:
+            if key is not None or not isinstance(entry, dict):
+                raise ValueError("状态文件缺少状态主体")
+            body_seen = True
+        elif key not in STREAM_KEYS:
+            raise ValueError(f"未知的历史列表: {key!r}")
+        yield key, entry
+
+
+def read_state(path: Path, fmt: Optional[str] = None) -> Iterator[Record]:
+    """
+    流式读取工作流程状态
+
+    Yields:
+        先是 (None, 状态主体)，之后按时间顺序逐条返回 (列表名, 条目)
+
+    Raises:
+        ValueError: 文件不是有效的工作流程状态（格式不对、截断或损坏）
+    """
+    try:
+        yield from _validated(_read_records(path, fmt or detect_format(path)))
+    except _DECODE_ERRORS as e:
+        raise ValueError(f"状态文件已损坏: {e or type(e).__name__}") from e
+
+
+def _read_records(path: Path, fmt: str) -> Iterator[Any]:
+    if fmt == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if not isinstance(state, dict):
+            raise ValueError("不是工作流程状态文件")
+        body, lists = split_state(state)
+        yield None, body
+        for key, entries in lists.items():
+            for entry in entries:
+                yield key, entry
+        return
+
+    if fmt == "binary":
+        with open(path, "rb") as f:
+            if f.read(len(_BINARY_MAGIC)) != _BINARY_MAGIC:
+                raise ValueError("不是二进制工作流程状态文件")
+            yield from _read_binary_records(f)
+        return
+
+    if fmt == "gzip":
+        opener = gzip.open
+    elif fmt == "lzma":
+        opener = lzma.open
+    elif fmt == "jsonl":
+        opener = open
+    else:
+        raise ValueError(f"不支持的格式 '{fmt}'，可选: {', '.join(FORMATS)}")
+    with opener(path, "rt", encoding="utf-8") as f:
+        yield from _read_jsonl_records(f)
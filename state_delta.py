@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 工作流程状态增量
+
+工作流程状态的每次修改都以 JSON Patch (RFC 6902) 操作记录在日志中，
+客户端携带上次看到的 revision 即可只获取之后的增量，响应大小不再随运行长度增长。
+"""
+
+import copy
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def escape_pointer_token(token: str) -> str:
+    """转义 JSON Pointer 中的单个路径段"""
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _resolve_parent(document: Any, path: str):
+    """返回路径的父容器和最后一个路径段"""
+    if not path.startswith("/"):
+        raise ValueError(f"无效的 JSON Pointer: {path!r}")
+    tokens = [_unescape(token) for token in path[1:].split("/")]
+    parent = document
+    for token in tokens[:-1]:
+        parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+    return parent, tokens[-1]
+
+
+def apply_patch(document: Dict[str, Any], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    在原地应用 JSON Patch 操作（支持 add / replace / remove）
+
+    Returns:
+        修改后的文档（同一个对象）
+    """
+    for op in ops:
+        kind = op["op"]
+        parent, token = _resolve_parent(document, op["path"])
+
+        if isinstance(parent, list):
+            if kind == "add":
+                if token == "-":
+                    parent.append(op["value"])
+                else:
+                    parent.insert(int(token), op["value"])
+            elif kind == "replace":
+                parent[int(token)] = op["value"]
+            elif kind == "remove":
+                del parent[int(token)]
+            else:
+                raise ValueError(f"不支持的操作: {kind}")
+        else:
+            if kind in ("add", "replace"):
+                parent[token] = op["value"]
+            elif kind == "remove":
+                del parent[token]
+            else:
+                raise ValueError(f"不支持的操作: {kind}")
+
+    return document
+
+
+class StateJournal:
+    """工作流程状态修改日志"""
+
+    def __init__(self, max_entries: int = 1000):
+        self._lock = threading.Lock()
+        self.revision = 0
+        # 早于 base_revision 的增量不可用（状态被整体替换过）
+        self.base_revision = 0
+        self._entries = deque(maxlen=max_entries)
+
+    def reset(self) -> int:
+        """状态被整体替换（启动、导入、重置工作流程）时调用"""
+        with self._lock:
+            self.revision += 1
+            self.base_revision = self.revision
+            self._entries.clear()
+            return self.revision
+
+    def record(self, state: Dict[str, Any], ops: List[Dict[str, Any]]) -> int:
+        """应用并记录一组修改，返回新的 revision"""
+        with self._lock:
+            apply_patch(state, ops)
+            self.revision += 1
+            self._entries.append((self.revision, ops))
+            return self.revision
+
+    def delta(self, state: Dict[str, Any], since_revision: int) -> Dict[str, Any]:
+        """
+        获取 since_revision 之后的增量
+
+        增量不可用时（状态被替换、日志已截断或 revision 无效）返回完整状态，
+        响应中 full=True 提示客户端直接覆盖本地副本。
+        """
+        with self._lock:
+            oldest_available = self._entries[0][0] - 1 if self._entries else self.revision
+            usable = (
+                since_revision <= self.revision
+                and since_revision >= self.base_revision
+                and since_revision >= oldest_available
+            )
+
+            if not usable:
+                return {
+                    "full": True,
+                    "from_revision": since_revision,
+                    "to_revision": self.revision,
+                    "state": copy.deepcopy(state)
+                }
+
+            ops = [op for revision, entry_ops in self._entries if revision > since_revision for op in entry_ops]
+            return {
+                "full": False,
+                "from_revision": since_revision,
+                "to_revision": self.revision,
+                "ops": ops
+            }
+
+    def entries_after(self, revision: int) -> List[Tuple[int, List[Dict[str, Any]]]]:
+        """revision 之后记录的 (revision, 操作) 列表"""
+        with self._lock:
+            return [(entry_revision, ops) for entry_revision, ops in self._entries if entry_revision > revision]
+
+    def replay(self, state: Dict[str, Any], revision: int, ops: List[Dict[str, Any]]):
+        """应用其他进程记录的修改，保持相同的 revision"""
+        with self._lock:
+            apply_patch(state, ops)
+            self.revision = revision
+            self._entries.append((revision, ops))
+
+    def restore(self, revision: int, base_revision: int, entries: List[Tuple[int, List[Dict[str, Any]]]]):
+        """整体替换为其他进程的日志"""
+        with self._lock:
+            self.revision = revision
+            self.base_revision = base_revision
+            self._entries.clear()
+            self._entries.extend(entries)
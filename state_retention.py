@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 工作流程状态保留策略
+
+长时间运行的工作流程中 completed_steps 和 task_executions 会不断增长。这里把它们作为
+定长环形缓冲区维护：超出上限的最早条目按批写入磁盘（每次运行一个 JSONL 文件），
+并累加到 state["rollup"] 的汇总中；任务执行的上下文超过长度限制时只保留摘要。
+运行被重置或替换后，它的溢出文件随之删除。
+
+所有修改都以 JSON Patch 操作返回，由 StateJournal 记录，客户端的增量同步保持正确。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional
+
+# 内存中保留的最近条目数
+MAX_COMPLETED_STEPS = int(os.getenv("BMAD_STATE_MAX_STEPS", "200"))
+MAX_TASK_EXECUTIONS = int(os.getenv("BMAD_STATE_MAX_EXECUTIONS", "100"))
+# 超出上限多少条后一次性写入磁盘（内存中最多保留 上限 + 批量 - 1 条）
+SPILL_BATCH = int(os.getenv("BMAD_STATE_SPILL_BATCH", "20"))
+# 单个任务执行上下文的最大长度（JSON 字符数）
+MAX_CONTEXT_CHARS = int(os.getenv("BMAD_STATE_MAX_CONTEXT_CHARS", "2000"))
+# 超长上下文中字符串值保留的前缀长度
+_PREVIEW_CHARS = 200
+
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def compact_context(context: Optional[Dict[str, Any]], max_chars: int = MAX_CONTEXT_CHARS) -> Optional[Dict[str, Any]]:
+    """
+    超长上下文只保留摘要
+
+    短的标量值原样保留；长字符串截断为前缀，字典和列表替换为
+    {"truncated": true, "chars": 长度, "sha1": 哈希}。
+    """
+    if not context:
+        return context
+    encoded = _dumps(context)
+    if len(encoded) <= max_chars:
+        return context
+
+    compacted: Dict[str, Any] = {}
+    for key, value in context.items():
+        if isinstance(value, (int, float, bool)) or value is None:
+            compacted[key] = value
+            continue
+        text = value if isinstance(value, str) else _dumps(value)
+        if isinstance(value, str) and len(value) <= _PREVIEW_CHARS:
+            compacted[key] = value
+            continue
+        compacted[key] = {
+            "truncated": True,
+            "chars": len(text),
+            "sha1": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+            **({"preview": value[:_PREVIEW_CHARS]} if isinstance(value, str) else {})
+        }
+    return compacted
+
+
+def _rollup(summary: Optional[Dict[str, Any]], key: str, evicted: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把移出内存的条目累加到汇总中"""
+    summary = dict(summary or {"count": 0})
+    summary["count"] += len(evicted)
+    if key == "completed_steps":
+        timestamps = [entry.get("completed_at") for entry in evicted if entry.get("completed_at")]
+        summary["artifacts"] = summary.get("artifacts", 0) + sum(len(entry.get("artifacts") or []) for entry in evicted)
+    else:
+        timestamps = [entry.get("executed_at") for entry in evicted if entry.get("executed_at")]
+        for field, bucket in (("task_name", "by_task"), ("agent", "by_agent")):
+            counts = dict(summary.get(bucket) or {})
+            for entry in evicted:
+                name = str(entry.get(field))
+                counts[name] = counts.get(name, 0) + 1
+            summary[bucket] = counts
+    if timestamps:
+        summary.setdefault("first_at", timestamps[0])
+        summary["last_at"] = timestamps[-1]
+    return summary
+
+
+class StateRetention:
+    """工作流程状态列表的环形缓冲区和磁盘溢出"""
+
+    def __init__(self, spill_dir: Path, limits: Optional[Dict[str, int]] = None, spill_batch: int = SPILL_BATCH):
+        self.spill_dir = spill_dir
+        self.limits = limits or {
+            "completed_steps": MAX_COMPLETED_STEPS,
+            "task_executions": MAX_TASK_EXECUTIONS,
+        }
+        self.spill_batch = max(1, spill_batch)
+        self._lock = threading.Lock()
+
+    def _run_dir(self, run_id: str) -> Path:
+        return self.spill_dir / _UNSAFE_NAME.sub("_", run_id)
+
+    def _spill_path(self, run_id: str, key: str) -> Path:
+        return self._run_dir(run_id) / f"{key}.jsonl"
+
+    def _spill(self, run_id: str, key: str, entries: List[Dict[str, Any]]):
+        path = self._spill_path(run_id, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(path, "a", encoding="utf-8") as f:
+            f.writelines(_dumps(entry) + "\n" for entry in entries)
+
+    def append_ops(self, state: Dict[str, Any], key: str, entry: Dict[str, Any],
+                   run_id: str) -> List[Dict[str, Any]]:
+        """
+        生成向 state[key] 追加条目的 JSON Patch 操作
+
+        超出上限的条目累积到 spill_batch 条时，一次性写入磁盘、从列表头部移除，
+        并更新 state["rollup"][key]。
+        """
+        ops: List[Dict[str, Any]] = []
+        items = state.get(key)
+        if items is None:
+            ops.append({"op": "add", "path": f"/{key}", "value": []})
+            items = []
+        ops.append({"op": "add", "path": f"/{key}/-", "value": entry})
+
+        overflow = len(items) + 1 - max(1, self.limits.get(key, len(items) + 1))
+        if overflow >= self.spill_batch:
+            summary = self.evict(state, key, items[:overflow], run_id)
+            ops.extend({"op": "remove", "path": f"/{key}/0"} for _ in range(overflow))
+            if "rollup" not in state:
+                ops.append({"op": "add", "path": "/rollup", "value": {}})
+            ops.append({"op": "add", "path": f"/rollup/{key}", "value": summary})
+        return ops
+
+    def evict(self, state: Dict[str, Any], key: str, entries: List[Dict[str, Any]],
+              run_id: str) -> Dict[str, Any]:
+        """把条目写入磁盘，返回累加后的汇总（不修改 state）"""
+        self._spill(run_id, key, entries)
+        return _rollup((state.get("rollup") or {}).get(key), key, entries)
+
+    def staging_run(self) -> str:
+        """导入时移出的条目先写入一个临时运行，导入成功后再换入（见 commit_staged）"""
+        return f".import-{uuid.uuid4().hex}"
+
+    def commit_staged(self, staging_id: str, run_id: str, replace: bool):
+        """
+        把临时运行的条目换入 run_id
+
+        replace 为 True（导入的文件带完整历史）时丢弃运行原有的条目，
+        否则把临时条目追加到原有条目之后。
+        """
+        with self._lock:
+            for key in self.limits:
+                staged = self._spill_path(staging_id, key)
+                target = self._spill_path(run_id, key)
+                if not staged.exists():
+                    if replace:
+                        target.unlink(missing_ok=True)
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                if replace or not target.exists():
+                    os.replace(staged, target)
+                else:
+                    with open(staged, "rb") as src, open(target, "ab") as dst:
+                        shutil.copyfileobj(src, dst)
+        self.discard(staging_id)
+
+    def discard(self, run_id: str):
+        """删除运行的溢出文件（运行被重置、替换，或导入失败的临时运行）"""
+        with self._lock:
+            shutil.rmtree(self._run_dir(run_id), ignore_errors=True)
+
+    def history(self, state: Dict[str, Any], key: str, run_id: str) -> Iterator[Dict[str, Any]]:
+        """按时间顺序遍历完整历史：先是磁盘上的条目，再是内存中的条目"""
+        path = self._spill_path(run_id, key)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        yield from state.get(key) or []
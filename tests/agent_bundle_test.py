@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+智能体激活包测试
+
+测试依赖解析、缓存复用与失效，以及 gzip 编码
+"""
+
+import gzip
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from agent_bundle import AgentBundleCache, resolve_dependency
+
+
+@dataclass
+class FakeAgent:
+    id: str
+    name: str
+    dependencies: Dict[str, List[str]] = field(default_factory=dict)
+
+
+def _agent(**dependencies):
+    return FakeAgent("pm", "John", dependencies)
+
+
+def _catalog(root):
+    (root / "templates").mkdir()
+    (root / "tasks").mkdir()
+    (root / "templates" / "prd-tmpl.yaml").write_text("template: prd", encoding="utf-8")
+    (root / "tasks" / "create-doc.md").write_text("# Create doc", encoding="utf-8")
+
+
+def test_resolve_dependency_follows_root_type_name(tmp_path):
+    """测试 {root}/{type}/{name} 解析规则"""
+    _catalog(tmp_path)
+    assert resolve_dependency(tmp_path, "tasks", "create-doc") == tmp_path / "tasks" / "create-doc.md"
+    assert resolve_dependency(tmp_path, "templates", "prd-tmpl.yaml") == tmp_path / "templates" / "prd-tmpl.yaml"
+    assert resolve_dependency(tmp_path, "tasks", "../secrets") is None
+    assert resolve_dependency(tmp_path, "checklists", "pm-checklist") is None
+
+
+def test_bundle_is_cached_until_dependency_changes(tmp_path):
+    """测试依赖文件未变化时复用缓存，变化后重建"""
+    _catalog(tmp_path)
+    cache = AgentBundleCache(tmp_path)
+    agent = _agent(tasks=["create-doc"], templates=["prd-tmpl.yaml"], checklists=["pm-checklist"])
+
+    bundle = cache.get("pm", agent, "v1")
+    assert bundle["dependencies"]["tasks"]["create-doc"] == "# Create doc"
+    assert bundle["missing"] == ["checklists/pm-checklist"]
+    assert cache.get("pm", agent, "v1") is bundle
+
+    task_file = tmp_path / "tasks" / "create-doc.md"
+    task_file.write_text("# Create document", encoding="utf-8")
+    os.utime(task_file, ns=(task_file.stat().st_atime_ns, task_file.stat().st_mtime_ns + 10**9))
+    rebuilt = cache.get("pm", agent, "v1")
+    assert rebuilt is not bundle
+    assert rebuilt["bundle_version"] != bundle["bundle_version"]
+
+
+def test_compressed_bundle_round_trips(tmp_path):
+    """测试 gzip 编码的包可以还原"""
+    _catalog(tmp_path)
+    cache = AgentBundleCache(tmp_path)
+    bundle = cache.get("pm", _agent(tasks=["create-doc"]), "v1")
+
+    decoded = json.loads(gzip.decompress(cache.compressed("pm")).decode("utf-8"))
+    assert decoded == bundle
+    assert cache.compressed("pm") is cache.compressed("pm")
+
+
+def test_wildcard_dependency_includes_every_file(tmp_path):
+    """测试 ALL 依赖包含该类型目录下的全部文件，单个字符串不会被拆成字符"""
+    _catalog(tmp_path)
+    (tmp_path / "tasks" / "shard-doc.md").write_text("# Shard doc", encoding="utf-8")
+    cache = AgentBundleCache(tmp_path)
+    bundle = cache.get("bmad-master", _agent(tasks="ALL", templates="prd-tmpl.yaml", data="ALL"), "v1")
+
+    assert sorted(bundle["dependencies"]["tasks"]) == ["create-doc.md", "shard-doc.md"]
+    assert list(bundle["dependencies"]["templates"]) == ["prd-tmpl.yaml"]
+    assert bundle["missing"] == []
+    assert bundle["resolved_count"] == 3
+
+
+def test_bundle_bmad_master():
+    """测试打包内置目录中依赖全部为 ALL 的 bmad-master"""
+    import bmad_agent_mcp
+
+    bundle = bmad_agent_mcp.get_agent_bundle("bmad-master")
+    assert bundle["success"]
+    assert bundle["missing"] == []
+    templates = {path.name for path in (bmad_agent_mcp.BMAD_CORE_PATH / "templates").iterdir() if path.is_file()}
+    assert set(bundle["dependencies"]["templates"]) == templates
+    assert bundle["resolved_count"] >= len(templates)
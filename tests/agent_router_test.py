@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+智能体推荐测试
+
+测试 TF-IDF 路由结果以及 NumPy 与纯 Python 实现的一致性
+"""
+
+from dataclasses import dataclass
+
+import pytest
+
+from agent_router import NUMPY_AVAILABLE, AgentRouter
+
+
+@dataclass
+class FakeAgent:
+    title: str
+    when_to_use: str
+    role: str = ""
+    focus: str = ""
+    description: str = ""
+    identity: str = ""
+
+
+AGENTS = {
+    "pm": FakeAgent("Product Manager", "Use for creating PRDs, product strategy, roadmap planning", focus="产品需求"),
+    "qa": FakeAgent("Test Architect", "Use for test strategy, code review and quality gates", focus="测试质量"),
+    "sm": FakeAgent("Scrum Master", "Use for sprint planning, retrospectives and agile coaching"),
+}
+
+
+def test_recommend_routes_to_matching_agent():
+    """测试任务被路由到最匹配的智能体"""
+    router = AgentRouter(use_numpy=False)
+    router.ensure("v1", AGENTS)
+
+    assert router.recommend("write the PRD for our product")[0][0] == "pm"
+    assert router.recommend("review code quality")[0][0] == "qa"
+    assert router.recommend("提升测试质量")[0][0] == "qa"
+    assert router.recommend("zzz qqq") == []
+
+
+def test_ensure_rebuilds_only_on_version_change():
+    """测试目录版本不变时不重建矩阵"""
+    router = AgentRouter(use_numpy=False)
+    router.ensure("v1", AGENTS)
+    router.ensure("v1", {})
+    assert router.agent_ids == ["pm", "qa", "sm"]
+    router.ensure("v2", {"pm": AGENTS["pm"]})
+    assert router.agent_ids == ["pm"]
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason="未安装 NumPy")
+def test_numpy_matches_pure_python():
+    """测试矩阵乘法与稀疏点积结果一致"""
+    vectorized, fallback = AgentRouter(use_numpy=True), AgentRouter(use_numpy=False)
+    vectorized.ensure("v1", AGENTS)
+    fallback.ensure("v1", AGENTS)
+
+    for task in ["sprint retrospective", "product roadmap and PRD", "测试"]:
+        for (id_a, score_a), (id_b, score_b) in zip(vectorized.scores(task), fallback.scores(task)):
+            assert id_a == id_b
+            assert score_a == pytest.approx(score_b, abs=1e-5)
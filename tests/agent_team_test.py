@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+智能体团队测试
+
+测试团队文件解析、团队查询工具，以及 call_team 的并发分发和单成员超时
+"""
+
+import asyncio
+import threading
+import time
+
+import bmad_agent_mcp
+
+TEAM_YAML = """bundle:
+  name: Test Team
+team:
+  id: team-test
+  name: Test Team
+  description: Planning pair
+  use_case: Tests
+agents:
+  - id: pm
+    role: Product Manager
+    responsibilities:
+      - Write PRD
+  - architect
+workflow_coverage:
+  - greenfield-fullstack
+"""
+
+
+def test_parse_team_file(tmp_path, monkeypatch):
+    """测试成员既可以是字典也可以只写ID"""
+    (tmp_path / "agent-teams").mkdir()
+    (tmp_path / "agent-teams" / "team-test.yaml").write_text(TEAM_YAML, encoding="utf-8")
+    monkeypatch.setattr(bmad_agent_mcp, "BMAD_CORE_PATH", tmp_path)
+    core = bmad_agent_mcp.BMADCore()
+
+    team = core.teams["team-test"]
+    assert [member["id"] for member in team.members] == ["pm", "architect"]
+    assert team.members[0]["responsibilities"] == ["Write PRD"]
+    assert team.workflow_coverage == ["greenfield-fullstack"]
+    assert team.details == {"bundle": {"name": "Test Team"}}
+    assert "team:team-test" in core.entry_versions
+
+
+def test_list_and_get_team():
+    """测试团队列表和成员详情"""
+    teams = bmad_agent_mcp.list_teams()
+    assert teams["success"]
+    assert "team-fullstack" in [team["id"] for team in teams["teams"]]
+
+    team = bmad_agent_mcp.get_team("team-fullstack")["team"]
+    member = team["members"][0]
+    assert member["available"]
+    assert member["title"] == bmad_agent_mcp.bmad_core.agents[member["id"]].title
+
+    assert "error" in bmad_agent_mcp.get_team("team-missing")
+
+
+def test_call_team_fans_out_with_member_timeouts(monkeypatch):
+    """测试任务并发分发给成员，慢成员超时不影响其他成员"""
+    started = threading.Barrier(2, timeout=5)
+    calls = {}
+
+    def fake_call(agent_id, task, context=None):
+        calls[agent_id] = context["team"]["role"]
+        if agent_id == "qa":
+            time.sleep(1)
+            return {"success": True, "agent_id": agent_id}
+        started.wait()  # pm 和 architect 必须同时在运行
+        if agent_id == "architect":
+            return {"success": False, "error": "boom"}
+        return {"success": True, "agent_id": agent_id, "task": task}
+
+    monkeypatch.setattr(bmad_agent_mcp, "call_agent_with_llm", fake_call)
+    result = asyncio.run(bmad_agent_mcp.call_team(
+        "team-fullstack", "Plan the MVP", members=["pm", "architect", "qa"], timeout_seconds=0.3
+    ))
+
+    assert result["success"]
+    assert result["responses"]["pm"]["task"] == "Plan the MVP"
+    assert result["timed_out"] == ["qa"]
+    assert result["failed"] == ["architect"]
+    assert "qa" not in result["responses"]
+    assert result["members"]["pm"]["status"] == "ok"
+    assert result["elapsed_ms"] < 1000
+    assert all(calls[agent_id] for agent_id in ("pm", "architect"))
+
+
+def test_call_team_rejects_unknown_members():
+    """测试非团队成员被拒绝"""
+    result = asyncio.run(bmad_agent_mcp.call_team("team-no-ui", "x", members=["ux-expert"]))
+    assert not result["success"]
+    assert "ux-expert" in result["error"]
+    assert not asyncio.run(bmad_agent_mcp.call_team("team-missing", "x"))["success"]
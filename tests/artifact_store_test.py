@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+产物存储测试
+
+测试内容定义分块、跨版本块级去重、压缩方式和按运行的版本索引
+"""
+
+import lzma
+
+from artifact_store import ArtifactStore, chunk_content, _compress, _decompress
+
+
+def _document(sections):
+    return "".join(
+        f"## Section {i}\n\n" + "".join(f"Requirement {i}.{j}: the system shall do thing {j}.\n" for j in range(40))
+        for i in range(sections)
+    ).encode("utf-8")
+
+
+def test_chunking_is_local_to_edits():
+    """测试修改一行只影响少数块"""
+    original = _document(30)
+    edited = original.replace(b"Requirement 15.3:", b"Requirement 15.3 (revised):")
+    before, after = chunk_content(original), chunk_content(edited)
+    assert b"".join(after) == edited
+    assert len(set(after) - set(before)) <= 2
+    assert all(len(chunk) <= 64 * 1024 for chunk in chunk_content(b"x" * 200_000))
+
+
+def test_versions_share_chunks(tmp_path):
+    """测试新版本只存储变化的块，读取内容一致"""
+    store = ArtifactStore(tmp_path)
+    original = _document(30)
+    first = store.put("run-1", "prd.md", original, step_index=0)
+    assert first["version"] == 1 and first["new_chunks"] == first["chunks"]
+
+    edited = original.replace(b"Requirement 15.3:", b"Requirement 15.3 (revised):")
+    second = store.put("run-1", "prd.md", edited, step_index=2)
+    assert second["version"] == 2
+    assert second["new_chunks"] <= 2
+    assert second["stored_bytes"] < first["stored_bytes"] / 5
+
+    assert store.put("run-1", "prd.md", edited)["unchanged"]
+    assert store.read(first["digest"]) == original
+    assert store.resolve("run-1", "prd.md")["digest"] == second["digest"]
+    assert store.resolve("run-1", "prd.md", version=1)["step_index"] == 0
+    assert store.list("run-2") == {}
+
+
+def test_codecs_round_trip():
+    """测试 zlib / lzma 压缩以及压缩无收益时原样存储"""
+    data = b"architecture " * 200
+    assert _compress(data, "lzma")[1:] == lzma.compress(data, preset=6)
+    for codec in ("zlib", "lzma", "none"):
+        assert _decompress(_compress(data, codec)) == data
+    assert _compress(b"ab", "zlib") == b"nab"
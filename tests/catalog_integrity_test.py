@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+目录完整性检查测试
+
+测试悬空引用、前向引用、依赖环和不可达步骤的识别
+"""
+
+from types import SimpleNamespace
+
+from catalog_integrity import check_catalog, filter_issues, normalize_name
+
+
+def _agent(**dependencies):
+    return SimpleNamespace(dependencies=dependencies)
+
+
+def _workflow(*sequence):
+    return SimpleNamespace(sequence=list(sequence))
+
+
+def _kinds(result):
+    return {(issue["kind"], str(issue["target"])) for issue in result["issues"]}
+
+
+def test_normalize_name_ignores_optional_suffix_and_separators():
+    """测试名称归一化"""
+    assert normalize_name("v0_prompt (optional)") == "v0 prompt"
+    assert normalize_name("impact_analysis") == normalize_name("Impact analysis")
+
+
+def test_clean_catalog_passes():
+    """测试引用完整的目录没有问题"""
+    agents = {"pm": _agent(templates=["prd-tmpl.md"]), "architect": _agent()}
+    workflows = {"flow": _workflow(
+        {"agent": "pm", "creates": "prd.md", "uses": "prd-tmpl"},
+        {"step": "impact_analysis", "agent": "architect", "requires": "prd.md"},
+        {"agent": "architect", "creates": "architecture.md", "requires": ["prd.md", "impact analysis"]},
+    )}
+    result = check_catalog(agents, workflows, {"templates": ["prd-tmpl"]})
+    assert result["ok"]
+    assert result["issues"] == []
+    assert result["summary"]["checked_references"] == 8
+
+
+def test_dangling_references_are_reported():
+    """测试悬空的智能体、依赖和产物引用"""
+    agents = {"pm": _agent(tasks=["create-doc"])}
+    workflows = {"flow": _workflow(
+        {"agent": "ghost", "creates": "brief.md"},
+        {"step": "route", "routes": {"fast": {"agent": "nobody"}}},
+        {"agent": "pm", "creates": "prd.md", "requires": "missing.md"},
+        {"agent": "pm", "creates": "epic.md", "requires": "prd.md"},
+    )}
+    result = check_catalog(agents, workflows, {"tasks": []})
+    kinds = _kinds(result)
+    assert ("dangling_agent", "ghost") in kinds
+    assert ("dangling_agent", "nobody") in kinds
+    assert ("dangling_dependency", "tasks/create-doc") in kinds
+    assert ("dangling_requires", "missing.md") in kinds
+    # 依赖了无法产出的 prd.md 的步骤也无法执行
+    unreachable = filter_issues(result["issues"], kind="unreachable_step")
+    assert [issue["source"] for issue in unreachable] == ["workflow:flow#3 (epic.md)"]
+    assert not result["ok"]
+
+
+def test_wildcard_dependency_matches_all_resources():
+    """测试 ALL 依赖匹配该类型的全部资源，不报告为悬空依赖"""
+    agents = {"bmad-master": _agent(tasks="ALL", checklists="ALL", data="ALL")}
+    result = check_catalog(agents, {}, {"tasks": ["create-doc"], "checklists": []})
+    assert result["issues"] == []
+    assert result["summary"]["checked_references"] == 3
+
+
+def test_cycles_and_forward_references():
+    """测试前向引用和依赖环"""
+    workflows = {"flow": _workflow(
+        {"agent": "pm", "creates": "a.md", "requires": "b.md"},
+        {"agent": "pm", "creates": "b.md", "requires": "a.md"},
+        {"agent": "pm", "creates": "c.md", "requires": "b.md"},
+    )}
+    result = check_catalog({"pm": _agent()}, workflows, {})
+    kinds = {issue["kind"] for issue in result["issues"]}
+    assert {"forward_requires", "cycle", "unreachable_step"} <= kinds
+
+    cycle = filter_issues(result["issues"], kind="cycle")[0]
+    assert len(cycle["target"]) == 2
+    assert filter_issues(result["issues"], kind="unreachable_step")[0]["source"].startswith("workflow:flow#2")
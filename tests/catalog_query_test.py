@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+目录查询辅助函数测试
+
+测试字段裁剪、游标分页和内容版本
+"""
+
+import pytest
+
+import bmad_agent_mcp
+from utils import content_version, encode_cursor, paginate, project_fields
+
+
+def test_project_fields_keeps_requested_keys_only():
+    """测试字段裁剪"""
+    record = {"id": "pm", "title": "Product Manager", "focus": "PRD"}
+    assert project_fields(record, ["id", "focus"]) == {"id": "pm", "focus": "PRD"}
+    assert project_fields(record, None) is record
+
+
+def test_list_workflows_id_only():
+    """测试只请求 id 时工作流程记录不包含其他字段"""
+    workflows = bmad_agent_mcp.list_workflows(fields=["id"])["workflows"]
+    assert workflows and all(entry == {} for entry in workflows.values())
+    workflows = bmad_agent_mcp.list_workflows(fields=["id", "type"])["workflows"]
+    assert all(set(entry) == {"type"} for entry in workflows.values())
+
+
+def test_paginate_walks_all_pages():
+    """测试游标分页遍历全部数据"""
+    items = list(range(7))
+    seen, cursor = [], None
+    while True:
+        page = paginate(items, "v1", limit=3, cursor=cursor)
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == items
+    assert page["total"] == 7
+
+
+def test_paginate_rejects_stale_or_bad_cursor():
+    """测试目录版本变化后旧游标失效"""
+    cursor = paginate(list(range(5)), "v1", limit=2)["next_cursor"]
+    with pytest.raises(ValueError):
+        paginate(list(range(5)), "v2", limit=2, cursor=cursor)
+    with pytest.raises(ValueError):
+        paginate(list(range(5)), "v1", limit=2, cursor="not-a-cursor")
+    with pytest.raises(ValueError, match="无效的分页游标"):
+        paginate(list(range(5)), "v1", limit=2, cursor=encode_cursor("v1", -3))
+
+
+def test_content_version_is_order_independent_for_dicts():
+    """测试内容版本对字典键顺序不敏感"""
+    assert content_version({"a": 1, "b": [1, 2]}) == content_version({"b": [1, 2], "a": 1})
+    assert content_version({"a": 1}) != content_version({"a": 2})
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+目录增量扫描测试
+
+测试验证结果缓存、变化检测和与单文件验证的一致性
+"""
+
+import os
+
+from utils import BMADUtils, CatalogScanner, file_signature, parse_agent_markdown, text_hash
+
+AGENT_TEMPLATE = """# {agent_id}
+
+```yaml
+agent:
+  id: {agent_id}
+  name: {name}
+  title: Tester
+persona:
+  role: Test role
+```
+"""
+
+
+def _write_catalog(root):
+    (root / "agents").mkdir(parents=True)
+    (root / "workflows").mkdir()
+    for agent_id in ("dev", "qa"):
+        (root / "agents" / f"{agent_id}.md").write_text(
+            AGENT_TEMPLATE.format(agent_id=agent_id, name=agent_id.upper()), encoding="utf-8")
+    (root / "agents" / "broken.md").write_text("no yaml here", encoding="utf-8")
+    (root / "workflows" / "flow.yaml").write_text(
+        "workflow:\n  id: flow\n  name: Flow\n  description: d\n  sequence: []\n", encoding="utf-8")
+
+
+def _sources(result):
+    return {entry["file"]: entry["source"] for entry in result["timing"]}
+
+
+def test_rescan_uses_cache_and_revalidates_changed_files(tmp_path):
+    """测试重复扫描命中缓存，只重新验证变化的文件"""
+    _write_catalog(tmp_path)
+    scanner = CatalogScanner()
+
+    first = scanner.scan(tmp_path)
+    assert set(_sources(first).values()) == {"validated"}
+    assert first["agents"]["invalid"] == [{"file": "broken.md", "errors": ["未找到 YAML 配置块"]}]
+    assert first["workflows"]["valid"] == ["flow.yaml"]
+
+    second = scanner.scan(tmp_path)
+    assert set(_sources(second).values()) == {"cached"}
+
+    qa_file = tmp_path / "agents" / "qa.md"
+    qa_file.write_text(qa_file.read_text(encoding="utf-8").replace("name: QA", "name: Quinn"), encoding="utf-8")
+    dev_file = tmp_path / "agents" / "dev.md"
+    os.utime(dev_file, ns=(dev_file.stat().st_atime_ns, dev_file.stat().st_mtime_ns + 10**9))
+
+    third = scanner.scan(tmp_path)
+    sources = _sources(third)
+    assert sources["agents/qa.md"] == "validated"
+    assert sources["agents/dev.md"] == "unchanged"
+    assert sources["workflows/flow.yaml"] == "cached"
+
+
+def test_scan_matches_single_file_validation(tmp_path):
+    """测试扫描结果与单文件验证一致，并复用已有解析结果"""
+    _write_catalog(tmp_path)
+    (tmp_path / "workflows" / "bad.yaml").write_text("workflow:\n  id: bad\n", encoding="utf-8")
+
+    scanned = BMADUtils.scan_bmad_core(tmp_path)
+    expected = BMADUtils.validate_workflow_file(tmp_path / "workflows" / "bad.yaml")
+    invalid = {entry["file"]: entry["errors"] for entry in scanned["workflows"]["invalid"]}
+    assert invalid["bad.yaml"] == expected["errors"]
+
+    dev_file = tmp_path / "agents" / "dev.md"
+    content = dev_file.read_text(encoding="utf-8")
+    parsed = {str(dev_file): {
+        "signature": file_signature(dev_file),
+        "hash": text_hash(content),
+        "config": parse_agent_markdown(content),
+        "error": None
+    }}
+    result = CatalogScanner().scan(tmp_path, parsed)
+    assert _sources(result)["agents/dev.md"] == "catalog"
+    assert "dev.md" in result["agents"]["valid"]
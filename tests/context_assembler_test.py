@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+开发上下文组装测试
+
+测试跨文件去重、token 预算截断、热调用不读取文件以及修改后重新读取
+"""
+
+import os
+
+from context_assembler import ContextAssembler, estimate_tokens, split_blocks
+
+SHARED = "All services must log in structured JSON with a request id field."
+
+CODING_STANDARDS = f"""# Coding Standards
+
+{SHARED}
+
+```python
+def handler():
+
+    return None
+```
+"""
+
+TECH_STACK = f"""# Tech Stack
+
+- Python 3.11
+- FastMCP
+
+{SHARED}
+"""
+
+
+def _project(root):
+    (root / "docs").mkdir()
+    (root / "docs" / "coding-standards.md").write_text(CODING_STANDARDS, encoding="utf-8")
+    (root / "docs" / "tech-stack.md").write_text(TECH_STACK, encoding="utf-8")
+    return ["docs/coding-standards.md", "docs/tech-stack.md", "docs/missing.md"]
+
+
+def test_split_blocks_keeps_code_fences_whole():
+    """测试代码块中的空行不切分"""
+    blocks = split_blocks(CODING_STANDARDS)
+    assert blocks[-1].startswith("```python") and blocks[-1].rstrip().endswith("```")
+    assert estimate_tokens("需求分析") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_assemble_dedups_and_caches(tmp_path):
+    """测试重复段落只出现一次，热调用不读取文件"""
+    files = _project(tmp_path)
+    assembler = ContextAssembler(tmp_path)
+
+    result = assembler.assemble(files, 1000)
+    assert result["content"].count(SHARED) == 1
+    assert result["duplicate_blocks"] == 1
+    assert result["missing"] == ["docs/missing.md"]
+    assert [entry["status"] for entry in result["files"]] == ["included", "included"]
+    assert not result["cached"]
+
+    warm = assembler.assemble(files, 1000)
+    assert warm["cached"] and warm["content"] == result["content"]
+    assert assembler.stats == {"file_reads": 2, "file_hits": 0, "assembled_hits": 1}
+
+    path = tmp_path / "docs" / "tech-stack.md"
+    path.write_text(TECH_STACK.replace("3.11", "3.12"), encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    updated = assembler.assemble(files, 1000)
+    assert "Python 3.12" in updated["content"]
+    assert assembler.stats["file_reads"] == 3 and assembler.stats["file_hits"] == 1
+
+
+def test_assemble_respects_token_budget(tmp_path):
+    """测试超出预算时截断当前文件并省略后续文件"""
+    files = _project(tmp_path)
+    result = ContextAssembler(tmp_path).assemble(files, 30)
+
+    assert result["tokens"] <= 30
+    assert result["truncated"]
+    assert [entry["status"] for entry in result["files"]] == ["truncated", "omitted"]
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+文档章节索引测试
+
+测试章节字节范围、按标题读取、大纲以及文件修改后的索引失效
+"""
+
+import os
+
+from doc_sections import SectionIndex
+
+DOCUMENT = """# Architecture
+
+## Tech Stack
+
+| Layer | Choice |
+|-------|--------|
+| API   | FastAPI |
+
+### 数据库
+
+PostgreSQL
+
+```python
+# 代码块中的注释不是标题
+```
+
+## Coding Standards
+
+Use black.
+"""
+
+
+def test_read_sections_by_heading(tmp_path):
+    """测试章节包含下级章节，标题匹配大小写不敏感或使用 kebab-case"""
+    path = tmp_path / "architecture.md"
+    path.write_text(DOCUMENT, encoding="utf-8")
+    index = SectionIndex()
+
+    result = index.read(path, ["tech stack", "coding-standards", "Deployment"])
+    tech, standards = result["sections"]
+    assert tech["content"].startswith("## Tech Stack\n")
+    assert "PostgreSQL" in tech["content"] and "Use black" not in tech["content"]
+    assert standards["content"] == "## Coding Standards\n\nUse black.\n"
+    assert result["missing"] == ["Deployment"]
+    assert result["bytes_read"] == len((tech["content"] + standards["content"]).encode("utf-8"))
+    assert result["bytes_read"] < result["file_size"]
+
+    assert index.read(path, ["数据库"])["sections"][0]["content"].endswith("```\n\n")
+
+
+def test_outline_and_mtime_invalidation(tmp_path):
+    """测试大纲复用缓存，文件修改后重建索引"""
+    path = tmp_path / "architecture.md"
+    path.write_text(DOCUMENT, encoding="utf-8")
+    index = SectionIndex()
+
+    outline = index.outline(path)
+    assert [(s["title"], s["level"]) for s in outline["sections"]] == [
+        ("Architecture", 1), ("Tech Stack", 2), ("数据库", 3), ("Coding Standards", 2)
+    ]
+    index.outline(path)
+    assert index.stats == {"hits": 1, "builds": 1}
+
+    path.write_text(DOCUMENT + "\n## Testing\n\nUse pytest.\n", encoding="utf-8")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert index.read(path, ["Testing"])["sections"][0]["content"] == "## Testing\n\nUse pytest.\n"
+    assert index.stats["builds"] == 2
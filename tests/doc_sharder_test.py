@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+文档分片测试
+
+测试按标题拆分、代码块中的 # 行、索引生成、只重写变化的分片和分片目录配置
+"""
+
+from pathlib import Path
+
+from doc_sharder import shard_location, shard_markdown, slugify
+
+DOCUMENT = """# Product Requirements
+
+Intro paragraph.
+
+## Goals
+
+- Ship it
+
+### Success Metrics
+
+```bash
+## not a heading
+```
+
+## Epic 1: Foundation
+
+Set up the repo.
+
+## Goals
+
+Duplicate title.
+"""
+
+
+def test_shard_markdown_splits_by_heading(tmp_path):
+    """测试分片内容、标题提升和索引"""
+    source = tmp_path / "prd.md"
+    source.write_text(DOCUMENT, encoding="utf-8")
+    result = shard_markdown(source, tmp_path / "prd")
+
+    assert [shard["file"] for shard in result["shards"]] == ["goals.md", "epic-1-foundation.md", "goals-2.md"]
+    assert result["counts"] == {"created": 3, "updated": 0, "unchanged": 0}
+
+    goals = (tmp_path / "prd" / "goals.md").read_text(encoding="utf-8")
+    assert goals.startswith("# Goals\n")
+    assert "## Success Metrics" in goals
+    assert "```bash\n## not a heading\n```" in goals
+
+    index = (tmp_path / "prd" / "index.md").read_text(encoding="utf-8")
+    assert index.startswith("# Product Requirements\n\nIntro paragraph.\n")
+    assert "- [Epic 1: Foundation](./epic-1-foundation.md)" in index
+
+
+def test_only_changed_shards_are_rewritten(tmp_path):
+    """测试再次拆分时只替换变化的分片，并报告旧分片"""
+    source = tmp_path / "prd.md"
+    source.write_text(DOCUMENT, encoding="utf-8")
+    destination = tmp_path / "prd"
+    shard_markdown(source, destination)
+    epic = destination / "epic-1-foundation.md"
+    epic_inode = epic.stat().st_ino
+
+    source.write_text(DOCUMENT.replace("Ship it", "Ship it soon").replace("## Goals\n\nDuplicate title.\n", ""),
+                      encoding="utf-8")
+    result = shard_markdown(source, destination)
+
+    statuses = {shard["file"]: shard["status"] for shard in result["shards"]}
+    assert statuses == {"goals.md": "updated", "epic-1-foundation.md": "unchanged"}
+    assert result["index"]["status"] == "updated"
+    assert result["stale"] == ["goals-2.md"]
+    assert epic.stat().st_ino == epic_inode
+    assert not list(destination.glob("*.tmp"))
+
+
+def test_shard_location_uses_core_config():
+    """测试 PRD 和架构文档使用配置的分片目录"""
+    config = {"prd": {"prdFile": "docs/prd.md", "prdShardedLocation": "docs/prd-shards"}}
+    assert shard_location(config, Path("docs/prd.md")) == Path("docs/prd-shards")
+    assert shard_location(config, Path("docs/brief.md")) == Path("docs/brief")
+    assert slugify("Tech Stack & Tools") == "tech-stack-tools"
+
+
+def test_shard_location_matches_absolute_path(tmp_path):
+    """测试绝对路径的文档与相对于项目根目录的配置匹配"""
+    config = {"architecture": {"architectureFile": "docs/architecture.md",
+                               "architectureShardedLocation": "docs/architecture"}}
+    document = tmp_path / "docs" / "architecture.md"
+    assert shard_location(config, document, tmp_path) == tmp_path / "docs" / "architecture"
+    assert shard_location(config, Path("docs/../docs/architecture.md"), tmp_path) == tmp_path / "docs" / "architecture"
+    assert shard_location(config, tmp_path / "other" / "architecture.md", tmp_path) == tmp_path / "other" / "architecture"
+
+
+def test_higher_heading_ends_shard(tmp_path):
+    """测试章节之后的更高级标题结束分片，其内容写入索引"""
+    source = tmp_path / "architecture.md"
+    source.write_text("# Architecture\n\n## Overview\n\nText.\n\n# Appendix\n\nNotes.\n\n## Glossary\n\nTerms.\n",
+                      encoding="utf-8")
+    result = shard_markdown(source, tmp_path / "architecture")
+
+    assert [shard["file"] for shard in result["shards"]] == ["overview.md", "glossary.md"]
+    overview = (tmp_path / "architecture" / "overview.md").read_text(encoding="utf-8")
+    assert overview == "# Overview\n\nText.\n\n"
+    index = (tmp_path / "architecture" / "index.md").read_text(encoding="utf-8")
+    assert index.startswith("# Architecture\n\n# Appendix\n\nNotes.\n\n")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+HTTP 传输测试
+
+测试传输配置解析、gzip 压缩，以及关闭时排空进行中的 LLM 调用
+"""
+
+import asyncio
+import gzip
+import threading
+import time
+
+import pytest
+import uvicorn
+
+from http_server import DrainingServer, InflightTracker, ServerDraining, TransportConfig, build_http_app, parse_transport_args
+
+
+def test_transport_args_override_env(monkeypatch):
+    """测试命令行参数优先于环境变量"""
+    monkeypatch.setenv("MCP_TRANSPORT", "sse")
+    monkeypatch.setenv("MCP_PORT", "9001")
+    monkeypatch.setenv("BMAD_GZIP_MIN_BYTES", "2048")
+    monkeypatch.setenv("BMAD_WORKERS", "4")
+
+    config = parse_transport_args([])
+    assert (config.transport, config.port, config.gzip_min_bytes, config.workers) == ("sse", 9001, 2048, 4)
+    assert parse_transport_args(["--workers", "0"]).workers == 1
+
+    config = parse_transport_args(["--transport", "streamable-http", "--port", "9100", "--host", "0.0.0.0"])
+    assert (config.transport, config.host, config.port) == ("http", "0.0.0.0", 9100)
+
+
+def test_gzip_large_responses():
+    """测试超过阈值的响应按客户端的 Accept-Encoding 压缩"""
+    from bmad_agent_mcp import mcp
+
+    app = build_http_app(mcp, TransportConfig(transport="http", gzip_min_bytes=16))
+
+    async def get(path, encoding):
+        messages = []
+        scope = {
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http", "path": path,
+            "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"127.0.0.1:8000"), (b"accept-encoding", encoding.encode())],
+            "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+        }
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await app(scope, receive, send)
+        headers = dict(messages[0]["headers"])
+        return headers, b"".join(message.get("body", b"") for message in messages[1:])
+
+    headers, body = asyncio.run(get("/metrics", "gzip"))
+    assert headers.get(b"content-encoding") == b"gzip"
+    plain_headers, plain = asyncio.run(get("/metrics", "identity"))
+    assert b"content-encoding" not in plain_headers
+    assert gzip.decompress(body).startswith(plain[:16])
+
+
+def test_tracker_refuses_new_calls_while_draining():
+    """测试开始关闭后拒绝新的调用"""
+    tracker = InflightTracker()
+    with tracker.track():
+        assert tracker.active == 1
+    tracker.begin_drain()
+    with pytest.raises(ServerDraining):
+        with tracker.track():
+            pass
+    assert tracker.active == 0
+
+
+def test_drain_waits_for_inflight_calls():
+    """测试关闭时等待进行中的调用完成，超时后不再等待"""
+    tracker = InflightTracker()
+    server = DrainingServer(uvicorn.Config(app=None), tracker, drain_timeout=5)
+    started = threading.Event()
+
+    def slow_call():
+        with tracker.track():
+            started.set()
+            time.sleep(0.3)
+
+    worker = threading.Thread(target=slow_call)
+    worker.start()
+    started.wait()
+    begin = time.monotonic()
+    assert asyncio.run(server.drain()) is True
+    assert tracker.active == 0 and time.monotonic() - begin >= 0.2
+    worker.join()
+
+    tracker = InflightTracker()
+    server = DrainingServer(uvicorn.Config(app=None), tracker, drain_timeout=0.2)
+    with tracker.track():
+        assert asyncio.run(server.drain()) is False
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+内存诊断测试
+
+测试近似字节数统计和 tracemalloc 基线对比
+"""
+
+from dataclasses import dataclass
+from typing import List
+
+from memory_stats import MemoryTracker, deep_sizeof, structure_sizes
+
+
+@dataclass
+class _Step:
+    agent: str
+    notes: List[str]
+
+
+def test_deep_sizeof_counts_nested_and_shared_objects_once():
+    """测试递归统计嵌套对象且共享对象只计一次"""
+    payload = "x" * 10000
+    single = deep_sizeof({"a": payload})
+    shared = deep_sizeof({"a": payload, "b": payload})
+
+    assert single > 10000
+    assert shared - single < 1000
+    assert deep_sizeof(_Step("pm", ["n" * 5000])) > 5000
+
+
+def test_structure_sizes_reports_entries():
+    """测试数据结构大小报告"""
+    sizes = structure_sizes({"templates": {"prd": "x" * 2000}, "workflow_state": {}})
+    assert sizes["templates"]["entries"] == 1
+    assert sizes["templates"]["approx_bytes"] > 2000
+    assert sizes["workflow_state"]["entries"] == 0
+
+
+def test_tracker_diff_finds_growth():
+    """测试基线对比能定位新增分配"""
+    tracker = MemoryTracker()
+    tracker.start(frames=1)
+    try:
+        retained = [bytearray(1024) for _ in range(200)]
+        growth = tracker.diff(top_n=5)
+        assert growth[0]["size_diff_bytes"] >= 200 * 1024
+        assert "memory_stats_test.py" in growth[0]["location"]
+        assert retained
+    finally:
+        tracker.stop()
+    assert not tracker.tracing
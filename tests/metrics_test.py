@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+指标采集测试
+
+测试工具调用统计、延迟直方图和 Prometheus 文本导出
+"""
+
+import asyncio
+import gc
+import inspect
+import weakref
+
+from metrics import Histogram, MetricsRegistry, instrument
+
+
+def test_histogram_buckets_and_quantile():
+    """测试直方图分桶和分位数估算"""
+    histogram = Histogram((0.01, 0.1, 1.0))
+    for value in (0.005, 0.05, 0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.cumulative_buckets()[-1] == ("+Inf", 5)
+    assert 0.01 <= histogram.quantile(0.5) <= 0.1
+
+
+def test_instrument_records_calls_and_errors():
+    """测试工具包装记录调用次数、错误和响应大小"""
+    registry = MetricsRegistry()
+
+    @instrument(registry=registry)
+    def lookup(agent_id: str):
+        """查找智能体"""
+        if agent_id == "missing":
+            return {"error": "not found"}
+        return {"success": True, "agent_id": agent_id}
+
+    lookup("pm")
+    lookup("missing")
+
+    stats = registry.snapshot()["tools"]["lookup"]
+    assert stats["calls"] == 2
+    assert stats["errors"] == 1
+    assert stats["payload_bytes"]["max"] > 0
+    # FastMCP 依赖原函数签名生成参数模式
+    assert list(inspect.signature(lookup).parameters) == ["agent_id"]
+
+
+def test_instrument_async_and_exceptions():
+    """测试异步工具和异常计数"""
+    registry = MetricsRegistry()
+
+    @instrument(registry=registry)
+    async def slow_tool():
+        return {"success": True}
+
+    @instrument(registry=registry)
+    def broken_tool():
+        raise RuntimeError("boom")
+
+    asyncio.run(slow_tool())
+    try:
+        broken_tool()
+    except RuntimeError:
+        pass
+
+    snapshot = registry.snapshot()
+    assert snapshot["tools"]["slow_tool"]["calls"] == 1
+    assert snapshot["tools"]["broken_tool"]["errors"] == 1
+
+
+def test_prometheus_exposition_separates_llm_latency():
+    """测试 Prometheus 导出中 LLM 后端延迟单独成组"""
+    registry = MetricsRegistry()
+    registry.record_tool("call_agent_with_llm", 1.2, False, 128)
+    registry.record_llm("deepseek", "deepseek-chat", 1.1, False, {"prompt_tokens": 10, "completion_tokens": 5})
+
+    text = registry.render_prometheus()
+    assert 'bmad_tool_calls_total{tool="call_agent_with_llm"} 1' in text
+    assert 'bmad_llm_latency_seconds_count{backend="deepseek",model="deepseek-chat"} 1' in text
+    assert 'kind="completion"} 5' in text
+
+
+def test_response_serialized_once_with_tracing(monkeypatch):
+    """测试指标和链路追踪同时启用时每个响应只序列化一次"""
+    import metrics
+    from tracing import Tracer
+
+    class MemoryExporter:
+        def __init__(self):
+            self.spans = []
+
+        def export(self, span):
+            self.spans.append(span)
+
+    calls = []
+    dumps = metrics.json.dumps
+    monkeypatch.setattr(metrics.json, "dumps", lambda *args, **kwargs: calls.append(1) or dumps(*args, **kwargs))
+
+    registry, exporter = MetricsRegistry(), MemoryExporter()
+
+    @instrument(registry=registry)
+    @Tracer(exporter).traced
+    def lookup(agent_id: str):
+        return {"success": True, "agent_id": agent_id}
+
+    lookup("pm")
+    lookup("pm")
+    assert len(calls) == 2
+    serialized = [span.attributes["response.bytes"] for span in exporter.spans if span.name == "response.serialize"]
+    assert serialized == [registry.snapshot()["tools"]["lookup"]["payload_bytes"]["max"]] * 2
+
+
+def test_response_not_retained_after_call():
+    """测试调用结束后不再持有响应对象（包括只有链路追踪、没有指标包装的情况）"""
+    import metrics
+    from tracing import Tracer
+
+    class Result(dict):
+        pass
+
+    class MemoryExporter:
+        def export(self, span):
+            pass
+
+    def lookup():
+        return Result(success=True, payload="x" * 1000)
+
+    for tool in (Tracer(MemoryExporter()).traced(lookup),
+                 instrument(Tracer(MemoryExporter()).traced(lookup), registry=MetricsRegistry())):
+        ref = weakref.ref(tool())
+        gc.collect()
+        assert ref() is None
+        assert metrics._payload_cache.get() is None
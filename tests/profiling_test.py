@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+按需性能分析测试
+
+测试 cProfile 包装、阈值过滤、折叠栈输出、并发调用和协程工具
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from profiling import ToolProfiler
+
+
+def _busy(milliseconds: float):
+    deadline = time.perf_counter() + milliseconds / 1000
+    total = 0
+    while time.perf_counter() < deadline:
+        total += 1
+    return total
+
+
+def test_disabled_profiler_writes_nothing(tmp_path):
+    """测试未启用时不产生任何文件"""
+    profiler = ToolProfiler(tools="", output_dir=tmp_path)
+
+    @profiler.profiled
+    def list_agents():
+        return {"success": True}
+
+    assert list_agents() == {"success": True}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_slow_calls_write_pstats_and_collapsed(tmp_path):
+    """测试超过阈值的调用写出 .pstats 和折叠栈文件"""
+    profiler = ToolProfiler(tools="scan_bmad_core", threshold_ms=5, output_dir=tmp_path)
+
+    @profiler.profiled
+    def scan_bmad_core():
+        return _busy(20)
+
+    @profiler.profiled
+    def list_agents():
+        return _busy(20)
+
+    scan_bmad_core()
+    list_agents()
+
+    profiles = profiler.list_profiles()
+    assert [p["tool"] for p in profiles] == ["scan_bmad_core"]
+
+    collapsed = (tmp_path / f"{profiles[0]['profile_id']}.collapsed").read_text(encoding="utf-8")
+    assert "_busy" in collapsed
+    stack, count = collapsed.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+
+    top = profiler.top_functions(profiles[0]["profile_id"])
+    assert any("_busy" in entry["function"] for entry in top)
+
+
+def test_fast_calls_below_threshold_are_dropped(tmp_path):
+    """测试低于阈值的调用不保存结果"""
+    profiler = ToolProfiler(output_dir=tmp_path)
+    profiler.configure(enabled=True, threshold_ms=1000)
+
+    @profiler.profiled
+    def get_template():
+        return "content"
+
+    get_template()
+    assert profiler.list_profiles() == []
+
+
+def test_concurrent_calls_profile_one_at_a_time(tmp_path):
+    """测试并发调用中只有一个被分析，其他调用照常执行"""
+    profiler = ToolProfiler(tools="*", threshold_ms=0, output_dir=tmp_path)
+    barrier = threading.Barrier(4)
+
+    @profiler.profiled
+    def scan_bmad_core(barrier=None):
+        if barrier is not None:
+            barrier.wait(5)
+        return _busy(10)
+
+    results, errors = [], []
+
+    def run():
+        try:
+            results.append(scan_bmad_core(barrier))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == [] and len(results) == 4
+    assert len(profiler.list_profiles()) == 1
+    # 分析结束后释放，后续调用可以再次分析
+    scan_bmad_core()
+    assert len(profiler.list_profiles()) == 2
+
+
+def _other_task_work(milliseconds: float):
+    return _busy(milliseconds)
+
+
+def test_async_tool_excludes_other_tasks(tmp_path):
+    """测试协程工具只分析自身执行的部分，await 期间其他任务的耗时不计入"""
+    profiler = ToolProfiler(tools="call_team", threshold_ms=0, output_dir=tmp_path)
+
+    @profiler.profiled
+    async def call_team():
+        _busy(5)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        async def other():
+            await asyncio.sleep(0.01)
+            _other_task_work(20)
+
+        return await asyncio.gather(call_team(), other())
+
+    assert asyncio.run(scenario())[0] == "done"
+    profiles = profiler.list_profiles()
+    assert len(profiles) == 1
+    functions = [entry["function"] for entry in profiler.top_functions(profiles[0]["profile_id"], top_n=100)]
+    assert any("_busy" in function for function in functions)
+    assert not any("_other_task_work" in function for function in functions)
+
+
+def test_async_tool_propagates_errors(tmp_path):
+    """测试协程工具的异常原样抛出，并释放分析器"""
+    profiler = ToolProfiler(tools="*", threshold_ms=0, output_dir=tmp_path)
+
+    @profiler.profiled
+    async def failing():
+        await asyncio.sleep(0)
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        asyncio.run(failing())
+    assert profiler.should_profile("failing")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+历史运行分析测试
+
+测试列存储的追加和重新打开、分组分位数、运行级指标、过滤，
+由导出的状态生成步骤行，以及 NumPy 与纯 Python 实现的一致性
+"""
+
+import random
+from datetime import datetime
+
+import pytest
+
+from run_analytics import NUMPY_AVAILABLE, RunAnalytics, rows_from_state
+from state_codec import read_state, write_state
+
+
+def _rows(runs: int, seed: int = 7):
+    rng = random.Random(seed)
+    agents = ["analyst", "pm", "architect", None]
+    return [
+        {
+            "run": f"run-{run}",
+            "workflow": "greenfield-service" if run % 3 else "brownfield-ui",
+            "step": step,
+            "agent": agents[step % 4],
+            "duration": round(rng.uniform(10, 1000), 3),
+            "completed_at": 1_700_000_000 + run * 3600 + step * 60,
+            "artifacts": step % 2,
+        }
+        for run in range(runs)
+        for step in range(5)
+    ]
+
+
+def test_group_percentiles_and_reopen(tmp_path):
+    """测试分组统计与逐组计算的结果一致，重新打开后数据仍在"""
+    rows = _rows(40)
+    analytics = RunAnalytics(tmp_path, use_numpy=False)
+    assert analytics.append(rows[:100]) == 100
+    assert analytics.append(rows[100:]) == 100
+
+    reopened = RunAnalytics(tmp_path, use_numpy=False)
+    result = reopened.analyze(["agent"], "duration", [0, 50, 100], workflow_id="greenfield-service")
+    assert result["rows"] == 200
+    architect = next(group for group in result["groups"] if group["agent"] == "architect")
+    expected = sorted(row["duration"] for row in rows
+                      if row["agent"] == "architect" and row["workflow"] == "greenfield-service")
+    assert architect["count"] == len(expected)
+    assert (architect["p0"], architect["p100"]) == (expected[0], expected[-1])
+    middle = len(expected) // 2
+    assert architect["p50"] == round((expected[middle - 1] + expected[middle]) / 2, 3)
+    assert {group["agent"] for group in result["groups"]} == {"analyst", "pm", "architect", None}
+
+
+def test_uncommitted_dictionary_lines_are_discarded(tmp_path):
+    """测试中途失败的追加留下的编码表行被丢弃，之后的编码与值保持一致"""
+    rows = _rows(2)
+    RunAnalytics(tmp_path, use_numpy=False).append(rows)
+    # 模拟写入编码表后、提交 meta.json 前进程退出
+    with open(tmp_path / "agent.dict", "a", encoding="utf-8") as f:
+        f.write('"orphan-1"\n"orphan-2"\n')
+
+    analytics = RunAnalytics(tmp_path, use_numpy=False)
+    analytics.append([{**rows[0], "run": "run-9", "agent": "qa"}])
+    reopened = RunAnalytics(tmp_path, use_numpy=False)
+    result = reopened.analyze(["agent"], "duration", [50], workflow_id=None, agent="qa")
+    assert [(group["agent"], group["count"]) for group in result["groups"]] == [("qa", 1)]
+    assert "orphan-1" not in (tmp_path / "agent.dict").read_text(encoding="utf-8")
+
+
+def test_run_metrics_and_filters(tmp_path):
+    """测试运行级指标先按运行汇总，时间和智能体过滤生效"""
+    analytics = RunAnalytics(tmp_path, use_numpy=False)
+    rows = _rows(6)
+    analytics.append(rows)
+
+    result = analytics.analyze(["workflow"], "run_steps", [50])
+    assert [(group["workflow"], group["count"], group["p50"]) for group in result["groups"]] == [
+        ("greenfield-service", 4, 5.0), ("brownfield-ui", 2, 5.0)]
+
+    since = datetime.fromtimestamp(1_700_000_000 + 2 * 3600).isoformat()
+    totals = analytics.analyze(["run"], "run_duration", [50], since=since, limit=1)
+    assert totals["total_groups"] == 4 and len(totals["groups"]) == 1
+
+    assert analytics.analyze(["step"], agent="pm")["matched"] == 6
+    assert analytics.analyze(agent="nobody")["groups"] == []
+    with pytest.raises(ValueError):
+        analytics.analyze(["agent"], "run_duration")
+
+
+def test_rows_from_exported_state(tmp_path):
+    """测试由导出的状态文件计算相邻完成时间之差"""
+    body = {"workflow_id": "greenfield-service", "run_id": "run-a", "started_at": "2024-01-01T10:00:00"}
+    records = [
+        ("completed_steps", {"step_index": 0, "completed_at": "2024-01-01T10:05:00", "artifacts": ["brief.md"]}),
+        ("completed_steps", {"step": {"agent": "pm"}, "completed_at": "2024-01-01T10:20:00"}),
+        ("task_executions", {"task_name": "create-doc"}),
+    ]
+    path = tmp_path / "run.bin"
+    write_state(path, body, records, "binary")
+
+    rows = list(rows_from_state(read_state(path), lambda state: state["run_id"], lambda workflow, index: "analyst"))
+    assert [(row["agent"], row["duration"], row["artifacts"]) for row in rows] == [
+        ("analyst", 300.0, 1), ("pm", 900.0, 0)]
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason="未安装 NumPy")
+def test_numpy_matches_pure_python(tmp_path):
+    """测试向量化实现与纯 Python 实现结果一致，列文件可以直接用 numpy.load 读取"""
+    import numpy as np
+
+    RunAnalytics(tmp_path).append(_rows(200))
+    vectorized, fallback = RunAnalytics(tmp_path, use_numpy=True), RunAnalytics(tmp_path, use_numpy=False)
+    queries = [
+        {"group_by": ["workflow", "agent"]},
+        {"group_by": ["step"], "percentiles": [5, 99.5]},
+        {"group_by": ["agent"], "metric": "artifacts", "workflow_id": "brownfield-ui"},
+        {"group_by": ["workflow"], "metric": "run_duration", "agent": "pm"},
+        {"group_by": ["run"], "since": "2023-11-20T00:00:00", "limit": 10},
+    ]
+    for query in queries:
+        assert vectorized.analyze(**query)["groups"] == fallback.analyze(**query)["groups"]
+
+    durations = np.load(tmp_path / "duration.npy", mmap_mode="r")
+    assert durations.shape == (1000,) and durations.dtype == np.float64
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+目录全文检索测试
+
+测试中英文混合分词、BM25 排序、类型过滤和增量同步
+"""
+
+from search_index import SearchIndex, tokenize
+
+
+def test_tokenize_mixed_text():
+    """测试英文按单词、中文按二元组切分"""
+    assert tokenize("Write PRD 需求分析") == ["write", "prd", "需求", "求分", "分析"]
+    assert tokenize("单") == ["单"]
+
+
+def test_search_ranks_relevant_documents_first():
+    """测试 BM25 排序和类型过滤"""
+    index = SearchIndex()
+    index.upsert("agent:pm", "agent", "v1", "Product Manager 负责产品需求文档 PRD", {"title": "PM"})
+    index.upsert("agent:qa", "agent", "v1", "Quality assurance 测试架构师", {"title": "QA"})
+    index.upsert("template:prd-tmpl", "template", "v1", "PRD template 产品需求 需求 需求", {"title": "prd-tmpl"})
+
+    results = index.search("产品需求", top_k=5)
+    assert {result["id"] for result in results} == {"pm", "prd-tmpl"}
+    assert results[0]["score"] >= results[1]["score"]
+
+    agents_only = index.search("PRD", kinds=["agent"])
+    assert [result["id"] for result in agents_only] == ["pm"]
+    assert agents_only[0]["title"] == "PM"
+    assert index.search("unrelated") == []
+
+
+def test_sync_only_reindexes_changed_entries():
+    """测试按内容版本增量同步"""
+    index = SearchIndex()
+    loaded = []
+
+    def loader(doc_id):
+        loaded.append(doc_id)
+        return texts[doc_id], {}
+
+    texts = {"agent:dev": "developer 开发", "agent:sm": "scrum master"}
+    assert index.sync({"agent:dev": "v1", "agent:sm": "v1"}, loader)["added"] == 2
+
+    loaded.clear()
+    texts["agent:dev"] = "full stack developer 全栈"
+    stats = index.sync({"agent:dev": "v2"}, loader)
+    assert stats == {"added": 0, "updated": 1, "removed": 1, "unchanged": 0}
+    assert loaded == ["agent:dev"]
+    assert index.search("scrum") == []
+    assert index.search("全栈")[0]["id"] == "dev"
+    assert "scrum" not in index.postings
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+多 worker 共享状态测试
+
+测试 SQLite 共享会话状态的增量 / 完整同步、写事务回滚，以及目录快照的发布和加载
+"""
+
+import pytest
+
+from catalog_snapshot import Catalog, CatalogSnapshot
+from shared_state import SharedStateStore
+from state_delta import StateJournal
+
+
+class _Core:
+    """模拟 BMADCore 中的会话属性"""
+
+    def __init__(self):
+        self.current_agent = None
+        self.current_workflow = None
+        self.workflow_state = {}
+        self.state_journal = StateJournal()
+
+    def start(self, workflow_id):
+        self.current_workflow = workflow_id
+        self.workflow_state = {"workflow_id": workflow_id, "current_step": 0, "completed_steps": []}
+        self.state_journal.reset()
+
+    def advance(self):
+        step = self.workflow_state["current_step"]
+        self.state_journal.record(self.workflow_state, [
+            {"op": "add", "path": "/completed_steps/-", "value": step},
+            {"op": "replace", "path": "/current_step", "value": step + 1},
+        ])
+
+
+def _stores(tmp_path):
+    db_file = tmp_path / "session.sqlite3"
+    first, second = _Core(), _Core()
+    first_store, second_store = SharedStateStore(db_file), SharedStateStore(db_file)
+    first_store.initialize(first)
+    return (first, first_store), (second, second_store)
+
+
+def test_writes_replay_incrementally_in_other_process(tmp_path):
+    """测试一个 worker 的修改在另一个 worker 中以相同的 revision 回放"""
+    (first, first_store), (second, second_store) = _stores(tmp_path)
+
+    with first_store.transaction(first):
+        first.start("greenfield-service")
+        first.current_agent = "pm"
+    assert second_store.pull(second)
+    assert second.workflow_state == first.workflow_state
+    assert (second.current_agent, second.current_workflow) == ("pm", "greenfield-service")
+
+    # 两边交替写入，revision 全局递增
+    with second_store.transaction(second):
+        second.advance()
+    with first_store.transaction(first):
+        first.advance()
+    assert second_store.pull(second)
+    assert second.workflow_state == first.workflow_state == {
+        "workflow_id": "greenfield-service", "current_step": 2, "completed_steps": [0, 1]
+    }
+    assert second.state_journal.revision == first.state_journal.revision
+    assert not second_store.pull(second)
+
+    # 同步后的日志可以继续为客户端计算增量
+    delta = second.state_journal.delta(second.workflow_state, second.state_journal.base_revision)
+    assert not delta["full"] and len(delta["ops"]) == 4
+
+
+def test_full_reload_after_replace_or_truncated_log(tmp_path):
+    """测试状态被整体替换或操作日志截断后改为完整读取"""
+    (first, first_store), (second, second_store) = _stores(tmp_path)
+    first_store.max_ops = second_store.max_ops = 2
+
+    with first_store.transaction(first):
+        first.start("brownfield-service")
+    second_store.pull(second)
+    for _ in range(4):
+        with first_store.transaction(first):
+            first.advance()
+    assert second_store.pull(second)
+    assert second.workflow_state["completed_steps"] == [0, 1, 2, 3]
+
+    with first_store.transaction(first):
+        first.start("greenfield-ui")
+    assert second_store.pull(second)
+    assert second.workflow_state == first.workflow_state
+    assert second.state_journal.base_revision == first.state_journal.base_revision
+
+
+def test_failed_transaction_rolls_back(tmp_path):
+    """测试写事务出错时数据库回滚，本地状态下次同步时被覆盖"""
+    (first, first_store), (second, second_store) = _stores(tmp_path)
+    with first_store.transaction(first):
+        first.start("greenfield-service")
+
+    with pytest.raises(RuntimeError):
+        with first_store.transaction(first):
+            first.advance()
+            raise RuntimeError("tool failed")
+    assert first.workflow_state["current_step"] == 1
+
+    assert first_store.pull(first)
+    assert first.workflow_state["current_step"] == 0
+    second_store.pull(second)
+    assert second.workflow_state == first.workflow_state
+
+
+def test_catalog_snapshot_round_trip(tmp_path):
+    """测试目录快照发布后其他进程能发现变化并加载"""
+    catalog = Catalog(agents={"pm": {"name": "John"}}, catalog_version="3")
+
+    publisher = CatalogSnapshot(tmp_path / "catalog.pickle")
+    reader = CatalogSnapshot(tmp_path / "catalog.pickle")
+    assert not reader.changed()
+
+    assert publisher.publish(catalog) > 0
+    assert not publisher.changed()
+    assert reader.changed()
+    data = reader.load()
+    assert data == catalog and data is not catalog
+    assert data.agents == {"pm": {"name": "John"}} and data.catalog_version == "3"
+    assert not reader.changed()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+LLM 请求合并测试
+
+测试相同的并发请求只调用一次后端、异常传给所有等待者，以及 leader 的调用方取消后
+其他等待者仍拿到结果
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import bmad_agent_mcp
+from singleflight import SingleFlight, request_key
+
+
+def _start(flights, key, fn, results):
+    def run():
+        try:
+            results.append(flights.do(key, fn))
+        except Exception as e:
+            results.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiters(flights, key, count):
+    deadline = time.monotonic() + 5
+    while flights._calls[key].waiters < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_request_key_is_canonical():
+    """测试键不受字典键顺序影响，参数不同时键不同"""
+    assert request_key("call_agent", task="t", context={"a": 1, "b": 2}) == \
+        request_key("call_agent", context={"b": 2, "a": 1}, task="t")
+    assert request_key("call_agent", task="t") != request_key("call_agent", task="u")
+    assert request_key("call_agent", task="t") != request_key("analyze_requirements", task="t")
+
+
+def test_concurrent_duplicates_share_one_call():
+    """测试并发的相同请求只执行一次，每个调用方拿到独立副本"""
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return {"response": "ok", "usage": {"total_tokens": 10}}
+
+    results = []
+    threads = [_start(flights, "k", fn, results)]
+    while not calls:
+        time.sleep(0.001)
+    threads += [_start(flights, "k", fn, results) for _ in range(4)]
+    _wait_for_waiters(flights, "k", 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    values = [value for value, _ in results]
+    assert all(value == {"response": "ok", "usage": {"total_tokens": 10}} for value in values)
+    values[0]["usage"]["total_tokens"] = 0
+    assert values[1]["usage"]["total_tokens"] == 10
+    assert flights.stats() == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+    # 调用结束后不再合并
+    assert flights.do("k", lambda: {"response": "again"}) == ({"response": "again"}, False)
+
+
+def test_error_reaches_all_waiters():
+    """测试 leader 的异常传给所有等待者，之后的请求重新执行"""
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ConnectionError("provider down")
+
+    results = []
+    threads = [_start(flights, "k", fail, results)]
+    started.wait(5)
+    threads.append(_start(flights, "k", fail, results))
+    _wait_for_waiters(flights, "k", 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert [type(result) for result in results] == [ConnectionError, ConnectionError]
+    assert flights.do("k", lambda: 1) == (1, False)
+
+
+def test_cancelled_leader_caller_does_not_cancel_waiters():
+    """测试 leader 的调用方超时断开后，等待同一调用的请求仍拿到结果"""
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        return {"response": "done"}
+
+    async def scenario():
+        leader = asyncio.create_task(asyncio.to_thread(flights.do, "k", fn))
+        await asyncio.to_thread(started.wait, 5)
+        follower = asyncio.create_task(asyncio.to_thread(flights.do, "k", fn))
+        await asyncio.to_thread(_wait_for_waiters, flights, "k", 1)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        release.set()
+        return await asyncio.wait_for(follower, 5)
+
+    assert asyncio.run(scenario()) == ({"response": "done"}, True)
+
+
+def test_call_agent_with_llm_coalesces(monkeypatch):
+    """测试并发的相同 call_agent_with_llm 请求只调用一次外部 API"""
+    release = threading.Event()
+    calls = []
+
+    class FakeClient:
+        def call_agent(self, agent_id, agent_config, task, context=None):
+            calls.append(task)
+            release.wait(5)
+            return {"success": True, "agent_id": agent_id, "response": f"answer to {task}"}
+
+    monkeypatch.setattr(bmad_agent_mcp, "is_builtin_mode", lambda: False)
+    monkeypatch.setattr(bmad_agent_mcp, "get_llm_client", lambda: FakeClient())
+    flights = SingleFlight()
+    monkeypatch.setattr(bmad_agent_mcp, "llm_flights", flights)
+
+    def call(task):
+        return bmad_agent_mcp.call_agent_with_llm("pm", task, {"priority": "high"})
+
+    results = []
+    threads = []
+    for task in ("write PRD", "write PRD", "write PRD", "review PRD"):
+        thread = threading.Thread(target=lambda task=task: results.append(call(task)))
+        thread.start()
+        threads.append(thread)
+    deadline = time.monotonic() + 5
+    while flights.coalesced < 2 or len(calls) < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(calls) == ["review PRD", "write PRD"]
+    assert all(result["success"] and result["mode"] == "external_api" for result in results)
+    assert sorted(result["coalesced"] for result in results) == [False, False, True, True]
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+冷启动测试
+
+确保导入服务模块时不加载 OpenAI SDK、不创建 LLM 客户端、不修改全局日志配置
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _import_and_inspect(module: str) -> dict:
+    code = (
+        f"import sys, json, logging; import {module}; import llm_client; "
+        "print(json.dumps({"
+        "'openai': 'openai' in sys.modules, "
+        "'client_created': llm_client.llm_client is not None, "
+        "'root_handlers': len(logging.getLogger().handlers)}))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, encoding="utf-8",
+        env=dict(os.environ, USE_BUILTIN_LLM="true")
+    )
+    assert completed.returncode == 0, completed.stderr
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_llm_client_import_is_lazy():
+    """测试导入 llm_client 没有副作用"""
+    result = _import_and_inspect("llm_client")
+    assert result == {"openai": False, "client_created": False, "root_handlers": 0}
+
+
+def test_service_import_is_lazy():
+    """测试导入主服务模块不创建 LLM 客户端也不配置日志"""
+    result = _import_and_inspect("bmad_agent_mcp")
+    assert result == {"openai": False, "client_created": False, "root_handlers": 0}
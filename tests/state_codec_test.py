@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+工作流程状态导入导出格式测试
+
+测试各格式往返、格式自动识别、原子写入、损坏文件的错误，以及导入长历史时的有界内存
+"""
+
+import gzip
+import json
+import os
+import stat
+
+import pytest
+
+import bmad_agent_mcp
+from state_codec import FORMATS, detect_format, read_state, write_state
+from state_retention import StateRetention
+
+BODY = {"workflow_id": "greenfield-service", "run_id": "run-1", "current_step": 2, "status": "active",
+        "ratio": 0.5, "offset": -3, "done": False, "note": None}
+
+
+def _records(count):
+    for i in range(count):
+        yield "task_executions", {"task_name": f"task-{i % 3}", "agent": "dev", "executed_at": f"t{i}",
+                                  "context": {"story": "1.2", "需求": "登录"}}
+    yield "created_artifacts", "prd.md"
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_round_trip_and_detection(tmp_path, fmt):
+    """测试各格式写入后读取结果一致，并能根据文件头识别格式"""
+    path = tmp_path / "state.out"
+    written = write_state(path, BODY, _records(50), fmt)
+    assert written["records"] == 51
+
+    assert detect_format(path) == fmt
+    records = list(read_state(path))
+    assert records[0] == (None, BODY)
+    assert sorted(map(repr, records[1:])) == sorted(map(repr, _records(50)))
+    assert [p.name for p in tmp_path.iterdir()] == ["state.out"]
+
+
+def test_failed_write_keeps_previous_file(tmp_path):
+    """测试写入失败时保留原文件且不留下临时文件"""
+    path = tmp_path / "state.jsonl"
+    write_state(path, BODY, _records(1), "jsonl")
+    before = path.read_bytes()
+
+    def broken():
+        yield "task_executions", {"ok": 1}
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        write_state(path, BODY, broken(), "jsonl")
+    assert path.read_bytes() == before
+    assert [p.name for p in tmp_path.iterdir()] == ["state.jsonl"]
+
+
+def test_written_file_mode_follows_umask(tmp_path):
+    """测试新文件的权限由 umask 决定，覆盖时保留原文件的权限"""
+    path = tmp_path / "state.jsonl"
+    old_umask = os.umask(0o022)
+    try:
+        write_state(path, BODY, _records(1), "jsonl")
+    finally:
+        os.umask(old_umask)
+    assert stat.S_IMODE(path.stat().st_mode) == 0o644
+
+    path.chmod(0o640)
+    write_state(path, BODY, _records(2), "gzip")
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+
+
+def _jsonl(*records):
+    header = json.dumps({"format": "bmad-workflow-state", "version": 1})
+    return "\n".join([header, *map(json.dumps, records)]) + "\n"
+
+
+@pytest.mark.parametrize("name, content", [
+    # 长度前缀完整，但列表声明了 5 个元素而负载只有标记
+    ("list.bin", b"BMADST\x01\x02\x06\x05"),
+    # 引用了从未出现过的字典键编号
+    ("key.bin", b"BMADST\x01\x06\x06\x02\x00\x07\x05\x00"),
+    ("float.bin", b"BMADST\x01\x02\x04\x00"),
+    ("truncated.gz", gzip.compress(_jsonl([None, BODY]).encode("utf-8"))[:-12]),
+    ("corrupt.gz", gzip.compress(_jsonl([None, BODY]).encode("utf-8"))[:10] + b"\xff" * 40),
+    ("scalar.jsonl", _jsonl([None, BODY], 5).encode("utf-8")),
+    ("body.jsonl", _jsonl([None, ["not", "a", "dict"]]).encode("utf-8")),
+    ("list-name.jsonl", _jsonl([None, BODY], ["workflow_id", "x"]).encode("utf-8")),
+    ("no-body.jsonl", _jsonl(["task_executions", {}]).encode("utf-8")),
+])
+def test_corrupt_files_raise_value_error(tmp_path, name, content):
+    """测试截断、损坏或结构不对的文件读取时统一抛出 ValueError"""
+    path = tmp_path / name
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        list(read_state(path))
+
+
+def test_import_corrupt_file_returns_error(tmp_path):
+    """测试导入损坏的文件时工具返回错误而不是抛出异常"""
+    path = tmp_path / "state.jsonl"
+    path.write_text(_jsonl([None, BODY], 5), encoding="utf-8")
+    result = bmad_agent_mcp.import_workflow_state(str(path))
+    assert "error" in result
+
+
+def test_import_long_history_is_bounded(tmp_path, monkeypatch):
+    """测试导出完整历史后导入时只在内存中保留最近的条目"""
+    retention = StateRetention(tmp_path / "spill", {"completed_steps": 10, "task_executions": 10})
+    monkeypatch.setattr(bmad_agent_mcp, "state_retention", retention)
+    monkeypatch.setattr(bmad_agent_mcp, "IMPORT_SPILL_BATCH", 100)
+
+    path = tmp_path / "state.bin"
+    write_state(path, {**BODY, "history_complete": True}, _records(1000), "binary")
+    result = bmad_agent_mcp.import_workflow_state(str(path), compact=True)
+    assert result["success"]
+
+    state = bmad_agent_mcp.bmad_core.workflow_state
+    assert [entry["executed_at"] for entry in state["task_executions"]] == [f"t{i}" for i in range(990, 1000)]
+    assert state["rollup"]["task_executions"]["count"] == 990
+    assert state["created_artifacts"] == ["prd.md"]
+
+    export = bmad_agent_mcp.export_workflow_state(str(tmp_path / "again.jsonl.gz"))
+    assert export["format"] == "gzip" and export["records"] == 1001
+    bmad_agent_mcp.reset_workflow()
+
+
+def test_failed_import_keeps_spilled_history(tmp_path, monkeypatch):
+    """测试导入损坏的文件时不删除运行已写入磁盘的历史，不带完整历史的文件追加而不替换"""
+    retention = StateRetention(tmp_path / "spill", {"completed_steps": 10, "task_executions": 10})
+    monkeypatch.setattr(bmad_agent_mcp, "state_retention", retention)
+    monkeypatch.setattr(bmad_agent_mcp, "IMPORT_SPILL_BATCH", 5)
+
+    path = tmp_path / "state.jsonl.gz"
+    write_state(path, {**BODY, "history_complete": True}, _records(30), "gzip")
+    assert bmad_agent_mcp.import_workflow_state(str(path), compact=True)["success"]
+
+    def history():
+        return [entry["executed_at"] for entry in retention.history(
+            bmad_agent_mcp.bmad_core.workflow_state, "task_executions", "run-1")]
+
+    assert history() == [f"t{i}" for i in range(30)]
+
+    truncated = tmp_path / "truncated.jsonl.gz"
+    truncated.write_bytes(path.read_bytes()[:len(path.read_bytes()) // 2])
+    assert "error" in bmad_agent_mcp.import_workflow_state(str(truncated), compact=True)
+    assert history() == [f"t{i}" for i in range(30)]
+    assert [p.name for p in (tmp_path / "spill").iterdir()] == ["run-1"]
+
+    partial = tmp_path / "partial.jsonl"
+    write_state(partial, {**BODY, "rollup": {"task_executions": {"count": 20}}}, _records(12), "jsonl")
+    assert bmad_agent_mcp.import_workflow_state(str(partial), compact=True)["success"]
+    assert history() == [f"t{i}" for i in range(20)] + [f"t{i}" for i in range(12)]
+    assert bmad_agent_mcp.bmad_core.workflow_state["rollup"]["task_executions"]["count"] == 22
+    bmad_agent_mcp.reset_workflow()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+工作流程状态增量测试
+
+测试 JSON Patch 应用、增量回放和完整状态回退
+"""
+
+import copy
+
+from state_delta import StateJournal, apply_patch
+
+
+def _new_state():
+    return {"current_step": 0, "completed_steps": [], "created_artifacts": [], "status": "active"}
+
+
+def test_apply_patch_add_replace_remove():
+    """测试基本的 JSON Patch 操作"""
+    doc = {"items": [1], "a/b": 1}
+    apply_patch(doc, [
+        {"op": "add", "path": "/items/-", "value": 2},
+        {"op": "add", "path": "/items/0", "value": 0},
+        {"op": "replace", "path": "/a~1b", "value": 5},
+        {"op": "add", "path": "/status", "value": "done"},
+        {"op": "remove", "path": "/status"},
+    ])
+    assert doc == {"items": [0, 1, 2], "a/b": 5}
+
+
+def test_delta_replays_to_same_state():
+    """测试客户端应用增量后与服务端状态一致"""
+    journal = StateJournal()
+    state = _new_state()
+    base = journal.reset()
+    client = copy.deepcopy(state)
+
+    for step in range(3):
+        journal.record(state, [
+            {"op": "add", "path": "/completed_steps/-", "value": {"step_index": step}},
+            {"op": "replace", "path": "/current_step", "value": step + 1},
+        ])
+
+    delta = journal.delta(state, base)
+    assert not delta["full"]
+    assert delta["to_revision"] == base + 3
+    assert apply_patch(client, delta["ops"]) == state
+
+    # 增量大小只取决于新变化，与历史长度无关
+    assert len(journal.delta(state, base + 2)["ops"]) == 2
+    assert journal.delta(state, journal.revision)["ops"] == []
+
+
+def test_delta_falls_back_to_full_state():
+    """测试状态被替换或日志截断后返回完整状态"""
+    journal = StateJournal(max_entries=2)
+    state = _new_state()
+    old = journal.reset()
+    for step in range(4):
+        journal.record(state, [{"op": "replace", "path": "/current_step", "value": step + 1}])
+
+    truncated = journal.delta(state, old)
+    assert truncated["full"] and truncated["state"] == state
+
+    journal.reset()
+    assert journal.delta(state, old + 4)["full"]
+    assert journal.delta(state, journal.revision + 10)["full"]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+工作流程状态保留策略测试
+
+测试环形缓冲区上限、按批溢出到磁盘的完整历史、汇总、溢出文件的清理，以及超长上下文的摘要
+"""
+
+import copy
+
+import bmad_agent_mcp
+from state_delta import StateJournal, apply_patch
+from state_retention import StateRetention, compact_context
+
+
+def test_ring_buffer_spills_and_rolls_up(tmp_path):
+    """测试超出上限的条目写入磁盘并累加到汇总，增量回放保持一致"""
+    retention = StateRetention(tmp_path, {"task_executions": 3}, spill_batch=1)
+    journal = StateJournal()
+    state = {"status": "active"}
+    base = journal.reset()
+    client = copy.deepcopy(state)
+
+    for i in range(10):
+        entry = {"task_name": f"task-{i % 2}", "agent": "dev", "executed_at": f"t{i}"}
+        journal.record(state, retention.append_ops(state, "task_executions", entry, "run-1"))
+
+    assert [entry["executed_at"] for entry in state["task_executions"]] == ["t7", "t8", "t9"]
+    rollup = state["rollup"]["task_executions"]
+    assert rollup["count"] == 7
+    assert rollup["by_task"] == {"task-0": 4, "task-1": 3}
+    assert (rollup["first_at"], rollup["last_at"]) == ("t0", "t6")
+
+    history = list(retention.history(state, "task_executions", "run-1"))
+    assert [entry["executed_at"] for entry in history] == [f"t{i}" for i in range(10)]
+
+    assert apply_patch(client, journal.delta(state, base)["ops"]) == state
+
+
+def test_spills_in_batches(tmp_path):
+    """测试超出上限的条目累积到一批后才写入磁盘"""
+    retention = StateRetention(tmp_path, {"task_executions": 3}, spill_batch=4)
+    state = {}
+    journal = StateJournal()
+    spill_file = tmp_path / "run-1" / "task_executions.jsonl"
+    sizes = []
+
+    for i in range(15):
+        entry = {"task_name": "task", "agent": "dev", "executed_at": f"t{i}"}
+        journal.record(state, retention.append_ops(state, "task_executions", entry, "run-1"))
+        sizes.append(len(state["task_executions"]))
+
+    assert sizes == [1, 2, 3, 4, 5, 6, 3, 4, 5, 6, 3, 4, 5, 6, 3]
+    assert len(spill_file.read_text(encoding="utf-8").splitlines()) == 12
+    assert state["rollup"]["task_executions"]["count"] == 12
+    history = list(retention.history(state, "task_executions", "run-1"))
+    assert [entry["executed_at"] for entry in history] == [f"t{i}" for i in range(15)]
+
+
+def test_reset_and_new_run_delete_spill(tmp_path, monkeypatch):
+    """测试重置工作流程或启动新的运行后删除旧运行的溢出文件"""
+    retention = StateRetention(tmp_path, {"task_executions": 3}, spill_batch=1)
+    monkeypatch.setattr(bmad_agent_mcp, "state_retention", retention)
+    workflow_id = next(iter(bmad_agent_mcp.bmad_core.workflows))
+
+    def spill_current_run():
+        run_id = bmad_agent_mcp._current_run_id()
+        retention.evict({}, "task_executions", [{"executed_at": "t0"}], run_id)
+        assert retention._run_dir(run_id).exists()
+        return retention._run_dir(run_id)
+
+    assert bmad_agent_mcp.start_workflow(workflow_id)["success"]
+    first_run = spill_current_run()
+    assert bmad_agent_mcp.start_workflow(workflow_id)["success"]
+    assert not first_run.exists()
+
+    second_run = spill_current_run()
+    assert bmad_agent_mcp.reset_workflow()["success"]
+    assert not second_run.exists()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_compact_context_keeps_small_values():
+    """测试超长上下文只保留短值和摘要"""
+    context = {"story": "1.2", "attempt": 3, "document": "x" * 5000, "files": list(range(1000))}
+    compacted = compact_context(context, max_chars=500)
+
+    assert compacted["story"] == "1.2" and compacted["attempt"] == 3
+    assert compacted["document"]["truncated"] and compacted["document"]["chars"] == 5000
+    assert len(compacted["document"]["preview"]) == 200
+    assert "preview" not in compacted["files"]
+    assert compact_context({"a": 1}, max_chars=500) == {"a": 1}
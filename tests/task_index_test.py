@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+任务索引测试
+
+测试任务 markdown 解析、智能体到任务的反向索引和正文的按需加载
+"""
+
+import pytest
+
+import bmad_agent_mcp
+from utils import parse_task_markdown
+
+TASK_MARKDOWN = """# Create Document from Template
+
+## Purpose
+
+Generate **structured** documents from templates.
+
+## Inputs
+
+- Template name
+- Project brief
+
+## Process
+
+1. Load {root}/templates/prd-tmpl.yaml
+2. Run tasks/advanced-elicitation.md for each section
+
+## Outputs
+
+- Completed document
+"""
+
+AGENT_MARKDOWN = """# pm
+
+```yaml
+agent:
+  id: pm
+  name: John
+  title: Product Manager
+persona:
+  role: PM
+dependencies:
+  tasks:
+    - create-doc.md
+    - missing-task.md
+```
+"""
+
+
+def test_parse_task_markdown_extracts_metadata():
+    """测试从标题、Purpose、Inputs/Outputs 和正文引用中提取元数据"""
+    meta = parse_task_markdown(TASK_MARKDOWN)
+    assert meta["title"] == "Create Document from Template"
+    assert meta["description"] == "Generate structured documents from templates."
+    assert meta["inputs"] == ["Template name", "Project brief"]
+    assert meta["outputs"] == ["Completed document"]
+    assert meta["dependencies"] == ["templates/prd-tmpl", "tasks/advanced-elicitation"]
+
+
+def test_front_matter_overrides_inferred_fields():
+    """测试 YAML front matter 声明的字段优先"""
+    meta = parse_task_markdown("---\nagent: qa\noutputs: [report.md]\n---\n# Review\n\nReview code.\n")
+    assert meta["agents"] == ["qa"]
+    assert meta["outputs"] == ["report.md"]
+    assert meta["description"] == "Review code."
+
+
+def test_reverse_index_and_lazy_body(tmp_path, monkeypatch):
+    """测试智能体到任务的反向索引，以及正文只在需要时读取"""
+    (tmp_path / "agents").mkdir()
+    (tmp_path / "tasks").mkdir()
+    (tmp_path / "agents" / "pm.md").write_text(AGENT_MARKDOWN, encoding="utf-8")
+    task_file = tmp_path / "tasks" / "create-doc.md"
+    task_file.write_text(TASK_MARKDOWN, encoding="utf-8")
+    (tmp_path / "tasks" / "review.md").write_text("---\nagent: pm\n---\n# Review\n", encoding="utf-8")
+
+    monkeypatch.setattr(bmad_agent_mcp, "BMAD_CORE_PATH", tmp_path)
+    core = bmad_agent_mcp.BMADCore()
+
+    assert core.agent_tasks["pm"] == ["create-doc", "review"]
+    assert core.tasks["create-doc"].agent == "pm"
+    assert core._task_bodies == {}
+
+    assert core.load_task_body("create-doc") == TASK_MARKDOWN
+    task_file.write_text(TASK_MARKDOWN + "\nUpdated.\n", encoding="utf-8")
+    assert core.load_task_body("create-doc").endswith("Updated.\n")
+
+
+def test_wildcard_agent_lists_all_tasks(tmp_path, monkeypatch):
+    """测试 dependencies.tasks 为 ALL 的智能体列出全部任务，且不改变任务的负责智能体"""
+    (tmp_path / "agents").mkdir()
+    (tmp_path / "tasks").mkdir()
+    (tmp_path / "agents" / "pm.md").write_text(AGENT_MARKDOWN, encoding="utf-8")
+    master = AGENT_MARKDOWN.replace("id: pm", "id: bmad-master").split("  tasks:")[0] + "  tasks: ALL\n```\n"
+    (tmp_path / "agents" / "bmad-master.md").write_text(master, encoding="utf-8")
+    (tmp_path / "tasks" / "create-doc.md").write_text(TASK_MARKDOWN, encoding="utf-8")
+    (tmp_path / "tasks" / "shard-doc.md").write_text("# Shard Document\n", encoding="utf-8")
+
+    monkeypatch.setattr(bmad_agent_mcp, "BMAD_CORE_PATH", tmp_path)
+    core = bmad_agent_mcp.BMADCore()
+
+    assert sorted(core.agent_tasks["bmad-master"]) == ["create-doc", "shard-doc"]
+    assert core.tasks["create-doc"].agents == ["pm"]
+    assert core.tasks["shard-doc"].agent is None
+
+
+def test_reload_swaps_catalog_only_on_success(tmp_path, monkeypatch):
+    """测试重新加载时旧目录保持完整，加载失败时不被修改"""
+    (tmp_path / "agents").mkdir()
+    (tmp_path / "tasks").mkdir()
+    (tmp_path / "agents" / "pm.md").write_text(AGENT_MARKDOWN, encoding="utf-8")
+    (tmp_path / "tasks" / "create-doc.md").write_text(TASK_MARKDOWN, encoding="utf-8")
+    monkeypatch.setattr(bmad_agent_mcp, "BMAD_CORE_PATH", tmp_path)
+    core = bmad_agent_mcp.BMADCore()
+    catalog = core.catalog
+    agents, tasks, version = core.agents, core.tasks, core.catalog_version
+
+    (tmp_path / "tasks" / "review.md").write_text("---\nagent: pm\n---\n# Review\n", encoding="utf-8")
+
+    def broken(self):
+        raise OSError("disk error")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(bmad_agent_mcp.BMADCore, "discover_teams", broken)
+        with pytest.raises(OSError):
+            core.reload()
+    assert core.catalog is catalog
+    assert core.tasks is tasks and list(tasks) == ["create-doc"]
+    assert core.catalog_version == version
+
+    result = core.reload()
+    assert result["changed_entries"] == ["task:review"]
+    # 新目录整体替换，旧的 Catalog 保持原样
+    assert core.catalog is not catalog and catalog.catalog_version == version
+    assert core.agents is not agents and list(agents) == ["pm"]
+    assert sorted(core.tasks) == ["create-doc", "review"] and list(tasks) == ["create-doc"]
+    assert core.agent_tasks["pm"] == ["create-doc", "review"]
+    assert core.search_index.documents.keys() >= {"task:review"}
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+链路追踪测试
+
+测试嵌套 span、采样控制、JSONL 导出，以及 fork 后子进程的导出
+"""
+
+import json
+import os
+
+import pytest
+
+from tracing import JSONLExporter, Tracer
+
+
+class MemoryExporter:
+    """收集 span 的内存导出器"""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def flush(self, timeout: float = 5.0):
+        pass
+
+
+def test_nested_spans_share_trace():
+    """测试子 span 继承 trace_id 并指向父 span"""
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+
+    with tracer.span("tool.call_agent_with_llm", agent_id="pm") as root:
+        with tracer.span("prompt.build") as child:
+            child.set_attribute("prompt.chars", 42)
+        with tracer.span("llm.call"):
+            pass
+
+    names = [span.name for span in exporter.spans]
+    assert names == ["prompt.build", "llm.call", "tool.call_agent_with_llm"]
+    assert all(span.trace_id == root.trace_id for span in exporter.spans)
+    assert exporter.spans[0].parent_id == root.span_id
+    assert exporter.spans[0].attributes["prompt.chars"] == 42
+
+
+def test_sampling_skips_whole_trace():
+    """测试未采样的根 span 不导出任何子 span"""
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter, sample_rate=0.0)
+
+    with tracer.span("tool.list_agents") as root:
+        with tracer.span("prompt.build") as child:
+            child.set_attribute("ignored", True)
+
+    assert not root.sampled
+    assert exporter.spans == []
+
+
+def test_traced_decorator_marks_errors():
+    """测试工具装饰器记录参数和错误结果"""
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+
+    @tracer.traced
+    def get_agent_details(agent_id: str):
+        return {"error": f"Agent '{agent_id}' not found"}
+
+    get_agent_details("ghost")
+
+    root = exporter.spans[-1]
+    assert root.name == "tool.get_agent_details"
+    assert root.attributes["agent_id"] == "ghost"
+    assert root.status == "error"
+    assert exporter.spans[0].name == "response.serialize"
+
+
+def test_jsonl_exporter_writes_lines(tmp_path):
+    """测试 JSONL 导出器批量写入文件"""
+    trace_file = tmp_path / "traces.jsonl"
+    tracer = Tracer(JSONLExporter(trace_file, flush_interval=0.05))
+
+    with tracer.span("tool.get_system_status"):
+        pass
+    tracer.flush()
+
+    records = [json.loads(line) for line in trace_file.read_text(encoding="utf-8").splitlines()]
+    assert records[0]["name"] == "tool.get_system_status"
+    assert records[0]["duration_ms"] >= 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_exporter_restarts_in_forked_child(tmp_path):
+    """测试父进程已启动导出线程后 fork，子进程的 span 仍然被导出"""
+    trace_file = tmp_path / "traces.jsonl"
+    tracer = Tracer(JSONLExporter(trace_file, flush_interval=0.05))
+    with tracer.span("tool.parent"):
+        pass
+    tracer.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            with tracer.span("tool.child"):
+                pass
+            tracer.flush(timeout=5.0)
+            names = [json.loads(line)["name"] for line in trace_file.read_text(encoding="utf-8").splitlines()]
+            code = 0 if names == ["tool.parent", "tool.child"] else 1
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+工作流程剩余时间估算测试
+
+测试耗时估算的回退顺序、中位数对异常值的鲁棒性、依赖图上的关键路径、
+智能体工作量下限，以及日志重写后的重新加载
+"""
+
+import workflow_eta
+from workflow_eta import DurationHistory, plan_remaining, step_dependencies
+
+
+def test_estimate_falls_back_step_agent_default(tmp_path):
+    """测试样本不足时依次退回到智能体、全局和默认值"""
+    history = DurationHistory(tmp_path / "durations.jsonl")
+    assert history.step_estimate("wf", 0, "pm")["source"] == "default"
+
+    for seconds in (100, 110, 120):
+        history.record("other", 5, "pm", seconds)
+    estimate = history.step_estimate("wf", 0, "pm")
+    assert (estimate["source"], estimate["seconds"]) == ("agent", 110)
+    assert history.step_estimate("wf", 0, "dev")["source"] == "global"
+
+    for seconds in (10, 20, 30):
+        history.record("wf", 0, "pm", seconds)
+    estimate = history.step_estimate("wf", 0, "pm")
+    assert (estimate["source"], estimate["seconds"], estimate["samples"]) == ("step", 20, 3)
+
+
+def test_median_ignores_outliers(tmp_path):
+    """测试一次异常长的耗时不影响中位数，但体现在 P80 中"""
+    history = DurationHistory(tmp_path / "durations.jsonl")
+    for seconds in (60, 60, 60, 60, 86400):
+        history.record("wf", 0, "dev", seconds)
+    estimate = history.step_estimate("wf", 0, "dev")
+    assert estimate["seconds"] == 60
+    assert estimate["p80_seconds"] > 60
+
+
+def test_critical_path_follows_requires(tmp_path):
+    """测试并行分支只计入较长的一条，同一智能体的工作量作为下限"""
+    sequence = [
+        {"agent": "analyst", "creates": "brief.md"},
+        {"agent": "pm", "creates": "prd.md", "requires": "brief.md"},
+        {"agent": "ux-expert", "creates": "front-end-spec.md", "requires": "brief.md"},
+        {"agent": "architect", "creates": "architecture.md", "requires": ["prd.md", "front-end-spec.md"]},
+    ]
+    assert step_dependencies(sequence) == {0: [], 1: [0], 2: [0], 3: [1, 2]}
+
+    history = DurationHistory(tmp_path / "durations.jsonl")
+    for index, seconds in enumerate((100, 300, 200, 50)):
+        for _ in range(3):
+            history.record("wf", index, sequence[index]["agent"], seconds)
+
+    plan = plan_remaining("wf", sequence, 0, history)
+    assert plan["critical_path_seconds"] == 450
+    assert plan["sequential_seconds"] == 650
+    assert [item["step_index"] for item in plan["critical_path"]] == [0, 1, 3]
+    assert plan["bottlenecks"][0]["label"] == "prd.md"
+
+    # 当前步骤已进行的时间从它的估算中扣除
+    assert plan_remaining("wf", sequence, 1, history, elapsed_in_current=100)["eta_seconds"] == 250
+
+    # 同一个智能体负责两个并行分支时不能并行
+    sequence[2]["agent"] = "pm"
+    for _ in range(3):
+        history.record("wf", 2, "pm", 200)
+    plan = plan_remaining("wf", sequence, 1, history)
+    assert plan["critical_path_seconds"] == 350
+    assert (plan["eta_seconds"], plan["busiest_agent"]) == (500, "pm")
+
+
+def test_log_reload_after_compaction(tmp_path, monkeypatch):
+    """测试日志重写后只保留最近的样本，重新加载得到相同的估算"""
+    monkeypatch.setattr(workflow_eta, "_COMPACT_FACTOR", 1)
+    log_file = tmp_path / "durations.jsonl"
+    history = DurationHistory(log_file, max_samples=5)
+    for seconds in range(1, 21):
+        history.record("wf", 0, "dev", float(seconds))
+
+    assert sum(1 for _ in open(log_file, encoding="utf-8")) <= 10
+    reloaded = DurationHistory(log_file, max_samples=5)
+    assert reloaded.step_estimate("wf", 0, "dev") == history.step_estimate("wf", 0, "dev")
+    assert reloaded.step_estimate("other", 0, "dev")["source"] == "agent"
+    assert reloaded.step_estimate("wf", 0, "dev")["seconds"] == 18
+
+
+def test_shared_log_between_processes(tmp_path, monkeypatch):
+    """测试两个实例共用日志时互相看到样本，重写日志不丢失另一个实例追加的行"""
+    monkeypatch.setattr(workflow_eta, "_COMPACT_FACTOR", 1)
+    log_file = tmp_path / "durations.jsonl"
+    first = DurationHistory(log_file, max_samples=5)
+    second = DurationHistory(log_file, max_samples=5)
+
+    for seconds in (40, 50, 60):
+        second.record("wf", 1, "qa", seconds)
+    assert first.step_estimate("wf", 1, "qa")["seconds"] == 50
+
+    # first 重写日志时包含 second 的样本
+    for seconds in range(1, 21):
+        first.record("wf", 0, "dev", float(seconds))
+    assert sum(1 for _ in open(log_file, encoding="utf-8")) <= 10
+    assert DurationHistory(log_file, max_samples=5).step_estimate("wf", 1, "qa")["samples"] == 3
+
+    # second 发现日志被重写后重新加载
+    second.record("wf", 1, "qa", 70)
+    assert second.step_estimate("wf", 0, "dev")["seconds"] == 18
+    assert second.step_estimate("wf", 1, "qa")["samples"] == 4
+    assert first.step_estimate("wf", 1, "qa") == second.step_estimate("wf", 1, "qa")
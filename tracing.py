@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 链路追踪
+
+提供轻量的嵌套 span 追踪：工具调用 → 提示构建 → LLM 请求 → 状态更新。
+采样在根 span 上决定，子 span 继承采样结果；未采样时只有一次上下文变量读取的开销。
+导出方式：
+- jsonl: 每个 span 一行写入本地文件
+- otlp:  以 OTLP/HTTP JSON 格式批量发送到收集器
+- none:  关闭追踪（默认）
+"""
+
+import abc
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from metrics import payload_size
+from utils import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# 追踪配置
+TRACE_EXPORTER = os.getenv("BMAD_TRACE_EXPORTER", "none").lower()
+TRACE_SAMPLE_RATE = float(os.getenv("BMAD_TRACE_SAMPLE_RATE", "1.0"))
+TRACE_FILE = Path(os.getenv("BMAD_TRACE_FILE", str(DATA_DIR / "traces.jsonl")))
+TRACE_OTLP_ENDPOINT = os.getenv("BMAD_TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+
+# 工具参数中记录为 span 属性的字段
+TRACED_ARGUMENTS = ("agent_id", "workflow_id", "task_name", "template_name", "team_id", "mode")
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("bmad_current_span", default=None)
+
+
+class Span:
+    """一个已采样的 span"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id",
+                 "start_ns", "end_ns", "attributes", "status", "_token")
+
+    sampled = True
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str],
+                 attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = "ok"
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        """设置 span 属性"""
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        """批量设置 span 属性"""
+        self.attributes.update(attributes)
+
+    def set_error(self, message: str):
+        """标记 span 失败"""
+        self.status = "error"
+        self.attributes["error"] = message
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        _current_span.reset(self._token)
+        self.tracer.exporter.export(self)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为 JSONL 导出记录"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _NonRecordingSpan:
+    """未采样的 span：保留上下文以便子 span 同样跳过记录"""
+
+    __slots__ = ("_token",)
+
+    sampled = False
+
+    def __init__(self):
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def __enter__(self) -> "_NonRecordingSpan":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        return False
+
+
+class _NullSpan(_NonRecordingSpan):
+    """追踪关闭时使用的空 span，不触碰上下文变量"""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullExporter:
+    """丢弃所有 span"""
+
+    def export(self, span: Span):
+        pass
+
+    def flush(self, timeout: float = 5.0):
+        pass
+
+
+# 存活的导出器，fork 后在子进程中重置
+_exporters: "weakref.WeakSet[BatchExporter]" = weakref.WeakSet()
+
+
+class BatchExporter(abc.ABC):
+    """后台线程批量导出 span，避免请求路径上的 I/O
+
+    导出线程在第一次导出时才启动；fork 出的子进程（多 worker 模式）没有父进程的线程，
+    fork 后重建队列和锁，由子进程自己的第一次导出重新启动线程。
+    """
+
+    def __init__(self, max_batch: int = 256, flush_interval: float = 2.0, max_queue: int = 10000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._reset()
+        _exporters.add(self)
+
+    def _reset(self):
+        """建立新的队列、锁和条件变量（不启动线程）"""
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=self.max_queue)
+        self._flushed = threading.Condition()
+        self._pending = 0
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name=f"{type(self).__name__}", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def export(self, span: Span):
+        """提交一个已结束的 span（队列满时直接丢弃）"""
+        self._ensure_started()
+        try:
+            with self._flushed:
+                self._pending += 1
+            self._queue.put_nowait(span)
+        except queue.Full:
+            with self._flushed:
+                self._pending -= 1
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中的 span 全部导出"""
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while self._pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._flushed.wait(remaining)
+
+    def _run(self):
+        while True:
+            batch: List[Span] = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if not batch:
+                continue
+
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                logger.warning(f"导出追踪数据失败: {e}")
+            finally:
+                with self._flushed:
+                    self._pending -= len(batch)
+                    self._flushed.notify_all()
+
+    @abc.abstractmethod
+    def write_batch(self, batch: List[Span]):
+        """写出一批 span（在后台线程中调用）"""
+
+
+def _reset_exporters_after_fork():
+    # 父进程队列中尚未导出的 span 由父进程负责，子进程丢弃
+    for exporter in list(_exporters):
+        exporter._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_exporters_after_fork)
+
+
+class JSONLExporter(BatchExporter):
+    """追加写入本地 JSONL 文件"""
+
+    def __init__(self, file_path: Path, **kwargs):
+        self.file_path = file_path
+        super().__init__(**kwargs)
+
+    def write_batch(self, batch: List[Span]):
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            for span in batch:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+                f.write("\n")
+
+
+class OTLPExporter(BatchExporter):
+    """以 OTLP/HTTP JSON 格式发送到收集器"""
+
+    def __init__(self, endpoint: str, service_name: str = "bmad-agent-fastmcp", timeout: float = 5.0, **kwargs):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def write_batch(self, batch: List[Span]):
+        import urllib.request
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "bmad-agent"},
+                    "spans": [self._encode_span(span) for span in batch]
+                }]
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    @staticmethod
+    def _encode_span(span: Span) -> Dict[str, Any]:
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": 2 if span.status == "error" else 1}
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """编码 OTLP 属性值"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """span 工厂，负责采样决策"""
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0):
+        self.exporter = exporter or NullExporter()
+        self.sample_rate = sample_rate
+        self.enabled = not isinstance(self.exporter, NullExporter)
+
+    def span(self, name: str, **attributes):
+        """创建子 span；没有父 span 时作为根 span 并进行采样"""
+        if not self.enabled:
+            return _NULL_SPAN
+
+        parent = _current_span.get()
+        if parent is None:
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return _NonRecordingSpan()
+            return Span(self, name, f"{random.getrandbits(128):032x}", None, attributes)
+
+        if not parent.sampled:
+            return _NonRecordingSpan()
+
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    def traced(self, func=None, *, name: Optional[str] = None):
+        """装饰器：为工具函数创建根 span，记录关键参数并测量响应序列化"""
+        def decorator(fn):
+            if not self.enabled:
+                return fn
+
+            span_name = name or f"tool.{fn.__name__}"
+            signature = inspect.signature(fn)
+
+            def _attributes(args, kwargs) -> Dict[str, Any]:
+                attributes = {"tool": fn.__name__}
+                try:
+                    bound = signature.bind_partial(*args, **kwargs)
+                except TypeError:
+                    return attributes
+                for key in TRACED_ARGUMENTS:
+                    value = bound.arguments.get(key)
+                    if isinstance(value, str):
+                        attributes[key] = value[:128]
+                return attributes
+
+            def _finish(span, result):
+                if not span.sampled:
+                    return
+                if isinstance(result, dict) and ("error" in result or result.get("success") is False):
+                    span.set_error(str(result.get("error", "tool returned success=False")))
+                # 序列化结果由外层的指标包装复用
+                with self.span("response.serialize") as serialize_span:
+                    serialize_span.set_attribute("response.bytes", payload_size(result))
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name, **_attributes(args, kwargs)) as span:
+                        result = await fn(*args, **kwargs)
+                        _finish(span, result)
+                        return result
+
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, **_attributes(args, kwargs)) as span:
+                    result = fn(*args, **kwargs)
+                    _finish(span, result)
+                    return result
+
+            return wrapper
+
+        if func is not None:
+            return decorator(func)
+        return decorator
+
+    def flush(self, timeout: float = 5.0):
+        """等待已结束的 span 导出完成"""
+        self.exporter.flush(timeout)
+
+
+def create_exporter(kind: str = TRACE_EXPORTER):
+    """根据配置创建导出器"""
+    if kind == "jsonl":
+        return JSONLExporter(TRACE_FILE)
+    if kind == "otlp":
+        return OTLPExporter(TRACE_OTLP_ENDPOINT)
+    if kind not in ("none", ""):
+        logger.warning(f"未知的追踪导出器 '{kind}'，追踪已关闭")
+    return NullExporter()
+
+
+def current_span():
+    """获取当前 span（未追踪时返回空 span）"""
+    return _current_span.get() or _NULL_SPAN
+
+
+# 全局追踪器
+tracer = Tracer(create_exporter(), TRACE_SAMPLE_RATE)
@@ -5,40 +5,199 @@ BMAD Agent FastMCP Service 工具函数
 提供各种辅助功能和工具
 """
 
+import base64
+import hashlib
 import json
+import os
+import re
+import threading
+import time
 import yaml
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 from datetime import datetime
 
+from state_codec import read_state, split_state, write_state
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 运行时数据目录（追踪、性能分析等输出文件）
+DATA_DIR = Path(os.getenv("BMAD_DATA_DIR", str(Path(__file__).resolve().parent / ".bmad-data")))
+
+# 优先使用 libyaml 的 C 实现，解析速度比纯 Python 实现快一个数量级
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+def load_yaml(stream) -> Any:
+    """安全地解析 YAML（等价于 yaml.safe_load）"""
+    return yaml.load(stream, Loader=_YAML_LOADER)
+
+# 智能体 markdown 文件中的 YAML 配置块
+_AGENT_YAML_PATTERN = re.compile(r'```yaml\n(.*?)\n```', re.DOTALL)
+
+def parse_agent_markdown(content: str) -> Optional[Dict[str, Any]]:
+    """提取并解析智能体文件中的 YAML 配置块，没有配置块时返回 None"""
+    yaml_match = _AGENT_YAML_PATTERN.search(content)
+    if not yaml_match:
+        return None
+    return load_yaml(yaml_match.group(1))
+
+# 任务文件中表示输入/输出的小节标题
+_TASK_INPUT_HEADINGS = ("input", "prerequisite", "required", "输入", "前置")
+_TASK_OUTPUT_HEADINGS = ("output", "deliverable", "result", "输出", "产出")
+# 任务正文中对其他资源的引用，例如 {root}/templates/prd-tmpl.yaml 或 tasks/create-doc.md
+_TASK_REFERENCE_PATTERN = re.compile(
+    r"\b(tasks|templates|checklists|data|utils|workflows)/([\w.-]+?)(?:\.(?:md|ya?ml))?(?=[\s`'\")\],;]|$)"
+)
+_MARKDOWN_DECORATION = re.compile(r"[*_`]+")
+
+def _as_str_list(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return [str(value)]
+
+def parse_task_markdown(content: str, max_description: int = 300) -> Dict[str, Any]:
+    """
+    解析任务 markdown，提取紧凑的元数据（不保留正文）
+
+    支持可选的 YAML front matter（agent / agents / inputs / outputs / dependencies / description），
+    未声明时从标题、Purpose 段落、Inputs/Outputs 小节的列表项和正文中的资源路径推断。
+    """
+    meta: Dict[str, Any] = {}
+    body = content
+    if content.startswith("---\n"):
+        end = content.find("\n---", 4)
+        if end != -1:
+            meta = load_yaml(content[4:end]) or {}
+            body = content[end + 4:]
+
+    title = ""
+    description = str(meta.get("description", "")).strip()
+    inputs: List[str] = []
+    outputs: List[str] = []
+    section = ""
+    paragraph: List[str] = []
+    in_code = False
+
+    for raw_line in body.splitlines():
+        line = raw_line.strip()
+        if line.startswith("```"):
+            in_code = not in_code
+            continue
+        if in_code:
+            continue
+
+        if line.startswith("#"):
+            heading = line.lstrip("#").strip()
+            if line.startswith("# ") and not title:
+                title = heading
+            else:
+                section = heading.lower()
+            paragraph = []
+            continue
+
+        if line[:2] in ("- ", "* ") or re.match(r"\d+\.\s", line):
+            item = _MARKDOWN_DECORATION.sub("", re.sub(r"^(?:[-*]|\d+\.)\s+", "", line)).strip()
+            if section and any(word in section for word in _TASK_INPUT_HEADINGS):
+                inputs.append(item)
+            elif section and any(word in section for word in _TASK_OUTPUT_HEADINGS):
+                outputs.append(item)
+            continue
+
+        # 描述取 Purpose 小节或标题后的第一个段落
+        if not description and line and (not section or "purpose" in section or "目的" in section):
+            paragraph.append(line)
+        elif paragraph and not line and not description:
+            description = " ".join(paragraph)
+
+    if not description and paragraph:
+        description = " ".join(paragraph)
+    description = _MARKDOWN_DECORATION.sub("", description)
+    if len(description) > max_description:
+        description = description[:max_description - 1] + "…"
+
+    references = []
+    for kind, name in _TASK_REFERENCE_PATTERN.findall(body):
+        reference = f"{kind}/{name}"
+        if reference not in references:
+            references.append(reference)
+
+    agents = _as_str_list(meta.get("agents", meta.get("agent")))
+    return {
+        "title": str(meta.get("title", title)),
+        "description": description,
+        "agents": agents,
+        "inputs": _as_str_list(meta.get("inputs")) or inputs,
+        "outputs": _as_str_list(meta.get("outputs")) or outputs,
+        "dependencies": _as_str_list(meta.get("dependencies")) or references
+    }
+
+def file_signature(file_path: Path) -> Tuple[int, int]:
+    """文件的 (修改时间, 大小)，用于快速判断文件是否变化"""
+    stat = file_path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+def text_hash(content: str) -> str:
+    """文件内容哈希"""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+@contextmanager
+def file_lock(lock_file: Path) -> Iterator[None]:
+    """
+    跨进程的排他文件锁（多进程 worker 模式下保护读-改-写的数据文件）
+
+    没有 fcntl 的平台（Windows）只有单进程模式，不加锁。
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_file, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
 class BMADUtils:
     """BMAD 工具类"""
     
     @staticmethod
     def validate_agent_file(file_path: Path) -> Dict[str, Any]:
         """验证智能体文件格式"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            config = parse_agent_markdown(content)
+        except Exception as e:
+            return BMADUtils.validate_agent_config(None, f"文件解析错误: {str(e)}")
+
+        return BMADUtils.validate_agent_config(config)
+
+    @staticmethod
+    def validate_agent_config(config: Optional[Dict[str, Any]], parse_error: Optional[str] = None) -> Dict[str, Any]:
+        """验证已解析的智能体 YAML 配置（None 表示文件中没有 YAML 配置块）"""
         result = {
             "valid": False,
             "errors": [],
             "warnings": [],
             "agent_info": None
         }
-        
+
+        if parse_error:
+            result["errors"].append(parse_error)
+            return result
+
+        if config is None:
+            result["errors"].append("未找到 YAML 配置块")
+            return result
+
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 检查是否包含 YAML 配置
-            import re
-            yaml_match = re.search(r'```yaml\n(.*?)\n```', content, re.DOTALL)
-            if not yaml_match:
-                result["errors"].append("未找到 YAML 配置块")
-                return result
-            
-            # 解析 YAML
-            yaml_content = yaml_match.group(1)
-            config = yaml.safe_load(yaml_content)
-            
             # 验证必需字段
             required_fields = {
                 "agent": ["id", "name", "title"],
@@ -66,17 +225,29 @@ class BMADUtils:
     @staticmethod
     def validate_workflow_file(file_path: Path) -> Dict[str, Any]:
         """验证工作流程文件格式"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                config = load_yaml(f)
+        except Exception as e:
+            return BMADUtils.validate_workflow_config(None, f"文件解析错误: {str(e)}")
+
+        return BMADUtils.validate_workflow_config(config)
+
+    @staticmethod
+    def validate_workflow_config(config: Any, parse_error: Optional[str] = None) -> Dict[str, Any]:
+        """验证已解析的工作流程 YAML 配置"""
         result = {
             "valid": False,
             "errors": [],
             "warnings": [],
             "workflow_info": None
         }
-        
+
+        if parse_error:
+            result["errors"].append(parse_error)
+            return result
+
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
-            
             # 验证必需字段
             if "workflow" not in config:
                 result["errors"].append("缺少 workflow 配置节")
@@ -108,11 +279,12 @@ class BMADUtils:
         return result
     
     @staticmethod
-    def export_workflow_state(workflow_state: Dict[str, Any], output_file: Path):
-        """导出工作流程状态到文件"""
+    def export_workflow_state(workflow_state: Dict[str, Any], output_file: Path, fmt: str = "json"):
+        """导出工作流程状态到文件（先写临时文件再改名）"""
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(workflow_state, f, indent=2, ensure_ascii=False)
+            body, lists = split_state(workflow_state)
+            records = ((key, entry) for key, entries in lists.items() for entry in entries)
+            write_state(output_file, body, records, fmt)
             return True
         except Exception as e:
             print(f"导出工作流程状态失败: {e}")
@@ -120,10 +292,15 @@ class BMADUtils:
     
     @staticmethod
     def import_workflow_state(input_file: Path) -> Optional[Dict[str, Any]]:
-        """从文件导入工作流程状态"""
+        """从文件导入工作流程状态（自动识别格式）"""
         try:
-            with open(input_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            state = None
+            for key, entry in read_state(input_file):
+                if key is None:
+                    state = dict(entry)
+                else:
+                    state.setdefault(key, []).append(entry)
+            return state
         except Exception as e:
             print(f"导入工作流程状态失败: {e}")
             return None
@@ -154,15 +331,30 @@ class BMADUtils:
         current_step = workflow_state.get('current_step', 0)
         completed_steps = workflow_state.get('completed_steps', [])
         
+        rollup = workflow_state.get('rollup') or {}
+        earlier_steps = (rollup.get('completed_steps') or {}).get('count', 0)
+        
         report.append("## 进度信息")
         report.append(f"- 当前步骤: {current_step}")
-        report.append(f"- 已完成步骤: {len(completed_steps)}")
+        report.append(f"- 已完成步骤: {len(completed_steps) + earlier_steps}")
         report.append("")
         
+        # 已移出内存的早期条目只有汇总
+        if rollup:
+            report.append("## 早期记录汇总")
+            if earlier_steps:
+                report.append(f"- 更早完成的步骤: {earlier_steps}")
+            executions = rollup.get('task_executions') or {}
+            if executions:
+                report.append(f"- 更早的任务执行: {executions.get('count', 0)}")
+                for task_name, count in sorted((executions.get('by_task') or {}).items()):
+                    report.append(f"  - {task_name}: {count}")
+            report.append("")
+        
         # 已完成步骤详情
         if completed_steps:
             report.append("## 已完成步骤")
-            for i, step in enumerate(completed_steps, 1):
+            for i, step in enumerate(completed_steps, earlier_steps + 1):
                 report.append(f"### 步骤 {i}")
                 report.append(f"- 完成时间: {step.get('completed_at', 'N/A')}")
                 
@@ -185,7 +377,8 @@ class BMADUtils:
         task_executions = workflow_state.get('task_executions', [])
         if task_executions:
             report.append("## 任务执行历史")
-            for i, execution in enumerate(task_executions, 1):
+            earlier_executions = (rollup.get('task_executions') or {}).get('count', 0)
+            for i, execution in enumerate(task_executions, earlier_executions + 1):
                 report.append(f"### 任务 {i}: {execution.get('task_name', 'N/A')}")
                 report.append(f"- 执行智能体: {execution.get('agent', 'N/A')}")
                 report.append(f"- 执行时间: {execution.get('executed_at', 'N/A')}")
@@ -202,6 +395,72 @@ class BMADUtils:
     @staticmethod
     def scan_bmad_core(bmad_path: Path) -> Dict[str, Any]:
         """扫描 .bmad-core 目录并生成报告"""
+        return CatalogScanner().scan(bmad_path)
+
+class CatalogScanner:
+    """
+    增量扫描 .bmad-core 目录
+
+    每个文件的验证结果按 (修改时间, 大小) 缓存，重复扫描只需 stat；
+    文件变化时优先复用 BMADCore 已解析的结果，否则重新读取、解析并验证。
+    YAML 解析受 GIL 限制，线程池没有带来加速，因此逐个文件顺序处理。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 文件路径 -> {"signature", "hash", "validation"}
+        self._results: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _validate(kind: str, config: Any, error: Optional[str]) -> Dict[str, Any]:
+        parse_error = f"文件解析错误: {error}" if error else None
+        if kind == "agents":
+            return BMADUtils.validate_agent_config(config, parse_error)
+        return BMADUtils.validate_workflow_config(config, parse_error)
+
+    def _validate_file(self, job: Tuple[str, Path, Optional[Tuple[int, int]]]):
+        """读取并验证单个文件"""
+        kind, file_path, signature = job
+        key = str(file_path)
+        started = time.perf_counter()
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError as e:
+            validation = self._validate(kind, None, str(e))
+            entry = {"signature": None, "hash": None, "validation": validation}
+            return key, entry, "validated", time.perf_counter() - started
+
+        digest = text_hash(content)
+        cached = self._results.get(key)
+        if cached and cached["hash"] == digest:
+            # 文件被触碰但内容未变
+            entry = {"signature": signature, "hash": digest, "validation": cached["validation"]}
+            return key, entry, "unchanged", time.perf_counter() - started
+
+        config, error = None, None
+        try:
+            config = parse_agent_markdown(content) if kind == "agents" else load_yaml(content)
+        except Exception as e:
+            error = str(e)
+
+        entry = {"signature": signature, "hash": digest, "validation": self._validate(kind, config, error)}
+        return key, entry, "validated", time.perf_counter() - started
+
+    def scan(self, bmad_path: Path, parsed_files: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """
+        扫描目录并验证智能体和工作流程文件
+
+        Args:
+            bmad_path: .bmad-core 目录
+            parsed_files: BMADCore 的解析结果（文件路径 -> {"signature", "hash", "config", "error"}）
+
+        Returns:
+            扫描结果，timing 中包含每个文件的耗时和结果来源
+            （cached / catalog / unchanged / validated）
+        """
+        scan_started = time.perf_counter()
         result = {
             "path": str(bmad_path),
             "exists": bmad_path.exists(),
@@ -211,60 +470,146 @@ class BMADUtils:
             "templates": {"count": 0, "files": []},
             "other_files": []
         }
-        
+
         if not bmad_path.exists():
             return result
-        
-        # 扫描智能体
-        agents_dir = bmad_path / "agents"
-        if agents_dir.exists():
-            agent_files = list(agents_dir.glob("*.md"))
-            result["agents"]["count"] = len(agent_files)
-            result["agents"]["files"] = [f.name for f in agent_files]
-            
-            for agent_file in agent_files:
-                validation = BMADUtils.validate_agent_file(agent_file)
-                if validation["valid"]:
-                    result["agents"]["valid"].append(agent_file.name)
-                else:
-                    result["agents"]["invalid"].append({
-                        "file": agent_file.name,
-                        "errors": validation["errors"]
-                    })
-        
-        # 扫描工作流程
-        workflows_dir = bmad_path / "workflows"
-        if workflows_dir.exists():
-            workflow_files = list(workflows_dir.glob("*.yaml"))
-            result["workflows"]["count"] = len(workflow_files)
-            result["workflows"]["files"] = [f.name for f in workflow_files]
-            
-            for workflow_file in workflow_files:
-                validation = BMADUtils.validate_workflow_file(workflow_file)
-                if validation["valid"]:
-                    result["workflows"]["valid"].append(workflow_file.name)
-                else:
-                    result["workflows"]["invalid"].append({
-                        "file": workflow_file.name,
-                        "errors": validation["errors"]
-                    })
-        
-        # 扫描任务
-        tasks_dir = bmad_path / "tasks"
-        if tasks_dir.exists():
-            task_files = list(tasks_dir.glob("*.md"))
-            result["tasks"]["count"] = len(task_files)
-            result["tasks"]["files"] = [f.name for f in task_files]
-        
-        # 扫描模板
-        templates_dir = bmad_path / "templates"
-        if templates_dir.exists():
-            template_files = list(templates_dir.glob("*.md"))
-            result["templates"]["count"] = len(template_files)
-            result["templates"]["files"] = [f.name for f in template_files]
-        
+
+        jobs = []
+        for kind, pattern in (("agents", "*.md"), ("workflows", "*.yaml")):
+            directory = bmad_path / kind
+            files = list(directory.glob(pattern)) if directory.exists() else []
+            result[kind]["count"] = len(files)
+            result[kind]["files"] = [f.name for f in files]
+            jobs.extend((kind, f) for f in files)
+
+        for kind in ("tasks", "templates"):
+            directory = bmad_path / kind
+            if directory.exists():
+                files = list(directory.glob("*.md"))
+                result[kind]["count"] = len(files)
+                result[kind]["files"] = [f.name for f in files]
+
+        parsed_files = parsed_files or {}
+        outcomes = {}
+        pending = []
+
+        with self._lock:
+            for kind, file_path in jobs:
+                key = str(file_path)
+                started = time.perf_counter()
+                try:
+                    signature = file_signature(file_path)
+                except OSError:
+                    signature = None
+
+                cached = self._results.get(key)
+                if cached and signature is not None and cached["signature"] == signature:
+                    outcomes[key] = (cached["validation"], "cached", time.perf_counter() - started)
+                    continue
+
+                record = parsed_files.get(key)
+                if record and signature is not None and record["signature"] == signature:
+                    validation = self._validate(kind, record["config"], record["error"])
+                    self._results[key] = {"signature": signature, "hash": record["hash"], "validation": validation}
+                    outcomes[key] = (validation, "catalog", time.perf_counter() - started)
+                    continue
+
+                pending.append((kind, file_path, signature))
+
+            for job in pending:
+                key, entry, source, elapsed = self._validate_file(job)
+                self._results[key] = entry
+                outcomes[key] = (entry["validation"], source, elapsed)
+
+            # 清理已删除文件的缓存
+            current = {str(file_path) for _, file_path in jobs}
+            for key in [key for key in self._results if key not in current]:
+                del self._results[key]
+
+        timing = []
+        sources: Dict[str, int] = {}
+        for kind, file_path in jobs:
+            validation, source, elapsed = outcomes[str(file_path)]
+            if validation["valid"]:
+                result[kind]["valid"].append(file_path.name)
+            else:
+                result[kind]["invalid"].append({
+                    "file": file_path.name,
+                    "errors": validation["errors"]
+                })
+            sources[source] = sources.get(source, 0) + 1
+            timing.append({
+                "file": f"{kind}/{file_path.name}",
+                "valid": validation["valid"],
+                "source": source,
+                "elapsed_ms": round(elapsed * 1000, 3)
+            })
+
+        result["timing"] = timing
+        result["scan_stats"] = {
+            "files": len(jobs),
+            "sources": sources,
+            "elapsed_ms": round((time.perf_counter() - scan_started) * 1000, 3)
+        }
         return result
 
+def content_version(value: Any) -> str:
+    """计算任意 JSON 兼容数据的内容版本哈希"""
+    encoded = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:16]
+
+def project_fields(record: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """按字段列表裁剪记录，fields 为空时返回原记录"""
+    if not fields:
+        return record
+    return {field: record[field] for field in fields if field in record}
+
+def invalid_fields(fields: Optional[List[str]], valid_fields: List[str]) -> List[str]:
+    """返回不在允许列表中的字段"""
+    return [field for field in (fields or []) if field not in valid_fields]
+
+def encode_cursor(version: str, offset: int) -> str:
+    """生成分页游标（绑定目录版本，目录变化后旧游标失效）"""
+    return base64.urlsafe_b64encode(f"{version}:{offset}".encode("ascii")).decode("ascii").rstrip("=")
+
+def paginate(
+    items: List[Any],
+    version: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    对列表进行游标分页
+
+    Returns:
+        {"items": 当前页, "next_cursor": 下一页游标或 None, "total": 总数}
+
+    Raises:
+        ValueError: 游标无效或目录版本已变化
+    """
+    offset = 0
+    if cursor:
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            cursor_version, raw_offset = base64.urlsafe_b64decode(padded).decode("ascii").rsplit(":", 1)
+            offset = int(raw_offset)
+            if offset < 0:
+                raise ValueError(raw_offset)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"无效的分页游标: {cursor}")
+        if cursor_version != version:
+            raise ValueError("目录已更新，分页游标已失效，请从第一页重新获取")
+
+    if limit is not None and limit <= 0:
+        raise ValueError("limit 必须大于 0")
+
+    end = len(items) if limit is None else min(offset + limit, len(items))
+    return {
+        "items": items[offset:end],
+        "next_cursor": encode_cursor(version, end) if end < len(items) else None,
+        "total": len(items)
+    }
+
 def format_scan_report(scan_result: Dict[str, Any]) -> str:
     """格式化扫描报告"""
     report = []
@@ -311,5 +656,11 @@ def format_scan_report(scan_result: Dict[str, Any]) -> str:
     # 任务和模板报告
     report.append(f"## 📋 任务 ({scan_result['tasks']['count']} 个)")
     report.append(f"## 📄 模板 ({scan_result['templates']['count']} 个)")
+
+    stats = scan_result.get('scan_stats')
+    if stats:
+        sources = ", ".join(f"{source} {count}" for source, count in sorted(stats['sources'].items()))
+        report.append("")
+        report.append(f"⏱️ 扫描耗时: {stats['elapsed_ms']} ms（{sources}）")
     
     return "\n".join(report)
\ No newline at end of file
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+BMAD Agent FastMCP Service 工作流程剩余时间估算
+
+- 每完成一个步骤记录一次耗时（相邻两次 completed_at 之差），追加到 JSONL 日志；
+  内存中每个 (工作流程, 步骤) 和每个智能体只保留最近的若干样本，估算时取中位数和 P80
+- 多 worker 模式下各进程共用同一个日志：估算和记录前在文件锁内读取其他进程追加的行，
+  日志被其他进程重写后重新加载
+- 步骤估算优先使用同一步骤的历史，样本不足时退回到同一智能体，再退回到全局默认值
+- 依赖图由步骤的 requires -> creates 关系构成（没有 requires 的步骤依赖上一步），
+  剩余步骤上的最长路径即关键路径；同一智能体的步骤不能并行，ETA 取关键路径和
+  智能体总工作量中的较大者
+"""
+
+import json
+import os
+import statistics
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Any, Deque, Optional, Tuple
+
+from catalog_integrity import normalize_name, step_producers, step_requires
+from utils import file_lock
+
+# 每个键保留的样本数
+MAX_SAMPLES = 200
+# 使用某个键的估算所需的最少样本数
+MIN_SAMPLES = 3
+# 没有任何历史时每个步骤的默认耗时（秒）
+DEFAULT_STEP_SECONDS = float(os.getenv("BMAD_DEFAULT_STEP_SECONDS", "1800"))
+# 日志行数超过保留样本数的这么多倍时重写日志
+_COMPACT_FACTOR = 4
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def step_label(step: Dict[str, Any]) -> str:
+    return str(step.get("step") or step.get("creates") or step.get("action") or step.get("agent") or "")
+
+
+class DurationHistory:
+    """步骤耗时的历史样本"""
+
+    def __init__(self, log_file: Path, max_samples: int = MAX_SAMPLES):
+        self.log_file = log_file
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._estimates: Dict[str, Optional[Tuple[float, float, int]]] = {}
+        # 步骤键 -> 最近一次记录的智能体（重写日志时保留）
+        self._step_agents: Dict[str, Optional[str]] = {}
+        # 已读取到的日志位置 (inode, 字节偏移)
+        self._position: Optional[Tuple[int, int]] = None
+        self._log_lines = 0
+        self._lock_file = log_file.with_name(log_file.name + ".lock")
+
+    @staticmethod
+    def _keys(workflow_id: str, step_index: int, agent: Optional[str]) -> List[str]:
+        keys = [f"step:{workflow_id}#{step_index}", "all"]
+        if agent:
+            keys.append(f"agent:{agent}")
+        return keys
+
+    def _add(self, keys: List[str], seconds: float, agent: Optional[str]):
+        self._step_agents[keys[0]] = agent
+        for key in keys:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.max_samples)
+            samples.append(seconds)
+            self._estimates.pop(key, None)
+
+    def _stale(self) -> bool:
+        """日志是否有尚未读取的内容（其他进程追加或重写）"""
+        try:
+            stat = self.log_file.stat()
+        except FileNotFoundError:
+            return self._position is not None
+        return self._position != (stat.st_ino, stat.st_size)
+
+    def _clear(self):
+        self._samples.clear()
+        self._estimates.clear()
+        self._step_agents.clear()
+        self._log_lines = 0
+        self._position = None
+
+    def _refresh(self):
+        """读取日志中新增的行，日志被重写（inode 变化或变短）时重新加载；调用方持有两把锁"""
+        try:
+            log = open(self.log_file, "rb")
+        except FileNotFoundError:
+            self._clear()
+            return
+        with log:
+            stat = os.fstat(log.fileno())
+            if self._position is None or self._position[0] != stat.st_ino or stat.st_size < self._position[1]:
+                self._clear()
+            offset = self._position[1] if self._position else 0
+            log.seek(offset)
+            data = log.read()
+        # 只处理完整的行
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+                agent = record.get("a")
+                self._add(self._keys(record["w"], record["i"], agent), float(record["s"]), agent)
+            except (ValueError, KeyError, TypeError):
+                continue
+            self._log_lines += 1
+        self._position = (stat.st_ino, offset + end)
+
+    def _sync(self):
+        if not self._stale():
+            return
+        with self._lock, file_lock(self._lock_file):
+            self._refresh()
+
+    def record(self, workflow_id: str, step_index: int, agent: Optional[str], seconds: float):
+        """记录一次步骤耗时"""
+        if seconds < 0:
+            return
+        record = {"w": workflow_id, "i": step_index, "a": agent, "s": round(seconds, 3)}
+        with self._lock, file_lock(self._lock_file):
+            self.log_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            # 同时读入本条和其他进程追加的样本
+            self._refresh()
+            retained = sum(len(samples) for key, samples in self._samples.items() if key.startswith("step:"))
+            if self._log_lines > _COMPACT_FACTOR * max(retained, self.max_samples):
+                self._compact()
+
+    def _compact(self):
+        """只保留内存中仍在使用的样本（已包含所有进程的记录），重写日志"""
+        temp_file = self.log_file.with_suffix(".tmp")
+        lines = 0
+        with open(temp_file, "w", encoding="utf-8") as f:
+            for key, samples in self._samples.items():
+                if not key.startswith("step:"):
+                    continue
+                workflow_id, step_index = key[5:].rsplit("#", 1)
+                agent = self._step_agents.get(key)
+                for seconds in samples:
+                    # 智能体和全局样本在加载时由步骤样本重建
+                    f.write(json.dumps({"w": workflow_id, "i": int(step_index), "a": agent, "s": seconds},
+                                       ensure_ascii=False) + "\n")
+                    lines += 1
+        os.replace(temp_file, self.log_file)
+        stat = self.log_file.stat()
+        self._position = (stat.st_ino, stat.st_size)
+        self._log_lines = lines
+
+    def estimate(self, key: str) -> Optional[Tuple[float, float, int]]:
+        """(中位数, P80, 样本数)，样本不足时返回 None"""
+        self._sync()
+        if key in self._estimates:
+            return self._estimates[key]
+        samples = list(self._samples.get(key) or ())
+        result = None
+        if len(samples) >= MIN_SAMPLES:
+            result = (statistics.median(samples), _percentile(samples, 0.8), len(samples))
+        self._estimates[key] = result
+        return result
+
+    def step_estimate(self, workflow_id: str, step_index: int, agent: Optional[str]) -> Dict[str, Any]:
+        """单个步骤的估算，依次尝试步骤、智能体和全局样本"""
+        for source, key in (("step", f"step:{workflow_id}#{step_index}"),
+                            ("agent", f"agent:{agent}" if agent else None),
+                            ("global", "all")):
+            if key is None:
+                continue
+            estimate = self.estimate(key)
+            if estimate:
+                median, p80, count = estimate
+                return {"seconds": median, "p80_seconds": p80, "samples": count, "source": source}
+        return {"seconds": DEFAULT_STEP_SECONDS, "p80_seconds": DEFAULT_STEP_SECONDS, "samples": 0, "source": "default"}
+
+
+def step_dependencies(sequence: List[Any]) -> Dict[int, List[int]]:
+    """步骤 -> 依赖的更早步骤（没有 requires 或 requires 都无法解析时依赖上一步）"""
+    producers = step_producers(sequence)
+    dependencies: Dict[int, List[int]] = {}
+    for index, step in enumerate(sequence):
+        deps = set()
+        if isinstance(step, dict):
+            for required in step_requires(step):
+                producer = producers.get(normalize_name(required))
+                # 只接受指向更早步骤的边，保证是有向无环图
+                if producer is not None and producer < index:
+                    deps.add(producer)
+        if not deps and index > 0:
+            deps.add(index - 1)
+        dependencies[index] = sorted(deps)
+    return dependencies
+
+
+def plan_remaining(
+    workflow_id: str,
+    sequence: List[Any],
+    current_step: int,
+    history: DurationHistory,
+    elapsed_in_current: float = 0.0
+) -> Dict[str, Any]:
+    """
+    估算剩余步骤的关键路径和 ETA
+
+    Args:
+        workflow_id: 工作流程ID
+        sequence: 工作流程步骤
+        current_step: 下一个要完成的步骤序号
+        history: 历史耗时
+        elapsed_in_current: 当前步骤已经进行的秒数
+
+    Returns:
+        ETA（中位数和 P80）、顺序执行的总耗时、关键路径和瓶颈步骤
+    """
+    dependencies = step_dependencies(sequence)
+    remaining = list(range(current_step, len(sequence)))
+
+    estimates: Dict[int, Dict[str, Any]] = {}
+    for index in remaining:
+        step = sequence[index] if isinstance(sequence[index], dict) else {}
+        agent = step.get("agent")
+        estimate = history.step_estimate(workflow_id, index, str(agent) if agent else None)
+        if index == current_step and elapsed_in_current > 0:
+            estimate = {
+                **estimate,
+                "seconds": max(0.0, estimate["seconds"] - elapsed_in_current),
+                "p80_seconds": max(0.0, estimate["p80_seconds"] - elapsed_in_current)
+            }
+        estimates[index] = {"step_index": index, "label": step_label(step), "agent": agent, **estimate}
+
+    def longest(field: str) -> Tuple[float, Dict[int, float], Dict[int, Optional[int]]]:
+        finish: Dict[int, float] = {}
+        via: Dict[int, Optional[int]] = {}
+        for index in remaining:
+            start, parent = 0.0, None
+            for dep in dependencies[index]:
+                if dep in finish and finish[dep] > start:
+                    start, parent = finish[dep], dep
+            finish[index] = start + estimates[index][field]
+            via[index] = parent
+        return (max(finish.values()) if finish else 0.0), finish, via
+
+    critical_seconds, finish, via = longest("seconds")
+    critical_p80, _, _ = longest("p80_seconds")
+
+    path: List[int] = []
+    if finish:
+        node: Optional[int] = max(finish, key=finish.get)
+        while node is not None:
+            path.append(node)
+            node = via[node]
+        path.reverse()
+
+    agent_load: Dict[str, float] = {}
+    agent_load_p80: Dict[str, float] = {}
+    for estimate in estimates.values():
+        agent = str(estimate["agent"] or "unassigned")
+        agent_load[agent] = agent_load.get(agent, 0.0) + estimate["seconds"]
+        agent_load_p80[agent] = agent_load_p80.get(agent, 0.0) + estimate["p80_seconds"]
+
+    eta = max([critical_seconds] + list(agent_load.values()))
+    eta_p80 = max([critical_p80] + list(agent_load_p80.values()))
+
+    on_path = [estimates[index] for index in path]
+    bottlenecks = sorted(on_path, key=lambda item: item["seconds"], reverse=True)[:3]
+    return {
+        "eta_seconds": round(eta, 1),
+        "eta_p80_seconds": round(eta_p80, 1),
+        "critical_path_seconds": round(critical_seconds, 1),
+        "sequential_seconds": round(sum(item["seconds"] for item in estimates.values()), 1),
+        "critical_path": [{"step_index": item["step_index"], "label": item["label"]} for item in on_path],
+        "bottlenecks": [
+            {
+                "step_index": item["step_index"],
+                "label": item["label"],
+                "agent": item["agent"],
+                "seconds": round(item["seconds"], 1),
+                "share": round(item["seconds"] / critical_seconds, 3) if critical_seconds else 0.0,
+                "source": item["source"]
+            }
+            for item in bottlenecks
+        ],
+        "busiest_agent": max(agent_load, key=agent_load.get) if agent_load else None,
+        "steps": [estimates[index] for index in remaining]
+    }